@@ -0,0 +1,170 @@
+"""
+Admission control for the LLM-backed endpoints: per-key token buckets (per
+client and per project) and a bounded concurrency limiter with a short wait
+queue. Requests that would exceed either are rejected at once with a
+Retry-After hint instead of piling up threads and LLM calls.
+"""
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+class AdmissionRejected(Exception):
+    """Raised when a request is not admitted; `retry_after` is in seconds."""
+    def __init__(self, reason: str, retry_after: float, detail: str):
+        super().__init__(detail)
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+        self.detail = detail
+
+class TokenBucket:
+    """Allows `burst` requests at once, refilled at `rate` requests per second."""
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def try_acquire(self, now: float = None):
+        """Takes a token and returns (True, 0), or (False, seconds until the next token)."""
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True, 0.0
+        return False, (1 - self.tokens) / self.rate if self.rate > 0 else 60.0
+
+class KeyedRateLimiter:
+    """One token bucket per key (client or project), keeping at most `max_keys` of the most recent."""
+    def __init__(self, rate_per_minute: float, burst: float, max_keys: int = 10000):
+        self.rate = rate_per_minute / 60
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, key: str):
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+                if len(self._buckets) > self.max_keys:
+                    # The least recently seen key is dropped; it comes back with a full bucket
+                    self._buckets.popitem(last=False)
+            self._buckets.move_to_end(key)
+            return bucket.try_acquire()
+
+class ConcurrencyLimiter:
+    """
+    At most `limit` holders at a time; up to `max_queue` more wait in FIFO order
+    for at most `max_wait` seconds. Waiters may come from any event loop, and
+    slots may be released from any thread.
+    """
+    def __init__(self, limit: int, max_queue: int, max_wait: float):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.active = 0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+        # Moving average of how long a slot is held, for Retry-After estimates
+        self._mean_hold = 1.0
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> float:
+        return self._mean_hold * (self.queued + 1) / max(self.limit, 1)
+
+    async def acquire(self):
+        with self._lock:
+            if self.active < self.limit and not self._waiters:
+                self.active += 1
+                return
+            if len(self._waiters) >= self.max_queue:
+                raise AdmissionRejected("queue_full", self.retry_after(), "Server is at capacity. Please retry later.")
+            waiter = (asyncio.get_running_loop(), asyncio.get_running_loop().create_future())
+            self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter[1], self.max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._lock:
+                handed_over = waiter not in self._waiters
+                if not handed_over:
+                    self._waiters.remove(waiter)
+            if handed_over and waiter[1].done() and not waiter[1].cancelled():
+                # The slot was granted just before we gave up: pass it on
+                self.release()
+            # (A grant still on its way is passed on by _grant, which sees the cancelled future)
+            if isinstance(e, asyncio.TimeoutError):
+                raise AdmissionRejected("wait_timeout", self.retry_after(), "Server is busy. Please retry later.")
+            raise
+
+    def release(self, held_seconds: float = None):
+        if held_seconds is not None:
+            self._mean_hold = 0.9 * self._mean_hold + 0.1 * held_seconds
+        with self._lock:
+            if not self._waiters:
+                self.active -= 1
+                return
+            # The slot goes straight to the oldest waiter; `active` is unchanged
+            loop, future = self._waiters.popleft()
+        loop.call_soon_threadsafe(self._grant, future)
+
+    def _grant(self, future):
+        if future.done():
+            # The waiter timed out or was cancelled in the meantime
+            self.release()
+        else:
+            future.set_result(None)
+
+class AdmissionController:
+    """Per-client and per-project rate limits in front of the concurrency limiter."""
+    def __init__(self, max_concurrent=8, max_queue=32, max_wait=10.0,
+                 client_rate_per_minute=60, client_burst=20, project_rate_per_minute=120, project_burst=40):
+        self.limiter = ConcurrencyLimiter(max_concurrent, max_queue, max_wait)
+        self.client_limits = KeyedRateLimiter(client_rate_per_minute, client_burst)
+        self.project_limits = KeyedRateLimiter(project_rate_per_minute, project_burst)
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_concurrent=int(os.getenv("ADMISSION_MAX_CONCURRENT", "8")),
+            max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "32")),
+            max_wait=float(os.getenv("ADMISSION_MAX_WAIT_S", "10")),
+            client_rate_per_minute=float(os.getenv("CLIENT_RATE_PER_MIN", "60")),
+            client_burst=float(os.getenv("CLIENT_BURST", "20")),
+            project_rate_per_minute=float(os.getenv("PROJECT_RATE_PER_MIN", "120")),
+            project_burst=float(os.getenv("PROJECT_BURST", "40")),
+        )
+
+    def check_rate(self, client_id: str, project_id: str):
+        """Raises AdmissionRejected when the client or the project is over its rate limit."""
+        allowed, retry_after = self.client_limits.check(client_id)
+        if not allowed:
+            raise AdmissionRejected("client_rate", retry_after, "Rate limit exceeded for this client.")
+        allowed, retry_after = self.project_limits.check(project_id)
+        if not allowed:
+            raise AdmissionRejected("project_rate", retry_after, "Rate limit exceeded for this project.")
+
+    async def acquire(self, client_id: str, project_id: str):
+        """Rate-checks the request and waits for a concurrency slot; pair with release()."""
+        self.check_rate(client_id, project_id)
+        await self.limiter.acquire()
+        return time.monotonic()
+
+    def release(self, acquired_at: float):
+        self.limiter.release(time.monotonic() - acquired_at)
+
+    @asynccontextmanager
+    async def admit(self, client_id: str, project_id: str):
+        acquired_at = await self.acquire(client_id, project_id)
+        try:
+            yield
+        finally:
+            self.release(acquired_at)
@@ -1,3 +1,5 @@
+import numpy as np
+
 # The rule book
 entitlement_rules = {
     "road_width_gt_18m_bonus": 0.5,
@@ -8,36 +10,30 @@ entitlement_rules = {
 class EntitlementsAgent:
     def __init__(self, rules):
         self.rules = rules
-        print("EntitlementsAgent initialized.")
 
-    def calculate(self, rule_id):
+    def calculate(self, rule_id, explain=True):
         # Look up the value in the rules dictionary
         value = self.rules.get(rule_id, 0) # Use .get() for safety, defaults to 0 if not found
 
         # Create the step-by-step breakdown
         breakdown = {
             "input_rule": rule_id,
-            "rule_value": value,
-            "explanation": f"The rule '{rule_id}' corresponds to a value of {value}."
+            "rule_value": value
         }
+        if explain:
+            breakdown["explanation"] = f"The rule '{rule_id}' corresponds to a value of {value}."
         return breakdown
 
-# --- Using the Agent ---
-
-# 1. Create an instance of the agent, giving it the rule book
-entitlement_agent = EntitlementsAgent(entitlement_rules)
-
-# 2. Use the instance to perform a calculation
-result = entitlement_agent.calculate("road_width_gt_18m_bonus")
-
-# 3. Print the final breakdown
-print(result)
+    def calculate_batch(self, rule_ids):
+        """Looks up an array of rule ids at once. Each distinct id is resolved only once."""
+        unique_ids, inverse = np.unique(np.asarray(rule_ids, dtype=object), return_inverse=True)
+        unique_values = np.array([self.rules.get(rule_id, 0) for rule_id in unique_ids], dtype=np.float64)
+        return {"input_rule": np.asarray(rule_ids), "rule_value": unique_values[inverse]}
 
 class AllowableEnvelopeAgent:
-    def __init__(self):
-        print("AllowableEnvelopeAgent initialized.")
+    FORMULA = "allowable_envelope = plot_area - (setback_area * 2)"
 
-    def calculate(self, plot_area, setback_area):
+    def calculate(self, plot_area, setback_area, explain=True):
         # Apply the formula
         allowable_envelope = plot_area - (setback_area * 2)
 
@@ -47,19 +43,31 @@ class AllowableEnvelopeAgent:
                 "plot_area": plot_area,
                 "setback_area": setback_area
             },
-            "formula": "allowable_envelope = plot_area - (setback_area * 2)",
-            "calculation": f"{allowable_envelope} = {plot_area} - ({setback_area} * 2)",
             "result": allowable_envelope
         }
+        if explain:
+            breakdown["formula"] = self.FORMULA
+            breakdown["calculation"] = f"{allowable_envelope} = {plot_area} - ({setback_area} * 2)"
         return breakdown
 
-# --- Using the Agent ---
+    def calculate_batch(self, plot_areas, setback_areas):
+        """Applies the formula to whole arrays of plot and setback areas and returns columns."""
+        plot_areas = np.asarray(plot_areas, dtype=np.float64)
+        setback_areas = np.broadcast_to(np.asarray(setback_areas, dtype=np.float64), plot_areas.shape)
+        return {
+            "plot_area": plot_areas,
+            "setback_area": setback_areas,
+            "result": plot_areas - (setback_areas * 2)
+        }
 
-# 1. Create an instance of the agent
-envelope_agent = AllowableEnvelopeAgent()
+# --- Using the Agents (only when run as a script) ---
+if __name__ == "__main__":
+    # 1. Create an instance of the agent, giving it the rule book
+    entitlement_agent = EntitlementsAgent(entitlement_rules)
 
-# 2. Use the agent to perform the calculation
-result = envelope_agent.calculate(plot_area=1000, setback_area=100)
+    # 2. Use the instance to perform a calculation and print the breakdown
+    print(entitlement_agent.calculate("road_width_gt_18m_bonus"))
 
-# 3. Print the final breakdown
-print(result)
\ No newline at end of file
+    # 3. Do the same for the envelope calculation
+    envelope_agent = AllowableEnvelopeAgent()
+    print(envelope_agent.calculate(plot_area=1000, setback_area=100))
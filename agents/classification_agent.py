@@ -1,45 +1,15 @@
 import os
-import json
-from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain.docstore.document import Document
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain.chains import create_retrieval_chain
-from langchain.prompts import PromptTemplate
-
-# (The script up to this point is the same)
-# --- 1. SETUP ---
-load_dotenv()
-os.environ["GOOGLE_API_KEY"] = os.getenv("GEMINI_API_KEY")
-
-# --- 2. LOAD KNOWLEDGE BASE ---
-print("Loading knowledge base...")
-with open("rules_kb/parsed_rules.json") as f:
-    rules_data = json.load(f)
-
-# --- 3. LOAD OR CREATE VECTOR STORE ---
-FAISS_INDEX_PATH = "rules_kb/faiss_index_mpnet"
-embeddings = HuggingFaceEmbeddings(model_name="all-mpnet-base-v2")
-if os.path.exists(FAISS_INDEX_PATH):
-    print("Loading existing vector store from disk...")
-    vector_store = FAISS.load_local(FAISS_INDEX_PATH, embeddings, allow_dangerous_deserialization=True)
-    print("Vector store loaded successfully.")
-else:
-    print("Vector store not found. Please run the OCR parser script first.")
-    exit()
+import sys
 
-# --- 4. CREATE RETRIEVER ---
-retriever = vector_store.as_retriever(search_kwargs={"k": 4})
+# Allow running this file directly as a script from the project root
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from agents.semantic_cache import SemanticCache, CachedRetrievalChain
+import metrics
 
-# --- 5. CREATE AND RUN THE FINAL, ENHANCED CHAIN ---
-print("\n--- Building and Running Final, Enhanced Chain ---")
-llm = ChatGoogleGenerativeAI(model="gemini-1.5-pro-latest")
+FAISS_INDEX_PATH = "rules_kb/faiss_index_mpnet"
 
 # FINAL, MOST USER-FRIENDLY PROMPT
-prompt = PromptTemplate.from_template(
-    """You are an expert AI assistant who helps non-experts understand complex building regulations.
+PROMPT_TEMPLATE = """You are an expert AI assistant who helps non-experts understand complex building regulations.
     Your task is to analyze the user's question and the provided context to give a simple, clear answer.
 
     Think step-by-step:
@@ -59,15 +29,59 @@ prompt = PromptTemplate.from_template(
 
     Question: {input}
     """
-)
 
-question_answer_chain = create_stuff_documents_chain(llm, prompt)
-retrieval_chain = create_retrieval_chain(retriever, question_answer_chain)
+def build_retrieval_chain(index_path: str = FAISS_INDEX_PATH):
+    """
+    Loads the vector store and builds the cached retrieval chain. The heavy
+    LangChain, embedding and Gemini imports happen here, not at import time.
+    """
+    from dotenv import load_dotenv
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    from langchain_community.vectorstores import FAISS
+    from langchain.chains.combine_documents import create_stuff_documents_chain
+    from langchain.chains import create_retrieval_chain
+    from langchain.prompts import PromptTemplate
+
+    # --- 1. SETUP ---
+    load_dotenv()
+    os.environ["GOOGLE_API_KEY"] = os.getenv("GEMINI_API_KEY")
+
+    # --- 2. LOAD THE VECTOR STORE ---
+    if not os.path.exists(index_path):
+        raise FileNotFoundError(f"Vector store not found at '{index_path}'. Please run the OCR parser script first.")
+    print("Loading existing vector store from disk...")
+    embeddings = HuggingFaceEmbeddings(model_name="all-mpnet-base-v2")
+    vector_store = FAISS.load_local(index_path, embeddings, allow_dangerous_deserialization=True)
+    print("Vector store loaded successfully.")
+
+    # --- 3. CREATE RETRIEVER ---
+    retriever = vector_store.as_retriever(search_kwargs={"k": 4})
+
+    # --- 4. CREATE THE FINAL, ENHANCED CHAIN ---
+    llm = ChatGoogleGenerativeAI(model="gemini-1.5-pro-latest")
+    prompt = PromptTemplate.from_template(PROMPT_TEMPLATE)
+    question_answer_chain = create_stuff_documents_chain(llm, prompt)
+
+    # Near-duplicate questions are answered from the semantic cache instead of a new Gemini call
+    cache = SemanticCache(embeddings)
+    metrics.register_cache("semantic_cache", cache)
+    return CachedRetrievalChain(
+        create_retrieval_chain(retriever, question_answer_chain),
+        cache,
+        city="Mumbai",
+        index_path=index_path
+    )
+
+
+if __name__ == "__main__":
+    print("\n--- Building and Running Final, Enhanced Chain ---")
+    retrieval_chain = build_retrieval_chain()
 
-input_case = {
-    "input": "What are the general requirements for open spaces around a building?"
-}
-response = retrieval_chain.invoke(input_case)
+    input_case = {
+        "input": "What are the general requirements for open spaces around a building?"
+    }
+    response = retrieval_chain.invoke(input_case)
 
-print("\n--- Final Answer ---")
-print(response["answer"])
\ No newline at end of file
+    print("\n--- Final Answer ---")
+    print(response["answer"])
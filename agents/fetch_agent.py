@@ -1,20 +1,30 @@
-import requests
 import os
 
 url = "https://portal.mcgm.gov.in/irj/go/km/docs/documents/MCGM%20Department%20List/Chief%20Engineer%20(Development%20Plan)/Docs/SANCTIONED%20DP2034/DCPR/DCPR%202034.pdf"
 save_path = "io/DCPR_2034.pdf"
 
-print(f"Downloading file from {url}...")
-response = requests.get(url)
-
-if response.status_code == 200:
-    print("Success! The file was downloaded.")
-    
-    # We open the save_path in 'write-bytes' mode ('wb')
-    with open(save_path, "wb") as f:
-        # We write the content from the response to our new file
-        f.write(response.content)
-    
-    print(f"File saved successfully to {save_path}")
-else:
-    print(f"Failed with status code: {response.status_code}")
\ No newline at end of file
+def fetch_document(url: str = url, save_path: str = save_path) -> bool:
+    """Downloads a document to `save_path`. Returns True on success."""
+    import requests
+
+    print(f"Downloading file from {url}...")
+    response = requests.get(url)
+
+    if response.status_code == 200:
+        print("Success! The file was downloaded.")
+
+        os.makedirs(os.path.dirname(save_path), exist_ok=True)
+        # We open the save_path in 'write-bytes' mode ('wb')
+        with open(save_path, "wb") as f:
+            # We write the content from the response to our new file
+            f.write(response.content)
+
+        print(f"File saved successfully to {save_path}")
+        return True
+
+    print(f"Failed with status code: {response.status_code}")
+    return False
+
+
+if __name__ == "__main__":
+    fetch_document()
@@ -1,11 +1,19 @@
+import io
 import numpy as np
-from stl import mesh
+from stl import mesh, Mode
 
-class GeometryAgent:
-    def __init__(self):
-        print("GeometryAgent initialized.")
+# The 12 triangles for the 6 faces of a block, indexing into its 8 corners
+BLOCK_FACES = np.array([
+    [0, 3, 1], [1, 3, 2],
+    [0, 4, 7], [0, 7, 3],
+    [4, 5, 6], [4, 6, 7],
+    [5, 1, 2], [5, 2, 6],
+    [2, 3, 7], [2, 7, 6],
+    [0, 1, 5], [0, 5, 4]])
 
-    def create_block(self, output_path, width, depth, height):
+class GeometryAgent:
+    def build_block(self, width, depth, height):
+        """Builds the block mesh in memory without writing it anywhere."""
         # Define the 8 corners of the block
         vertices = np.array([
             [0, 0, 0],
@@ -15,22 +23,40 @@ class GeometryAgent:
             [0, 0, height],
             [width, 0, height],
             [width, depth, height],
-            [0, depth, height]])
-
-        # Define the 12 triangles for the 6 faces
-        faces = np.array([
-            [0, 3, 1], [1, 3, 2],
-            [0, 4, 7], [0, 7, 3],
-            [4, 5, 6], [4, 6, 7],
-            [5, 1, 2], [5, 2, 6],
-            [2, 3, 7], [2, 7, 6],
-            [0, 1, 5], [0, 5, 4]])
-
-        # Create the mesh
-        block = mesh.Mesh(np.zeros(faces.shape[0], dtype=mesh.Mesh.dtype))
-        for i, f in enumerate(faces):
-            for j in range(3):
-                block.vectors[i][j] = vertices[f[j],:]
-        
-        block.save(output_path)
-        print(f"Block geometry saved to {output_path}")
\ No newline at end of file
+            [0, depth, height]], dtype=np.float32)
+
+        # A single fancy-indexing assignment fills all triangles at once
+        block = mesh.Mesh(np.zeros(BLOCK_FACES.shape[0], dtype=mesh.Mesh.dtype))
+        block.vectors[:] = vertices[BLOCK_FACES]
+        return block
+
+    def to_stl_bytes(self, block):
+        """Serializes a mesh to binary STL bytes."""
+        buffer = io.BytesIO()
+        block.save("geometry.stl", fh=buffer, mode=Mode.BINARY)
+        return buffer.getvalue()
+
+    def build_mesh(self, vectors):
+        """Wraps an (N, 3, 3) triangle array, e.g. a multi-block massing, in a mesh."""
+        combined = mesh.Mesh(np.zeros(len(vectors), dtype=mesh.Mesh.dtype))
+        combined.vectors[:] = vectors
+        return combined
+
+    def save(self, block, output_path, as_bytes=False):
+        """
+        Saves a mesh as a binary STL file. With `as_bytes=True` the STL is
+        returned as bytes instead, and `output_path` may be None.
+        """
+        if as_bytes:
+            return self.to_stl_bytes(block)
+
+        block.save(output_path, mode=Mode.BINARY)
+        print(f"Geometry saved to {output_path}")
+
+    def create_block(self, output_path, width, depth, height, as_bytes=False):
+        """Creates a single block and saves it, see `save`."""
+        return self.save(self.build_block(width, depth, height), output_path, as_bytes=as_bytes)
+
+    def create_mesh(self, output_path, vectors, as_bytes=False):
+        """Creates a mesh from a triangle array and saves it, see `save`."""
+        return self.save(self.build_mesh(vectors), output_path, as_bytes=as_bytes)
@@ -1,19 +1,29 @@
-class InteriorDesignAgent:
-    def __init__(self):
-        print("InteriorDesignAgent initialized.")
+import numpy as np
+
+CARPET_TO_BUA_RATIO = 0.70
 
-    def calculate_carpet_area(self, total_bua: float):
+class InteriorDesignAgent:
+    def calculate_carpet_area(self, total_bua: float, explain: bool = True):
         """
         Calculates the estimated maximum carpet area based on the total 
         permissible built-up area (BUA).
         
         A common industry rule of thumb is that carpet area is ~70% of BUA.
         """
-        carpet_area = total_bua * 0.70
+        carpet_area = total_bua * CARPET_TO_BUA_RATIO
         
         breakdown = {
             "input_total_bua_sqm": round(total_bua, 2),
-            "formula": "estimated_carpet_area = total_bua * 0.70",
             "result_carpet_area_sqm": round(carpet_area, 2)
         }
-        return breakdown
\ No newline at end of file
+        if explain:
+            breakdown["formula"] = "estimated_carpet_area = total_bua * 0.70"
+        return breakdown
+
+    def calculate_carpet_area_batch(self, total_bua):
+        """Vectorized version of `calculate_carpet_area` for an array of BUA values."""
+        total_bua = np.asarray(total_bua, dtype=np.float64)
+        return {
+            "input_total_bua_sqm": np.round(total_bua, 2),
+            "result_carpet_area_sqm": np.round(total_bua * CARPET_TO_BUA_RATIO, 2)
+        }
\ No newline at end of file
@@ -0,0 +1,178 @@
+import numpy as np
+
+from agents.geometry_agent import BLOCK_FACES
+
+# The 8 corners of a unit cube, in the same order GeometryAgent uses for a block
+UNIT_BLOCK_CORNERS = np.array([
+    [0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0],
+    [0, 0, 1], [1, 0, 1], [1, 1, 1], [0, 1, 1]], dtype=np.float32)
+
+DEFAULT_FLOOR_HEIGHT_M = 3.0
+
+class MassingAgent:
+    """
+    Computes the buildable massing of a plot from its setback, height and FSI
+    entitlements, and turns it into a stack of floor blocks.
+
+    The plot is an axis-aligned rectangle, with the front (road-facing) edge
+    along y = min; other polygon shapes are rejected (see `plot_rectangle`).
+    All calculations are plain NumPy broadcasting, so `compute_massing`
+    accepts scalars or whole arrays of design-space samples.
+    """
+    def __init__(self, floor_height_m: float = DEFAULT_FLOOR_HEIGHT_M):
+        self.floor_height_m = floor_height_m
+
+    def collect_constraints(self, entitlements: list) -> dict:
+        """
+        Reads setbacks, maximum height and total FSI from the entitlements of the
+        matching rules. The first rule that defines a value wins; `total_fsi` is
+        resolved by `resolve_total_fsi`, like everywhere else.
+        """
+        constraints = {"front_margin_m": 0.0, "side_margin_m": 0.0, "rear_margin_m": 0.0, "max_height_m": None}
+        found = set()
+        for ent in entitlements or []:
+            for key in constraints:
+                if key in ent and key not in found:
+                    # Setbacks are minimums, height is a maximum
+                    value = _as_number(ent[key], "max" if key == "max_height_m" else "min")
+                    if value is not None:
+                        constraints[key] = value
+                        found.add(key)
+        constraints["total_fsi"] = resolve_total_fsi(entitlements)
+        return constraints
+
+    def plot_rectangle(self, plot_size=None, plot_polygon=None):
+        """
+        Returns (x0, y0, width, depth) for a square plot of `plot_size` sq. m, or for
+        `plot_polygon` if it is an axis-aligned rectangle. Setbacks are applied per
+        side of that rectangle, so any other shape raises ValueError: its bounding
+        box would overstate both the plot area (and so the FSI-limited built-up
+        area) and the footprint.
+        """
+        if plot_polygon is not None:
+            points = np.asarray(plot_polygon, dtype=np.float64)
+            if points.ndim != 2 or points.shape[1] != 2 or len(points) < 3:
+                raise ValueError("plot_polygon must be a list of at least three [x, y] points.")
+            x0, y0 = points.min(axis=0)
+            x1, y1 = points.max(axis=0)
+            box_area = (x1 - x0) * (y1 - y0)
+            # A simple polygon covers its bounding box only if it is that box
+            if box_area <= 0 or not np.isclose(polygon_area(points), box_area, rtol=1e-6):
+                raise ValueError("Only axis-aligned rectangular plot polygons are supported.")
+            return x0, y0, x1 - x0, y1 - y0
+        side = np.sqrt(np.maximum(0, plot_size))
+        return 0.0, 0.0, side, side
+
+    def compute_massing(self, plot_width, plot_depth, front_margin_m=0.0, side_margin_m=0.0,
+                        rear_margin_m=0.0, max_height_m=None, total_fsi=1.0):
+        """
+        Computes the buildable footprint and how many floors fit under the height
+        and FSI limits. Any argument may be a NumPy array; results broadcast.
+        """
+        plot_width = np.asarray(plot_width, dtype=np.float64)
+        plot_depth = np.asarray(plot_depth, dtype=np.float64)
+        footprint_width = np.maximum(0.0, plot_width - 2 * np.asarray(side_margin_m))
+        footprint_depth = np.maximum(0.0, plot_depth - np.asarray(front_margin_m) - np.asarray(rear_margin_m))
+        footprint_area = footprint_width * footprint_depth
+
+        max_bua = plot_width * plot_depth * np.asarray(total_fsi, dtype=np.float64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            floors_by_fsi = np.where(footprint_area > 0, max_bua / footprint_area, 0.0)
+        if max_height_m is None:
+            floors_by_height = np.inf
+        else:
+            floors_by_height = np.floor(np.asarray(max_height_m, dtype=np.float64) / self.floor_height_m)
+
+        # Whole floors, plus a partial top floor when FSI (not height) is the binding limit
+        full_floors = np.floor(np.minimum(floors_by_fsi, floors_by_height)).astype(np.int64)
+        top_floor_fraction = np.where(floors_by_fsi < floors_by_height, floors_by_fsi - full_floors, 0.0)
+        top_floor_fraction = np.where(full_floors + 1 > floors_by_height, 0.0, top_floor_fraction)
+        built_up_area = footprint_area * (full_floors + top_floor_fraction)
+
+        return {
+            "footprint_width_m": footprint_width,
+            "footprint_depth_m": footprint_depth,
+            "footprint_area_sqm": footprint_area,
+            "full_floors": full_floors,
+            "top_floor_fraction": top_floor_fraction,
+            "floor_height_m": self.floor_height_m,
+            "height_m": (full_floors + (top_floor_fraction > 0)) * self.floor_height_m,
+            "built_up_area_sqm": built_up_area,
+            "limited_by": np.where(floors_by_fsi < floors_by_height, "fsi", "height"),
+            # False when the setbacks cover the plot or the limits allow no floor at all
+            "buildable": (footprint_area > 0) & (built_up_area > 0)
+        }
+
+    def massing_for_case(self, constraints: dict, plot_size=None, plot_polygon=None) -> dict:
+        """
+        Computes the scalar massing of a single case, including its plot offset.
+        When nothing can be built, "buildable" is False and "reason" says why.
+        """
+        x0, y0, width, depth = self.plot_rectangle(plot_size, plot_polygon)
+        massing = self.compute_massing(width, depth, **constraints)
+        massing = {k: (v.item() if isinstance(v, (np.ndarray, np.generic)) else v) for k, v in massing.items()}
+        massing["origin"] = [float(x0 + constraints["side_margin_m"]), float(y0 + constraints["front_margin_m"]), 0.0]
+        if not massing["buildable"]:
+            massing["reason"] = ("no buildable footprint: the setbacks cover the plot" if massing["footprint_area_sqm"] <= 0
+                                 else "no buildable floor: the height or FSI limit allows none")
+        return massing
+
+    def floor_blocks(self, massing: dict) -> np.ndarray:
+        """Returns an (N, 6) array of floor blocks as [x, y, z, width, depth, height]."""
+        if not massing.get("buildable", True):
+            raise ValueError(f"Nothing to build: {massing.get('reason', 'no buildable footprint')}.")
+        floors = int(massing["full_floors"])
+        fraction = float(massing["top_floor_fraction"])
+        count = floors + (1 if fraction > 0 else 0)
+        blocks = np.empty((count, 6), dtype=np.float32)
+        blocks[:, 0:3] = massing["origin"]
+        blocks[:, 2] = np.arange(count) * self.floor_height_m
+        blocks[:, 3] = massing["footprint_width_m"]
+        blocks[:, 4] = massing["footprint_depth_m"]
+        blocks[:, 5] = self.floor_height_m
+        if fraction > 0:
+            # The partial top floor keeps the full width and shrinks its depth from the rear
+            blocks[-1, 4] *= fraction
+        return blocks
+
+    def build_mesh_vectors(self, blocks: np.ndarray) -> np.ndarray:
+        """Turns (N, 6) blocks into one combined (N * 12, 3, 3) triangle array."""
+        origins = blocks[:, None, 0:3]
+        sizes = blocks[:, None, 3:6]
+        vertices = origins + UNIT_BLOCK_CORNERS[None, :, :] * sizes
+        return vertices[:, BLOCK_FACES].reshape(-1, 3, 3)
+
+
+def polygon_area(points) -> float:
+    """Area of a simple polygon given as an (N, 2) array of vertices (shoelace formula)."""
+    x, y = points[:, 0], points[:, 1]
+    return 0.5 * abs(float(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1))))
+
+DEFAULT_FSI = 1.0
+
+def total_fsi_value(value) -> float:
+    """
+    Reads one rule's total_fsi entitlement: a number, or the max of a {min, max}
+    range (its min when it has no max). Anything else counts as DEFAULT_FSI.
+    """
+    value = _as_number(value, "max")
+    return DEFAULT_FSI if value is None else value
+
+def resolve_total_fsi(entitlements: list) -> float:
+    """
+    The total FSI of a case: the first matching rule with a total_fsi key decides,
+    even when its value is unreadable. Shared by the pipeline, the massing and the
+    sweep, so /run_case and /sweep always agree.
+    """
+    for ent in entitlements or []:
+        if "total_fsi" in ent:
+            return total_fsi_value(ent["total_fsi"])
+    return DEFAULT_FSI
+
+def _as_number(value, prefer):
+    """Reads a numeric entitlement that may be stored as a number or a {min, max} range."""
+    if isinstance(value, dict):
+        value = value.get(prefer, value.get("min" if prefer == "max" else "max"))
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return None
@@ -1,15 +1,21 @@
-import fitz  # PyMuPDF
-import pytesseract
-from PIL import Image
 import io
-import json
+import os
 import re
+import sys
 import argparse # New import for command-line arguments
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from storage import save_rulebook
+
 def parse_pdf_with_ocr(input_path, output_path):
     """
     Parses a PDF using OCR, extracts text and point numbers, and saves to JSON.
     """
+    # OCR dependencies are heavy, so they are only imported when parsing actually runs
+    import fitz  # PyMuPDF
+    import pytesseract
+    from PIL import Image
+
     print(f"--- Starting OCR parsing for '{input_path}' ---")
     all_pages_data = []
     
@@ -41,17 +47,17 @@ def parse_pdf_with_ocr(input_path, output_path):
         all_pages_data.append(page_data)
         print(f"  Processed page {page_num + 1}/{len(pdf_document)}")
 
-    with open(output_path, "w", encoding='utf-8') as f:
-        json.dump(all_pages_data, f, indent=4)
+    # Stored once by content in the output directory's rulebook store, under the output file's name
+    digest = save_rulebook(output_path, all_pages_data)
     
-    print(f"--- Successfully parsed and saved to '{output_path}' ---")
+    print(f"--- Successfully parsed and saved to '{output_path}' (rulebook {digest[:12]}) ---")
 
 
 if __name__ == "__main__":
     # Setup command-line argument parsing
     parser = argparse.ArgumentParser(description="Parse a PDF document using OCR.")
     parser.add_argument("--input", required=True, help="Path to the input PDF file.")
-    parser.add_argument("--output", required=True, help="Path to the output JSON file.")
+    parser.add_argument("--output", required=True, help="Rulebook path, e.g. rules_kb/pune_rules.json; stored in that directory's rulebook store.")
     
     args = parser.parse_args()
     
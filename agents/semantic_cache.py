@@ -0,0 +1,135 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def index_version(index_path: str) -> str:
+    """
+    Returns a cheap fingerprint of a FAISS index directory. Any rebuild of the
+    index (new file size or modification time) produces a new version.
+    """
+    digest = hashlib.sha1()
+    if os.path.isdir(index_path):
+        for name in sorted(os.listdir(index_path)):
+            stat = os.stat(os.path.join(index_path, name))
+            digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()[:16]
+
+
+class SemanticCache:
+    """
+    A size-bounded, in-memory cache of question -> answer pairs that matches
+    incoming questions by cosine similarity of their embeddings instead of by
+    exact text. Entries are namespaced per city and per index version, so a
+    rebuilt index never serves answers retrieved from the old one.
+    """
+    def __init__(self, embeddings, similarity_threshold: float = 0.92, max_entries: int = 512):
+        self.embeddings = embeddings
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # Global LRU order over all entries: (city, version, question) -> entry
+        self._entries = OrderedDict()
+        # city -> index version currently held in the cache
+        self._versions = {}
+        # (city, version) -> (keys, normalized embedding matrix), rebuilt lazily
+        self._matrices = {}
+        self._lock = threading.Lock()
+
+    def embed(self, question: str) -> np.ndarray:
+        vector = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def lookup(self, city: str, version: str, vector: np.ndarray):
+        """Returns the cached response closest to `vector`, or None on a miss."""
+        with self._lock:
+            self._check_version(city, version)
+            keys, matrix = self._matrix_for(city, version)
+            if not keys:
+                self.misses += 1
+                return None
+            similarities = matrix @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.similarity_threshold:
+                self.misses += 1
+                return None
+            key = keys[best]
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]["response"]
+
+    def store(self, city: str, version: str, question: str, vector: np.ndarray, response: dict):
+        with self._lock:
+            self._check_version(city, version)
+            key = (city, version, question)
+            self._entries[key] = {"vector": vector, "response": response}
+            self._entries.move_to_end(key)
+            self._matrices.pop((city, version), None)
+            while len(self._entries) > self.max_entries:
+                evicted_key, _ = self._entries.popitem(last=False)
+                self._matrices.pop(evicted_key[:2], None)
+
+    def invalidate(self, city: str = None):
+        """Drops all entries, or only those belonging to `city`."""
+        with self._lock:
+            for key in [k for k in self._entries if city is None or k[0] == city]:
+                del self._entries[key]
+            self._matrices = {k: v for k, v in self._matrices.items() if city is not None and k[0] != city}
+            if city is None:
+                self._versions.clear()
+            else:
+                self._versions.pop(city, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _check_version(self, city, version):
+        # Called with the lock held. A new index version evicts the city's stale entries.
+        if self._versions.get(city, version) != version:
+            for key in [k for k in self._entries if k[0] == city]:
+                del self._entries[key]
+            self._matrices = {k: v for k, v in self._matrices.items() if k[0] != city}
+        self._versions[city] = version
+
+    def _matrix_for(self, city, version):
+        cached = self._matrices.get((city, version))
+        if cached is None:
+            keys = [k for k in self._entries if k[0] == city and k[1] == version]
+            matrix = np.stack([self._entries[k]["vector"] for k in keys]) if keys else np.empty((0, 0), dtype=np.float32)
+            cached = (keys, matrix)
+            self._matrices[(city, version)] = cached
+        return cached
+
+
+class CachedRetrievalChain:
+    """
+    Wraps a LangChain retrieval chain so that near-duplicate questions are
+    answered from a SemanticCache instead of re-running retrieval and the LLM.
+    It exposes the same `invoke({"input": ...})` call as the wrapped chain.
+    """
+    def __init__(self, retrieval_chain, cache: SemanticCache, city: str, index_path: str):
+        self.retrieval_chain = retrieval_chain
+        self.cache = cache
+        self.city = city
+        self.index_path = index_path
+
+    def invoke(self, inputs: dict) -> dict:
+        question = inputs["input"]
+        version = index_version(self.index_path)
+        vector = self.cache.embed(question)
+
+        cached = self.cache.lookup(self.city, version, vector)
+        if cached is not None:
+            return {"input": question, "answer": cached["answer"], "context": cached["context"], "cache_hit": True}
+
+        response = self.retrieval_chain.invoke(inputs)
+        self.cache.store(self.city, version, question, vector, {
+            "answer": response.get("answer"),
+            "context": response.get("context", [])
+        })
+        return {**response, "cache_hit": False}
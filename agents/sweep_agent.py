@@ -0,0 +1,129 @@
+import numpy as np
+
+from agents.calculator_agent import AllowableEnvelopeAgent
+from agents.interior_agent import InteriorDesignAgent
+from agents.massing_agent import DEFAULT_FSI, MassingAgent, _as_number, total_fsi_value
+
+# Entitlements resolved for every grid point, and the {min, max} bound each one prefers
+SWEEP_ENTITLEMENTS = {
+    "total_fsi": "max",
+    "front_margin_m": "min",
+    "side_margin_m": "min",
+    "rear_margin_m": "min",
+    "max_height_m": "max"
+}
+
+class DesignSpaceSweepAgent:
+    """
+    Evaluates a whole grid of plot sizes, road widths and FSI values against a
+    city's rules in one pass. The rules are compiled once into arrays of
+    condition ranges; matching, FSI selection, carpet area and massing are
+    then plain array operations over every grid point.
+
+    Rule matching mirrors MCPClient.query_rules: road-width rules first, then
+    plot-area rules, each in database order, and the first matching rule that
+    defines an entitlement wins.
+    """
+    def __init__(self, rules: list):
+        self.rules = rules
+        self.envelope_agent = AllowableEnvelopeAgent()
+        self.interior_agent = InteriorDesignAgent()
+        self.massing_agent = MassingAgent()
+        self._compiled = {key: self._compile(key, prefer) for key, prefer in SWEEP_ENTITLEMENTS.items()}
+
+    def _compile(self, key, prefer):
+        """Collects (condition, min, max, value, rule_id) candidates for one entitlement, in match order."""
+        candidates = {"condition": [], "min": [], "max": [], "value": [], "rule_id": []}
+        for condition in ("road_width_m", "plot_area_sqm"):
+            for rule in self.rules:
+                bounds = (rule.get("conditions") or {}).get(condition)
+                entitlements = rule.get("entitlements") or {}
+                if not isinstance(bounds, dict) or key not in entitlements:
+                    continue
+                low, high = _as_number(bounds.get("min"), "min"), _as_number(bounds.get("max"), "max")
+                if low is None or high is None:
+                    continue
+                if key == "total_fsi":
+                    # Like the pipeline (resolve_total_fsi): the first rule with a total_fsi key wins
+                    value = total_fsi_value(entitlements[key])
+                else:
+                    value = _as_number(entitlements[key], prefer)
+                    if value is None:
+                        continue
+                candidates["condition"].append(condition)
+                candidates["min"].append(low)
+                candidates["max"].append(high)
+                candidates["value"].append(value)
+                candidates["rule_id"].append(rule.get("id"))
+        return {
+            "is_width": np.array([c == "road_width_m" for c in candidates["condition"]], dtype=bool),
+            "min": np.array(candidates["min"], dtype=np.float64),
+            "max": np.array(candidates["max"], dtype=np.float64),
+            "value": np.array(candidates["value"], dtype=np.float64),
+            "rule_id": np.array(candidates["rule_id"], dtype=object)
+        }
+
+    def resolve(self, key, plot_sizes, road_widths, default):
+        """Returns (values, rule_ids) of the first matching rule for every point, or `default`."""
+        compiled = self._compiled[key]
+        n = len(plot_sizes)
+        if len(compiled["value"]) == 0:
+            return np.full(n, default, dtype=np.float64), np.full(n, None, dtype=object)
+
+        # Width rules match min <= w < max, area rules match min <= a <= max (as in query_rules)
+        w = road_widths[:, None]
+        a = plot_sizes[:, None]
+        width_match = (compiled["min"] <= w) & (w < compiled["max"])
+        area_match = (compiled["min"] <= a) & (a <= compiled["max"])
+        matches = np.where(compiled["is_width"], width_match, area_match)
+
+        first = np.argmax(matches, axis=1)
+        matched = matches[np.arange(n), first]
+        values = np.where(matched, compiled["value"][first], default)
+        rule_ids = np.where(matched, compiled["rule_id"][first], None)
+        return values, rule_ids
+
+    def sweep(self, plot_sizes, road_widths, fsi_values=None, setback_area=150, explain=False):
+        """
+        Evaluates the full grid plot_sizes x road_widths (x fsi_values, when
+        given to override the rule FSI) and returns a dict of columns.
+        """
+        axes = [np.asarray(plot_sizes, dtype=np.float64), np.asarray(road_widths, dtype=np.float64)]
+        if fsi_values is not None:
+            axes.append(np.asarray(fsi_values, dtype=np.float64))
+        grid = [g.ravel() for g in np.meshgrid(*axes, indexing="ij")]
+        plots, widths = grid[0], grid[1]
+
+        if fsi_values is not None:
+            total_fsi, fsi_rule_ids = grid[2], np.full(len(plots), None, dtype=object)
+        else:
+            total_fsi, fsi_rule_ids = self.resolve("total_fsi", plots, widths, default=DEFAULT_FSI)
+
+        margins = {key: self.resolve(key, plots, widths, default=0.0)[0]
+                   for key in ("front_margin_m", "side_margin_m", "rear_margin_m")}
+        max_height, _ = self.resolve("max_height_m", plots, widths, default=np.inf)
+
+        total_bua = plots * total_fsi
+        envelope = self.envelope_agent.calculate_batch(plots, setback_area)
+        carpet = self.interior_agent.calculate_carpet_area_batch(total_bua)
+        side = np.sqrt(np.maximum(0, plots))
+        massing = self.massing_agent.compute_massing(side, side, max_height_m=max_height, total_fsi=total_fsi, **margins)
+
+        columns = {
+            "plot_size": plots,
+            "road_width": widths,
+            "total_fsi": total_fsi,
+            "total_bua_sqm": total_bua,
+            "allowable_envelope": envelope["result"],
+            "carpet_area_sqm": carpet["result_carpet_area_sqm"],
+            "floors": massing["full_floors"] + (massing["top_floor_fraction"] > 0),
+            "height_m": massing["height_m"],
+            "massing_limited_by": massing["limited_by"]
+        }
+        if explain:
+            columns["fsi_rule_id"] = fsi_rule_ids
+            columns["explanation"] = np.char.add(
+                np.char.add("total_fsi ", total_fsi.astype(str)),
+                np.where(np.equal(fsi_rule_ids, None), " (default)", np.char.add(" from rule ", fsi_rule_ids.astype(str)))
+            )
+        return columns
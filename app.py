@@ -15,6 +15,29 @@ st.write("Select a case study, run the pipeline, and provide feedback to improve
 # This is the single, official address of our professional backend service
 API_BASE_URL = "http://127.0.0.1:8000"
 
+def iter_sse(response):
+    """Yields (event, data) pairs from a Server-Sent Events response whose data is JSON."""
+    event, data_lines = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if not line:
+            if data_lines:
+                yield event, json.loads("\n".join(data_lines))
+            event, data_lines = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].strip())
+
+def render_facts(container, report_data):
+    """The deterministic results, which arrive before the AI analysis."""
+    rl_decision = report_data.get("rl_decision", {})
+    entitlements = report_data.get("entitlements", {})
+    col1, col2, col3 = container.columns(3)
+    col1.metric("Rules matched", len(entitlements.get("rules_from_db") or []))
+    col2.metric("Carpet area (sq. m.)", entitlements.get("carpet_area_sqm"))
+    col3.metric("RL optimal action", rl_decision.get("optimal_action"))
+    container.caption(f"Geometry: {API_BASE_URL}/get_geometry/{report_data.get('project_id')}/{report_data.get('case_id')}")
+
 # --- 1. UI for Case Selection ---
 case_files = glob.glob("inputs/case_studies/*.json")
 if not case_files:
@@ -28,19 +51,37 @@ else:
         if selected_case_name:
             case_filepath = case_options[selected_case_name]
             
-            with st.spinner(f"Sending '{selected_case_name}' to the API and waiting for analysis... This may take a few moments."):
+            # Filled in as the server streams the results: facts first, then the AI analysis
+            facts_placeholder = st.empty()
+            report_placeholder = st.empty()
+            with st.spinner(f"Sending '{selected_case_name}' to the API and streaming the analysis..."):
                 try:
                     # Load the case data to send as the API request body
                     with open(case_filepath, 'r') as f:
                         case_payload = json.load(f)
                     
-                    # --- THE CRUCIAL UPGRADE: Make a professional API Call ---
-                    response = requests.post(f"{API_BASE_URL}/run_case", json=case_payload, timeout=300) # 5-minute timeout for long AI runs
+                    # Stream the results: the deterministic facts arrive in milliseconds, the LLM report token by token
+                    response = requests.post(f"{API_BASE_URL}/run_case/stream", json=case_payload, stream=True, timeout=(10, 300))
                     
                     if response.status_code == 200:
-                        # Store the clean JSON response from the API in the session state
-                        st.session_state['report_data'] = response.json()
-                        st.success("Pipeline complete! Analysis report received from the server.")
+                        st.session_state['report_data'] = None
+                        analysis_text = ""
+                        for event, data in iter_sse(response):
+                            if event == "deterministic":
+                                render_facts(facts_placeholder.container(), data)
+                            elif event == "token":
+                                analysis_text += data
+                                report_placeholder.markdown(analysis_text)
+                            elif event == "report":
+                                # Store the complete report from the API in the session state
+                                st.session_state['report_data'] = data
+                            elif event == "error":
+                                st.error(f"The pipeline failed on the server. Details: {data.get('detail')}")
+                        if st.session_state['report_data']:
+                            # The complete report is shown below, with the feedback buttons
+                            facts_placeholder.empty()
+                            report_placeholder.empty()
+                            st.success("Pipeline complete! Analysis report received from the server.")
                     else:
                         st.error(f"API Error (Status {response.status_code}): The server returned an error. Details: {response.text}")
                         st.session_state['report_data'] = None
@@ -55,6 +96,7 @@ if st.session_state.get('report_data'):
     
     # Display the final, standardized report from the API
     st.subheader("✅ AI Analysis Report")
+    render_facts(st.container(), report_data)
     st.markdown(report_data.get("entitlements", {}).get("analysis_summary", "No analysis report found."))
     
     # Display the confidence score from the bonus task!
@@ -68,12 +110,10 @@ if st.session_state.get('report_data'):
 
     def handle_feedback(feedback_type):
         """Sends the feedback to the /feedback endpoint of our API."""
-        # The payload now correctly includes the project_id from the report
+        # The API looks the report up by project and case, so it is not sent back
         payload = {
             "project_id": report_data.get("project_id", "unknown"),
             "case_id": report_data.get("case_id", "unknown"),
-            "input_case": report_data.get("input_case", {}),
-            "output_report": report_data,
             "user_feedback": feedback_type
         }
         try:
@@ -0,0 +1,137 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+class GeometryStore:
+    """
+    A content-addressed store for generated geometry. Each STL is keyed by a
+    hash of its rounded massing parameters, generated once, and then
+    hard-linked into every case folder that needs it.
+    """
+    def __init__(self, root: str = "outputs/geometry_store", precision: int = 2, memory_limit: int = 256):
+        self.root = root
+        self.precision = precision
+        self.memory_limit = memory_limit
+        self.hits = 0
+        self.misses = 0
+        # Small LRU of recently used STL bytes, so hot geometry is served from memory
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    def round_params(self, params: dict) -> dict:
+        """Rounds every number in the massing parameters so near-identical cases share a key."""
+        def _round(value):
+            if isinstance(value, float):
+                return round(value, self.precision)
+            if isinstance(value, (list, tuple)):
+                return [_round(v) for v in value]
+            return value
+        return {k: _round(v) for k, v in params.items()}
+
+    def key_for(self, params: dict) -> str:
+        canonical = json.dumps(self.round_params(params), sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], f"{key}.stl")
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.path_for(key))
+
+    def get_or_create(self, params: dict, build_fn):
+        """
+        Returns (key, path) for the geometry of `params`. `build_fn` is only
+        called, with the rounded parameters, when the store does not have it yet.
+        """
+        rounded = self.round_params(params)
+        key = self.key_for(rounded)
+        path = self.path_for(key)
+        if os.path.exists(path):
+            with self._lock:
+                self.hits += 1
+            return key, path
+
+        with self._lock:
+            self.misses += 1
+        stl_bytes = build_fn(rounded)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary name first so concurrent readers never see a partial file
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(stl_bytes)
+        os.replace(tmp_path, path)
+        self._remember(key, stl_bytes)
+        return key, path
+
+    def link(self, key: str, target_path: str):
+        """Hard-links the stored geometry to `target_path`, falling back to a copy."""
+        source = self.path_for(key)
+        if os.path.exists(target_path):
+            if os.path.samefile(source, target_path):
+                return
+            os.remove(target_path)
+        try:
+            os.link(source, target_path)
+        except OSError:
+            shutil.copyfile(source, target_path)
+
+    def get_bytes(self, key: str):
+        """Returns the STL bytes for `key` from memory or disk, or None if it is not stored."""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+        path = self.path_for(key)
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            stl_bytes = f.read()
+        self._remember(key, stl_bytes)
+        return stl_bytes
+
+    def _remember(self, key, stl_bytes):
+        with self._lock:
+            self._memory[key] = stl_bytes
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_limit:
+                self._memory.popitem(last=False)
+
+
+def dedupe_tree(paths, extension=".stl"):
+    """
+    Replaces byte-identical files under `paths` with hard links to a single
+    copy. Returns the number of files that were linked.
+    """
+    first_by_digest = {}
+    linked = 0
+    for base in paths:
+        for dirpath, _, filenames in os.walk(base):
+            for name in sorted(filenames):
+                if not name.endswith(extension):
+                    continue
+                path = os.path.join(dirpath, name)
+                with open(path, "rb") as f:
+                    digest = hashlib.sha256(f.read()).hexdigest()
+                original = first_by_digest.setdefault(digest, path)
+                if original == path or os.path.samefile(original, path):
+                    continue
+                tmp_path = f"{path}.tmp"
+                os.link(original, tmp_path)
+                os.replace(tmp_path, path)
+                linked += 1
+                print(f"  - Linked '{path}' -> '{original}'")
+    return linked
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Deduplicate generated geometry files with hard links.")
+    parser.add_argument("paths", nargs="*", default=["outputs", "io"], help="Directories to scan.")
+    args = parser.parse_args()
+
+    print(f"--- Deduplicating geometry under {args.paths} ---")
+    count = dedupe_tree(args.paths)
+    print(f"--- Done. Replaced {count} duplicate files with hard links. ---")
@@ -0,0 +1,111 @@
+"""
+Import-time budget check for the agent modules and the API pipeline.
+
+Each module is imported in a fresh interpreter with `python -X importtime`.
+The script reports the cumulative import time and whether the import wrote to
+stdout or pulled in heavy packages. It exits non-zero when a module is over
+budget, prints at import, or loads a forbidden package.
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --repeat 5 --output reports/import_time.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Cumulative import budget in milliseconds per module
+IMPORT_BUDGETS_MS = {
+    "agents.calculator_agent": 250,
+    "agents.classification_agent": 250,
+    "agents.database_agent": 400,
+    "agents.fetch_agent": 50,
+    "agents.geometry_agent": 300,
+    "agents.interior_agent": 250,
+    "agents.massing_agent": 300,
+    "agents.parse_agent": 50,
+    "agents.semantic_cache": 250,
+    "agents.sweep_agent": 300,
+    "main_pipeline": 700,
+}
+
+# Packages that must only be imported when they are actually used
+HEAVY_PACKAGES = ["torch", "langchain", "langchain_google_genai", "langchain_community",
+                  "stable_baselines3", "sentence_transformers", "faiss", "fitz", "pytesseract"]
+
+def measure_import(module: str) -> dict:
+    """Imports `module` in a fresh interpreter and returns its timing and side effects."""
+    probe = (
+        f"import sys, json; import {module}; "
+        f"print('__HEAVY__' + json.dumps([p for p in {HEAVY_PACKAGES!r} if p in sys.modules]))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", probe],
+        cwd=PROJECT_ROOT, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        return {"module": module, "error": result.stderr.strip().splitlines()[-1]}
+
+    cumulative_us = None
+    for line in result.stderr.splitlines():
+        # Format: "import time: self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = [p.strip() for p in line[len("import time:"):].split("|")]
+        if parts[2] == module and parts[1].isdigit():
+            cumulative_us = int(parts[1])
+
+    stdout_lines = result.stdout.splitlines()
+    heavy = json.loads(stdout_lines[-1][len("__HEAVY__"):])
+    return {
+        "module": module,
+        "cumulative_ms": round((cumulative_us or 0) / 1000, 2),
+        "stdout_on_import": "\n".join(stdout_lines[:-1]),
+        "heavy_packages": heavy,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Check import-time budgets for agent modules.")
+    parser.add_argument("--repeat", type=int, default=3, help="Imports per module; the fastest run is kept.")
+    parser.add_argument("--output", help="Optional path to write the results as JSON.")
+    args = parser.parse_args()
+
+    results, failures = [], []
+    print(f"{'module':<32} {'import ms':>10} {'budget':>8}  status")
+    for module, budget in IMPORT_BUDGETS_MS.items():
+        runs = [measure_import(module) for _ in range(args.repeat)]
+        errors = [r for r in runs if "error" in r]
+        if errors:
+            failures.append(f"{module}: import failed ({errors[0]['error']})")
+            print(f"{module:<32} {'-':>10} {budget:>8}  ERROR")
+            continue
+
+        best = min(runs, key=lambda r: r["cumulative_ms"])
+        best["budget_ms"] = budget
+        problems = []
+        if best["cumulative_ms"] > budget:
+            problems.append("over budget")
+        if best["stdout_on_import"]:
+            problems.append("prints on import")
+        if best["heavy_packages"]:
+            problems.append(f"imports {', '.join(best['heavy_packages'])}")
+        best["ok"] = not problems
+        results.append(best)
+        failures.extend(f"{module}: {p}" for p in problems)
+        print(f"{module:<32} {best['cumulative_ms']:>10.1f} {budget:>8}  {'ok' if not problems else '; '.join(problems)}")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+
+    if failures:
+        print("\nImport budget check FAILED:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+    print("\nAll modules are within their import budgets.")
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,3 @@
-import json
 import argparse
 import os
 
@@ -6,6 +5,8 @@ from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
 from langchain.docstore.document import Document
 
+from storage import load_rulebook
+
 def create_and_save_vector_store(input_path, output_path):
     """
     Creates a FAISS vector store from a JSON knowledge base and saves it to disk.
@@ -13,8 +14,7 @@ def create_and_save_vector_store(input_path, output_path):
     print(f"--- Creating vector store from '{input_path}' ---")
     
     # 1. Load the knowledge base
-    with open(input_path, 'r', encoding='utf-8') as f:
-        rules_data = json.load(f)
+    rules_data = load_rulebook(input_path)
     print(f"Loaded {len(rules_data)} document chunks.")
 
     # 2. Convert to LangChain Document objects
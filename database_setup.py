@@ -1,5 +1,5 @@
 import sqlalchemy
-from sqlalchemy import create_engine, Column, String, JSON, Text
+from sqlalchemy import create_engine, Column, String, JSON, Text, Integer, DateTime
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
@@ -36,14 +36,24 @@ class Rule(Base):
     notes = Column(Text)
 
 
+# A counter per city (lower-case), bumped by MCPClient on every write to that city's rules.
+# Readers compare it to decide whether a cached rule set is still current.
+class RuleSetVersion(Base):
+    __tablename__ = "rule_set_versions"
+
+    city = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime)
+
+
 # --- 4. Main Execution Block to Create the Database ---
 def create_database():
     """
-    This function creates the database and the 'rules' table if they don't exist.
+    This function creates the database and the 'rules' and 'rule_set_versions' tables if they don't exist.
     """
     print(f"--- Creating database at '{DB_PATH}' ---")
     Base.metadata.create_all(bind=engine)
-    print("--- Database and 'rules' table created successfully. ---")
+    print("--- Database and rule tables created successfully. ---")
 
 
 if __name__ == "__main__":
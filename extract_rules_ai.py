@@ -1,16 +1,17 @@
-import json
 import os
 import argparse
+from datetime import datetime
 from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.prompts import PromptTemplate
-from database_setup import SessionLocal, Rule
-from tqdm import tqdm
+from mcp_client import MCPClient
+from rule_schema import ExtractionParseError, llm_response_schema, parse_rules_json, validate_rules
+from storage import load_json, load_rulebook, save_json
 import concurrent.futures
 
-# --- SETUP & PROMPT (UNCHANGED) ---
-load_dotenv()
-os.environ["GOOGLE_API_KEY"] = os.getenv("GEMINI_API_KEY")
+# --- SETUP & PROMPT ---
+FAILURES_DIR = "outputs/extraction_failures"
+MIN_PAGE_CHARS = 200
+
 EXTRACTION_PROMPT ="""
 You are a hyper-precise AI data analyst. Your sole task is to read a block of unstructured text from a regulatory document and extract any specific, quantifiable rules into a structured JSON format.
 
@@ -21,7 +22,7 @@ You must extract rules into a list of JSON objects, where each object has the fo
 2.  **city**: The city the rule applies to (e.g., "Mumbai").
 3.  **rule_type**: A camel-case category (e.g., "FSI", "Setback", "BuildingHeight").
 4.  **conditions**: A JSON object describing the "IF" part of the rule. Use keys like "road_width_m", "plot_area_sqm", "location_type", "zone". For numerical conditions, use `{{ "min": X, "max": Y }}`.
-5.  **entitlements**: A JSON object describing the "THEN" part of the rule. Use keys like "base_fsi", "total_fsi", "max_height_m", "los_percentage".
+5.  **entitlements**: A JSON object describing the "THEN" part of the rule. Use keys like "base_fsi", "total_fsi", "max_height_m", "los_percentage". If the answer schema has no key for a numeric entitlement (e.g. ground coverage), list it under "extra_entitlements" as {{ "name": "ground_coverage_percentage", "value": 40 }}.
 6.  **notes**: A brief, human-readable summary of the rule.
 
 **Example of a Perfect Output:**
@@ -47,68 +48,124 @@ You must extract rules into a list of JSON objects, where each object has the fo
 * Analyze the <TEXT_BLOCK> provided below.
 * If you find one or more clear, quantifiable rules, extract them into the JSON list format.
 * **If you find NO specific, quantifiable rules, you MUST return an empty list: `[]`**. Do not invent rules.
+* Respond with the JSON list only. Numbers must be JSON numbers, and every range must be `{{ "min": X, "max": Y }}` with X <= Y.
 
 <TEXT_BLOCK>
 {text_chunk}
 </TEXT_BLOCK>
 """
 
-# --- RULE EXTRACTION AGENT (UNCHANGED) ---
+# --- RULE EXTRACTION AGENT ---
+def build_extraction_llm():
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    load_dotenv()
+    os.environ["GOOGLE_API_KEY"] = os.getenv("GEMINI_API_KEY", "")
+    # JSON mode with a schema: the answer is constrained to a list of rules while it is
+    # decoded; validate_rules still checks the values
+    return ChatGoogleGenerativeAI(model="gemini-pro-latest", temperature=0.0, response_mime_type="application/json",
+                                  response_schema=llm_response_schema())
+
 class RuleExtractionAgent:
-    def __init__(self):
-        self.llm = ChatGoogleGenerativeAI(model="gemini-pro-latest", temperature=0.0)
+    def __init__(self, llm=None):
+        self.llm = llm if llm is not None else build_extraction_llm()
         self.prompt = PromptTemplate.from_template(EXTRACTION_PROMPT)
         self.chain = self.prompt | self.llm
     
     def extract_rules_from_text(self, text_chunk: str, city: str):
-        # ... (The logic here is the same) ...
+        """
+        Returns (rules, rejected): the valid rules, and each invalid one with its
+        validation errors. Raises ExtractionParseError if the answer is not a JSON list.
+        """
         response = self.chain.invoke({"text_chunk": text_chunk})
-        try:
-            json_str = response.content.strip()
-            start_index = json_str.find('[')
-            end_index = json_str.rfind(']') + 1
-            if start_index != -1 and end_index != 0:
-                json_str = json_str[start_index:end_index]
-                extracted_data = json.loads(json_str)
-                for rule in extracted_data:
-                    if 'city' not in rule: rule['city'] = city
-                return extracted_data
-            else: return []
-        except (json.JSONDecodeError, TypeError, AttributeError): return []
-
-def process_page(page_data, city_name, agent):
+        content = response.content if isinstance(response.content, str) else str(response.content)
+        return validate_rules(parse_rules_json(content), city)
+
+def process_page(page_data, city_name, agent, max_attempts=2):
+    """
+    Extracts the rules of one OCR'd page. LLM errors and unparseable answers
+    are retried up to `max_attempts` times in all, then reported under "error"
+    instead of being lost. Returns {"page_number", "rules", "rejected", "error", "raw"}.
+    """
+    result = {"page_number": page_data.get("page_number"), "rules": [], "rejected": [], "error": None, "raw": None}
     text_content = page_data.get('content', '')
-    if len(text_content) < 200: return []
-    return agent.extract_rules_from_text(text_content, city_name)
+    if len(text_content) < MIN_PAGE_CHARS: return result
+    for _ in range(max_attempts):
+        try:
+            result["rules"], result["rejected"] = agent.extract_rules_from_text(text_content, city_name)
+            result["error"] = result["raw"] = None
+            break
+        except ExtractionParseError as e:
+            result["error"], result["raw"] = f"parse_error: {e}", e.raw[:2000]
+        except Exception as e:
+            result["error"] = f"llm_error: {type(e).__name__}: {e}"
+    return result
+
+def failures_path(input_path: str, city_name: str) -> str:
+    name = os.path.splitext(os.path.basename(input_path))[0]
+    return os.path.join(FAILURES_DIR, f"{city_name.lower()}_{name}.json")
+
+def save_failures(path: str, input_path: str, city_name: str, page_results):
+    """Records the pages that failed or had invalid rules, for --retry-failed. Returns their number."""
+    failed = [
+        {key: result[key] for key in ("page_number", "error", "raw", "rejected")}
+        for result in page_results if result["error"] or result["rejected"]
+    ]
+    if failed:
+        save_json(path, {"input": input_path, "city": city_name,
+                         "updated_at": datetime.utcnow().isoformat() + "Z", "pages": failed})
+    elif os.path.exists(path):
+        os.remove(path)
+    return len(failed)
 
 # --- MAIN EXECUTION SCRIPT (Now with De-duplication) ---
-def run_extraction_pipeline(input_path: str, city_name: str):
+def run_extraction_pipeline(input_path: str, city_name: str, retry_failed: bool = False, max_attempts: int = 2,
+                            workers: int = 10, agent=None, client=None, failures_file: str = None):
+    """
+    Extracts, validates and commits the rules of a rulebook. Pages whose
+    extraction failed are recorded in outputs/extraction_failures/; with
+    retry_failed, only those pages are sent to the LLM again.
+    """
+    from tqdm import tqdm
+
     print(f"--- Starting HIGH-PERFORMANCE AI Curation for {city_name} ---")
     
-    if not os.path.exists(input_path): raise FileNotFoundError(f"Input file not found: {input_path}.")
-    with open(input_path, 'r', encoding='utf-8') as f: unstructured_data = json.load(f)
-
-    agent = RuleExtractionAgent()
+    # Raises FileNotFoundError if the path is neither a file nor a stored rulebook
+    unstructured_data = load_rulebook(input_path)
+    failures_file = failures_file or failures_path(input_path, city_name)
+    if retry_failed:
+        if not os.path.exists(failures_file):
+            print(f"No recorded failures in {failures_file}; nothing to retry.")
+            return
+        failed_pages = {page["page_number"] for page in load_json(failures_file)["pages"]}
+        unstructured_data = [page for page in unstructured_data if page.get("page_number") in failed_pages]
+        print(f"Retrying {len(unstructured_data)} failed pages from {failures_file}.")
+
+    agent = agent or RuleExtractionAgent()
     all_extracted_rules = []
     
-    with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
         results = list(tqdm(
-            executor.map(lambda page: process_page(page, city_name, agent), unstructured_data),
+            executor.map(lambda page: process_page(page, city_name, agent, max_attempts), unstructured_data),
             total=len(unstructured_data), desc=f"Processing pages for {city_name}"
         ))
 
-    for page_rules in results:
-        if page_rules: all_extracted_rules.extend(page_rules)
+    for page_result in results:
+        all_extracted_rules.extend(page_result["rules"])
     
-    print(f"\nAI extraction complete. Found {len(all_extracted_rules)} potential rules.")
+    failed_pages = sum(1 for result in results if result["error"])
+    rejected_rules = sum(len(result["rejected"]) for result in results)
+    print(f"\nAI extraction complete. Found {len(all_extracted_rules)} valid rules; "
+          f"{rejected_rules} rules failed validation and {failed_pages} pages could not be parsed.")
+    if save_failures(failures_file, input_path, city_name, results):
+        print(f"Failures recorded in {failures_file}. Re-run with --retry-failed to retry only those pages.")
 
     # --- THE CRUCIAL UPGRADE: De-duplicate the results BEFORE hitting the DB ---
     print("De-duplicating extracted rules...")
     unique_rules = {}
     for rule in all_extracted_rules:
-        rule_id = rule.get("id")
-        if rule_id and rule_id not in unique_rules:
-            unique_rules[rule_id] = rule
+        if rule["id"] not in unique_rules:
+            unique_rules[rule["id"]] = rule
     
     final_rules_to_commit = list(unique_rules.values())
     print(f"Found {len(final_rules_to_commit)} unique rules to process.")
@@ -117,38 +174,29 @@ def run_extraction_pipeline(input_path: str, city_name: str):
         print("No new rules to commit.")
         return
 
-    db = SessionLocal()
-    total_rules_committed = 0
+    # Written through the MCP Client, so the city's rule set version (and API caches) are updated
+    owns_client = client is None
+    client = client or MCPClient()
     try:
         print("Committing new unique rules to the database...")
-        for rule_data in tqdm(final_rules_to_commit, desc="Saving to DB"):
-            rule_id = rule_data.get("id")
-            existing_rule = db.query(Rule).filter(Rule.id == rule_id).first()
-            if existing_rule: continue
-
-            required_keys = ["id", "city", "rule_type", "conditions", "entitlements", "notes"]
-            if not all(key in rule_data for key in required_keys): continue
-            
-            new_rule = Rule(**rule_data)
-            db.add(new_rule)
-            total_rules_committed += 1
-        
-        db.commit()
+        total_rules_committed, _ = client.upsert_rules(final_rules_to_commit, update_existing=False)
         print(f"Commit successful. Added {total_rules_committed} new rules.")
     except Exception as e:
         print(f"\n!!! An error occurred: {e}")
-        db.rollback()
     finally:
-        db.close()
-        print("Database session closed.")
+        if owns_client:
+            client.close()
+            print("Database session closed.")
     print(f"\n--- Curation Complete for {city_name} ---")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Extract rules and load them into the database.")
     parser.add_argument("--input", required=True, help="Path to the OCR'd JSON file.")
     parser.add_argument("--city", required=True, help="The name of the city for these rules.")
+    parser.add_argument("--retry-failed", action="store_true", help="Only re-run the pages recorded as failed by the last run.")
+    parser.add_argument("--attempts", type=int, default=2, help="LLM calls per page before it is recorded as failed.")
+    parser.add_argument("--workers", type=int, default=10, help="Pages processed in parallel.")
     
     args = parser.parse_args()
-    run_extraction_pipeline(args.input, args.city)
-
-
+    run_extraction_pipeline(args.input, args.city, retry_failed=args.retry_failed,
+                            max_attempts=args.attempts, workers=args.workers)
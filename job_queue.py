@@ -0,0 +1,289 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from logging_config import logger
+
+JOB_QUEUE_PATH = os.path.join("outputs", "jobs.sqlite")
+# A claimed job whose worker has not finished it within the lease is handed to another worker
+DEFAULT_LEASE_SECONDS = 900
+DEFAULT_MAX_ATTEMPTS = 3
+# Longest wait between claims while the queue database keeps failing (e.g. locked by other processes)
+MAX_CLAIM_BACKOFF_SECONDS = 30
+
+def _now() -> float:
+    return time.time()
+
+def _iso(timestamp):
+    return datetime.utcfromtimestamp(timestamp).isoformat() + "Z" if timestamp else None
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+class JobQueue:
+    """
+    A persistent job queue in SQLite. Jobs are claimed by priority (highest
+    first); among equal priorities, the project with the fewest running jobs
+    and then the one served least recently goes next, so one project's burst
+    cannot starve the others. Claims are atomic across threads and processes.
+    A job left running by a worker that died is queued again, either at
+    startup (recover) or when its lease expires.
+    """
+    def __init__(self, path: str = JOB_QUEUE_PATH, lease_seconds: float = DEFAULT_LEASE_SECONDS,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Autocommit mode, so every write transaction is opened explicitly with BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, seq INTEGER, project_id TEXT, case_id TEXT, priority INTEGER, status TEXT, "
+                "payload TEXT, result TEXT, error TEXT, attempts INTEGER DEFAULT 0, owner TEXT, lease_expires REAL, "
+                "created_at REAL, started_at REAL, finished_at REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, priority DESC, seq)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS project_turns (project_id TEXT PRIMARY KEY, last_served INTEGER, running INTEGER)"
+            )
+
+    def _write(self, fn):
+        """Runs fn(conn) in one immediate (write-locked) transaction."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._conn)
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    def submit(self, case_data: dict, priority: int = 0) -> str:
+        job_id = uuid.uuid4().hex
+        project_id = case_data.get("project_id", "default_project")
+
+        def insert(conn):
+            seq = conn.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM jobs").fetchone()[0]
+            conn.execute(
+                "INSERT INTO jobs (id, seq, project_id, case_id, priority, status, payload, created_at) "
+                "VALUES (?, ?, ?, ?, ?, 'queued', ?, ?)",
+                (job_id, seq, project_id, case_data.get("case_id"), priority, json.dumps(case_data), _now())
+            )
+        self._write(insert)
+        return job_id
+
+    def claim(self):
+        """Marks the next job as running and returns (job_id, case_data), or None if nothing is queued."""
+        def pick(conn):
+            now = _now()
+            # Jobs whose lease ran out are claimable again (their worker is gone or hung)
+            expired = conn.execute(
+                "SELECT id, project_id, attempts FROM jobs WHERE status = 'running' AND lease_expires < ?", (now,)
+            ).fetchall()
+            for job_id, project_id, attempts in expired:
+                self._retry_or_fail(conn, job_id, project_id, attempts, "Lease expired")
+            row = conn.execute(
+                "SELECT j.id, j.project_id, j.payload FROM jobs j "
+                "LEFT JOIN project_turns t ON t.project_id = j.project_id "
+                "WHERE j.status = 'queued' "
+                "ORDER BY j.priority DESC, COALESCE(t.running, 0), COALESCE(t.last_served, 0), j.seq LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            job_id, project_id, payload = row
+            conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, owner = ?, lease_expires = ?, "
+                "started_at = ? WHERE id = ?",
+                (self.owner, now + self.lease_seconds, now, job_id)
+            )
+            turn = conn.execute("SELECT COALESCE(MAX(last_served), 0) + 1 FROM project_turns").fetchone()[0]
+            conn.execute(
+                "INSERT INTO project_turns VALUES (?, ?, 1) ON CONFLICT(project_id) "
+                "DO UPDATE SET last_served = excluded.last_served, running = running + 1",
+                (project_id, turn)
+            )
+            return job_id, json.loads(payload)
+        return self._write(pick)
+
+    def _finish(self, job_id: str, status: str, result=None, error=None):
+        def update(conn):
+            row = conn.execute("SELECT project_id FROM jobs WHERE id = ? AND status = 'running'", (job_id,)).fetchone()
+            if row is None:
+                # Already finished, or requeued after its lease expired
+                return
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, lease_expires = NULL WHERE id = ?",
+                (status, json.dumps(result) if result is not None else None, error, _now(), job_id)
+            )
+            conn.execute("UPDATE project_turns SET running = MAX(running - 1, 0) WHERE project_id = ?", (row[0],))
+        self._write(update)
+
+    def complete(self, job_id: str, result):
+        self._finish(job_id, "done", result=result)
+
+    def fail(self, job_id: str, error: str):
+        """Queues the job again, or marks it failed after max_attempts."""
+        def update(conn):
+            row = conn.execute(
+                "SELECT project_id, attempts FROM jobs WHERE id = ? AND status = 'running'", (job_id,)
+            ).fetchone()
+            if row is None:
+                return
+            self._retry_or_fail(conn, job_id, row[0], row[1], error)
+        self._write(update)
+
+    def _retry_or_fail(self, conn, job_id, project_id, attempts, error):
+        if attempts < self.max_attempts:
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', error = ?, owner = NULL, lease_expires = NULL WHERE id = ?",
+                (error, job_id)
+            )
+        else:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished_at = ?, lease_expires = NULL WHERE id = ?",
+                (error, _now(), job_id)
+            )
+        conn.execute("UPDATE project_turns SET running = MAX(running - 1, 0) WHERE project_id = ?", (project_id,))
+
+    def recover(self) -> int:
+        """
+        Queues again (or fails) the running jobs of dead processes on this host, e.g. after
+        a server restart. Jobs of live workers (other server processes) are kept.
+        """
+        host = socket.gethostname()
+
+        def update(conn):
+            orphaned = []
+            for job_id, project_id, attempts, owner in conn.execute(
+                "SELECT id, project_id, attempts, owner FROM jobs WHERE status = 'running'"
+            ).fetchall():
+                owner_host, _, pid = (owner or "").rpartition(":")
+                # Our own pid can only come from an earlier process (e.g. PID 1 in a restarted container)
+                if owner_host == host and pid.isdigit() and (owner == self.owner or not _pid_alive(int(pid))):
+                    orphaned.append((job_id, project_id, attempts))
+            for job_id, project_id, attempts in orphaned:
+                self._retry_or_fail(conn, job_id, project_id, attempts, "Worker process exited")
+            return len(orphaned)
+        return self._write(update)
+
+    def get(self, job_id: str):
+        """The job's status and, once done, its result; None for an unknown id."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, project_id, case_id, priority, status, result, error, attempts, created_at, "
+                "started_at, finished_at, seq FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            ahead = None
+            if row[4] == "queued":
+                ahead = self._conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND (priority > ? OR (priority = ? AND seq < ?))",
+                    (row[3], row[3], row[11])
+                ).fetchone()[0]
+        return {
+            "job_id": row[0], "project_id": row[1], "case_id": row[2], "priority": row[3], "status": row[4],
+            "result": json.loads(row[5]) if row[5] else None, "error": row[6], "attempts": row[7],
+            "created_at": _iso(row[8]), "started_at": _iso(row[9]), "finished_at": _iso(row[10]),
+            "jobs_ahead": ahead,
+        }
+
+    def counts(self) -> dict:
+        with self._lock:
+            return dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    def close(self):
+        self._conn.close()
+
+class JobWorkerPool:
+    """
+    Threads that claim jobs from a JobQueue and run `handler(case_data)` on
+    them; the handler's return value is stored as the job's result.
+    """
+    def __init__(self, queue: JobQueue, handler, concurrency: int = 2, poll_interval: float = 0.5):
+        self.queue = queue
+        self.handler = handler
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+
+    def start(self):
+        recovered = self.queue.recover()
+        if recovered:
+            logger.info(f"Re-queued {recovered} jobs left running by a previous server process.")
+        for i in range(self.concurrency):
+            thread = threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def notify(self):
+        """Wakes an idle worker, e.g. right after a job is submitted in this process."""
+        self._wakeup.set()
+
+    def _run(self):
+        backoff = self.poll_interval
+        while not self._stopping.is_set():
+            try:
+                claimed = self.queue.claim()
+            except Exception as e:
+                # e.g. "database is locked" while other serve.py workers write; the thread must survive it
+                logger.error(f"Could not claim a job, retrying in {backoff:.1f}s: {e}", exc_info=True)
+                self._stopping.wait(backoff)
+                backoff = min(backoff * 2, MAX_CLAIM_BACKOFF_SECONDS)
+                continue
+            backoff = self.poll_interval
+            if claimed is None:
+                # Jobs submitted by other processes are picked up on the next poll
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self._process(*claimed)
+
+    def _process(self, job_id: str, case_data: dict):
+        """Runs one claimed job and records its outcome. Never raises."""
+        try:
+            result = self.handler(case_data)
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {e}", exc_info=True)
+            self._fail(job_id, str(e))
+            return
+        try:
+            self.queue.complete(job_id, result)
+        except Exception as e:
+            # e.g. a result that is not JSON-serializable; otherwise the job would stay running until its lease expires
+            logger.error(f"Could not store the result of job {job_id}: {e}", exc_info=True)
+            self._fail(job_id, f"Could not store the result: {e}")
+
+    def _fail(self, job_id: str, error: str):
+        try:
+            self.queue.fail(job_id, error)
+        except Exception as e:
+            # Left running: the job is retried once its lease expires
+            logger.error(f"Could not record the failure of job {job_id}: {e}", exc_info=True)
+
+    def stop(self, timeout: float = 5.0):
+        """Stops claiming new jobs and waits briefly for running ones; unfinished jobs are recovered later."""
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
@@ -1,19 +1,38 @@
 import json
 import os
 import uvicorn
-from fastapi import FastAPI, HTTPException, Response
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+from pydantic import BaseModel, Field, field_validator
 from dotenv import load_dotenv
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from datetime import datetime
 import uuid
+import hashlib
+import signal
+import sys
+import threading
+import time
+import anyio.to_thread
 
 # --- Import our logger, the NEW MCP Client, and the pipeline logic ---
 from logging_config import logger
 from mcp_client import MCPClient
-from main_pipeline import process_case_logic
-from database_setup import Rule
+import main_pipeline
+from main_pipeline import process_case_logic, stream_case_logic, get_recent_geometry, geometry_store
+from database_setup import Rule, engine
+from agents.sweep_agent import DesignSpaceSweepAgent
+from timing import stage_snapshot
+from job_queue import JobQueue, JobWorkerPool
+from singleflight import FileLocks, SingleFlight, case_key
+from admission import AdmissionController, AdmissionRejected
+from report_index import ReportIndex, SUMMARY_FIELDS
+import metrics
+import storage
+from rl_env.policy_registry import current_checkpoint
+from rl_env.distilled_policy import DistilledPolicy, DISTILLED_POLICY_PATH
 
 # --- 1. Create the FastAPI App ---
 app = FastAPI(
@@ -30,11 +49,83 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# --- 2b. Request Metrics ---
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    metrics.HTTP_REQUESTS_IN_PROGRESS.inc()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        metrics.HTTP_REQUESTS_IN_PROGRESS.dec()
+        # Label by route template (e.g. /logs/{case_id}) to keep the number of series bounded
+        route = request.scope.get("route")
+        route_path = route.path if route is not None else "unmatched"
+        metrics.HTTP_REQUESTS.inc(method=request.method, route=route_path, status=status)
+        metrics.HTTP_REQUEST_DURATION.observe(time.perf_counter() - start, method=request.method, route=route_path)
+
+def db_pool_stats():
+    pool = engine.pool
+    stats = {}
+    for name in ("size", "checkedout", "overflow", "checkedin"):
+        if hasattr(pool, name):
+            stats[(name,)] = getattr(pool, name)()
+    return stats
+
+metrics.REGISTRY.register(metrics.Gauge(
+    "db_pool_connections", "SQLAlchemy connection pool state (size, checkedout, overflow, checkedin).", ["state"],
+    callback=db_pool_stats))
+metrics.register_cache("geometry_store", geometry_store)
+THREADPOOL_THREADS = metrics.REGISTRY.register(metrics.Gauge(
+    "threadpool_threads", "Worker threads that run the sync endpoints (busy and total).", ["state"]))
+COALESCED_CASES = metrics.REGISTRY.register(metrics.Counter(
+    "coalesced_cases_total", "Case runs answered by joining an identical in-flight run instead of running again."))
+ADMISSION_REJECTIONS = metrics.REGISTRY.register(metrics.Counter(
+    "admission_rejections_total", "Requests rejected with 429, by reason.", ["reason"]))
+
+# --- 2c. Admission Control for the LLM-backed endpoints ---
+# Read endpoints are not limited; /run_case and /run_case/stream hold a slot while they run
+admission = AdmissionController.from_env()
+metrics.REGISTRY.register(metrics.Gauge(
+    "admission_slots", "LLM-backed requests running and waiting for a slot.", ["state"],
+    callback=lambda: {("active",): admission.limiter.active, ("queued",): admission.limiter.queued}))
+
+# Responses smaller than this are not worth compressing
+GZIP_MIN_BYTES = 1024
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """True when the request's If-None-Match lists the ETag (or is *)."""
+    if_none_match = [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]
+    return etag in if_none_match or "*" in if_none_match
+
+def client_id(request: Request) -> str:
+    """The caller to rate-limit: the X-Client-Id header if sent, else the client's address."""
+    return request.headers.get("x-client-id") or (request.client.host if request.client else "unknown")
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    ADMISSION_REJECTIONS.inc(reason=exc.reason)
+    logger.warning(f"Rejected {request.url.path} from {client_id(request)}: {exc.reason}.")
+    return JSONResponse(status_code=429, content={"detail": exc.detail}, headers={"Retry-After": str(exc.retry_after)})
+
 # --- 3. Data Models for API (The "Contract") ---
 class CaseParameters(BaseModel):
     plot_size: int
     location: str
     road_width: int
+    # Optional plot boundary as [[x, y], ...] in metres; defaults to a square plot of plot_size
+    plot_polygon: Optional[List[List[float]]] = None
+
+    @field_validator("plot_polygon")
+    @classmethod
+    def _rectangular_plot(cls, plot_polygon):
+        if plot_polygon is not None:
+            # Raises ValueError for shapes the massing engine cannot apply setbacks to
+            main_pipeline.massing_agent.plot_rectangle(plot_polygon=plot_polygon)
+        return plot_polygon
 
 class CaseInput(BaseModel):
     project_id: str
@@ -42,6 +133,22 @@ class CaseInput(BaseModel):
     city: str
     document: str
     parameters: CaseParameters
+    # When true, the response includes per-stage timings under "debug"
+    debug: bool = False
+    # full: with the LLM narrative; deterministic: no LLM call; deferred: answer at once
+    # without the narrative and fill it in from a background job
+    mode: str = Field("full", pattern="^(full|deterministic|deferred)$")
+
+class SweepInput(BaseModel):
+    city: str
+    plot_sizes: List[float] = Field(min_length=1)
+    road_widths: List[float] = Field(min_length=1)
+    # Optional FSI values to sweep instead of the FSI found in the city's rules
+    fsi_values: Optional[List[float]] = Field(None, min_length=1)
+    setback_area: float = 150
+    explain: bool = False
+
+MAX_SWEEP_POINTS = 1_000_000
 
 class FeedbackInput(BaseModel):
     project_id: str
@@ -54,25 +161,150 @@ class SystemState:
         self.mcp_client: MCPClient = None
         self.llm = None
         self.rl_agent = None
+        self.rl_agent_version = None
+        # Serializes policy reloads; requests read state.rl_agent without taking it
+        self.rl_agent_lock = threading.Lock()
+        # The serve.py master when running as one of its workers, which reloads all of them
+        self.master_pid = None
+        # Persistent queue for POST /jobs and the worker threads that drain it
+        self.job_queue: JobQueue = None
+        self.job_workers: JobWorkerPool = None
         # The other agents are now stateless and will be created in the pipeline
         self.is_initialized = False
 
 state = SystemState()
 
+# Identical cases that arrive while one is running share its result: within this
+# process through case_flights, across serve.py workers through case_locks
+case_flights = SingleFlight()
+case_locks = FileLocks(os.getenv("CASE_LOCK_DIR", "outputs/locks"))
+
+def run_case_coalesced(case_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Runs the pipeline for a case, unless an identical case (same project, case id
+    and inputs) is already running: then waits for that run and returns its report.
+    This avoids a second LLM call and two writers on the same report and STL files.
+    """
+    key = case_key(case_data)
+    report, shared = case_flights.do(key, lambda: run_case_locked(key, case_data))
+    if shared:
+        COALESCED_CASES.inc()
+        logger.info(f"Case {case_data.get('case_id')} joined an identical in-flight run.")
+    return report
+
+def run_case_locked(key: str, case_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Runs the case while holding its cross-process lock. If another worker held the
+    lock, a full run that saved the case's report while this one waited is reused.
+    """
+    with case_locks.hold(key) as waited_since:
+        if waited_since is not None and (case_data.get("mode") or "full") == "full":
+            project_id, case_id = case_data.get("project_id", "default_project"), case_data.get("case_id")
+            modified_at = storage.report_modified_at(project_id, case_id)
+            report = storage.load_report(project_id, case_id) if modified_at and modified_at >= waited_since else None
+            if (main_pipeline.has_complete_analysis(report) and report.get("city") == case_data.get("city")
+                    and report.get("inputs") == case_data.get("parameters", {})):
+                COALESCED_CASES.inc()
+                logger.info(f"Case {case_id} joined an identical run in another worker.")
+                return report
+        return process_case_logic(case_data, state)
+
+# Compiled sweep agents keyed by (city, rule set version), so /sweep only compiles a city's rules once per version
+sweep_agents: Dict[tuple, DesignSpaceSweepAgent] = {}
+sweep_agents_lock = threading.Lock()
+
+def get_sweep_agent(mcp_client: MCPClient, city: str) -> DesignSpaceSweepAgent:
+    """Returns the sweep agent compiled from the city's current rules, building it on the first call."""
+    key = (city.lower(), mcp_client.rule_set_version(city))
+    agent = sweep_agents.get(key)
+    if agent is None:
+        agent = DesignSpaceSweepAgent(mcp_client.get_rules(city))
+        with sweep_agents_lock:
+            # Older versions of the city are never asked for again
+            for stale in [k for k in sweep_agents if k[0] == key[0]]:
+                del sweep_agents[stale]
+            sweep_agents[key] = agent
+    return agent
+
+def warm_rules_caches(mcp_client: MCPClient):
+    """Builds the rules snapshot and the compiled sweep agent of every city."""
+    for city in mcp_client.cities():
+        mcp_client.get_rules_snapshot(city)
+        get_sweep_agent(mcp_client, city)
+    # The warm-up is not a request: the exported hit rate starts from zero
+    mcp_client.hits = mcp_client.misses = 0
+
+def set_torch_threads():
+    import torch
+    # One intra-op thread per worker: the workers already use every core
+    torch.set_num_threads(int(os.getenv("TORCH_THREADS", "1")))
+
+def load_rl_agent():
+    """
+    Loads the RL policy to serve and returns (agent, version). RL_POLICY=distilled serves
+    the torch-free lookup grid from RL_DISTILLED_PATH; otherwise the current PPO checkpoint.
+    """
+    if os.getenv("RL_POLICY", "ppo") == "distilled":
+        policy = DistilledPolicy.load(os.getenv("RL_DISTILLED_PATH", DISTILLED_POLICY_PATH))
+        return policy, policy.source_version
+    from stable_baselines3 import PPO
+
+    checkpoint = current_checkpoint()
+    return PPO.load(checkpoint["path"]), checkpoint["version"]
+
+def preload_shared_state():
+    """
+    Loads the read-only state every worker shares. serve.py calls this once in the
+    master process before forking (and again on SIGHUP), so the policy weights,
+    rules snapshots and compiled sweep tables are copy-on-write shared pages
+    instead of one copy per worker; startup_event then skips what is loaded.
+    """
+    if os.getenv("RL_POLICY", "ppo") != "distilled":
+        # Before any torch op, so the master never starts a thread pool the workers would inherit
+        set_torch_threads()
+    state.rl_agent, state.rl_agent_version = load_rl_agent()
+    state.mcp_client = MCPClient()
+    warm_rules_caches(state.mcp_client)
+    # The master keeps no database session or connection across the fork
+    state.mcp_client.db.remove()
+    engine.dispose()
+    # Heavy imports used on every request, so workers do not each import them
+    from langchain.prompts import PromptTemplate  # noqa: F401
+
+def after_fork():
+    """Runs in each serve.py worker right after fork: connections are not shared across processes."""
+    state.master_pid = os.getppid()
+    if "torch" in sys.modules:
+        # Thread settings are per process; re-applied so no worker runs with the default pool size
+        set_torch_threads()
+    # Pooled connections belong to the master; the worker opens its own
+    engine.dispose(close=False)
+    inherited = main_pipeline.report_index
+    main_pipeline.report_index = ReportIndex(inherited.path, inherited.projects_dir)
+
 # --- 5. Server Startup & Shutdown Events ---
 @app.on_event("startup")
 def startup_event():
     """This function runs ONCE when the server starts up to initialize the MCP client and models."""
     logger.info("Server starting up... Initializing MCP Client and AI models.")
     from langchain_google_genai import ChatGoogleGenerativeAI
-    from stable_baselines3 import PPO
 
     load_dotenv()
     os.environ["GOOGLE_API_KEY"] = os.getenv("GEMINI_API_KEY")
 
-    state.mcp_client = MCPClient()
+    if state.mcp_client is None:
+        state.mcp_client = MCPClient()
+    metrics.register_cache("rules_snapshot", state.mcp_client)
     state.llm = ChatGoogleGenerativeAI(model="gemini-pro-latest")
-    state.rl_agent = PPO.load("rl_env/ppo_hirl_agent.zip")
+    if state.rl_agent is None:
+        state.rl_agent, state.rl_agent_version = load_rl_agent()
+
+    state.job_queue = JobQueue()
+    state.job_workers = JobWorkerPool(
+        state.job_queue, run_case_coalesced,
+        concurrency=int(os.getenv("JOB_WORKERS", "2"))
+    )
+    state.job_workers.start()
     
     state.is_initialized = True
     logger.info("All components and MCP Client initialized successfully. Server is ready.")
@@ -80,33 +312,205 @@ def startup_event():
 @app.on_event("shutdown")
 def shutdown_event():
     """This function runs ONCE when the server shuts down to close connections."""
+    if state.job_workers:
+        state.job_workers.stop()
     if state.mcp_client:
         state.mcp_client.close()
 
 # --- 6. API Endpoints ---
+@app.get("/health/live", summary="Liveness of this worker process")
+def health_live():
+    return {"status": "alive", "pid": os.getpid()}
+
+@app.get("/health/ready", summary="Readiness of this worker process")
+def health_ready():
+    if not state.is_initialized:
+        return JSONResponse(status_code=503, content={"status": "initializing", "pid": os.getpid()})
+    return {"status": "ready", "pid": os.getpid(), "rl_agent_version": state.rl_agent_version}
+
+# Deferred narratives run after the interactive jobs
+NARRATIVE_JOB_PRIORITY = -1
+
+def enqueue_case(case_data: Dict[str, Any], priority: int = 0) -> str:
+    job_id = state.job_queue.submit(case_data, priority=priority)
+    if state.job_workers:
+        state.job_workers.notify()
+    logger.info(f"Queued job {job_id} for case {case_data.get('case_id')}.")
+    return job_id
+
+async def run_pipeline(case_data: Dict[str, Any]) -> Dict[str, Any]:
+    try:
+        return await run_in_threadpool(run_case_coalesced, case_data)
+    except Exception as e:
+        logger.error(f"Error in /run_case: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/run_case", summary="Run the full compliance pipeline for a single case")
-def run_case_endpoint(case_input: CaseInput):
+async def run_case_endpoint(case_input: CaseInput, request: Request):
     if not state.is_initialized:
         raise HTTPException(status_code=503, detail="System is initializing. Please try again.")
+    case_data = case_input.dict()
+    if case_input.mode == "full":
+        # Wait for a slot on the event loop, so queued requests do not hold worker threads
+        async with admission.admit(client_id(request), case_input.project_id):
+            return await run_pipeline(case_data)
+
+    # No LLM call in this request, so only the rate limits apply
+    if case_input.mode == "deferred" and state.job_queue is None:
+        raise HTTPException(status_code=503, detail="Background jobs are not available.")
+    admission.check_rate(client_id(request), case_input.project_id)
+    report = await run_pipeline(case_data)
+    if case_input.mode == "deferred":
+        # A full run of the same case rewrites the saved report with the narrative
+        job_id = enqueue_case({**case_data, "mode": "full", "debug": False}, priority=NARRATIVE_JOB_PRIORITY)
+        report = {**report, "narrative_job": {"job_id": job_id, "status_url": f"/jobs/{job_id}",
+                                              "report_url": f"/projects/{case_input.project_id}/cases/{case_input.case_id}"}}
+    return report
+
+@app.post("/jobs", status_code=202, summary="Queue a case to run in the background")
+def submit_job(case_input: CaseInput, request: Request, response: Response, priority: int = Query(0, ge=-10, le=10)):
+    """
+    Queues the case and returns at once with its job id; poll GET /jobs/{job_id}
+    for the result. Higher priorities run first. Queued jobs survive a restart.
+    """
+    if not state.is_initialized or state.job_queue is None:
+        raise HTTPException(status_code=503, detail="System is initializing. Please try again.")
+    # Rate limits only: the job workers already bound how many cases run at once
+    admission.check_rate(client_id(request), case_input.project_id)
+    case_data = case_input.dict()
+    if case_data["mode"] == "deferred":
+        # A job is already asynchronous, so its narrative is simply part of the run
+        case_data["mode"] = "full"
+    job_id = enqueue_case(case_data, priority=priority)
+    response.headers["Location"] = f"/jobs/{job_id}"
+    return {"job_id": job_id, "status": "queued", "status_url": f"/jobs/{job_id}"}
+
+@app.get("/jobs/{job_id}", summary="Get the status, and once done the result, of a queued case")
+def get_job(job_id: str) -> Dict[str, Any]:
+    if state.job_queue is None:
+        raise HTTPException(status_code=503, detail="System is initializing. Please try again.")
+    job = state.job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
+
+def sse_event(event: str, data) -> str:
+    """One Server-Sent Event; the data is JSON so multi-line text survives the framing."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """
+    Holds an admission slot until the response is done, however it ends: sent in full,
+    failed, or abandoned by a client that disconnected before the body was iterated
+    (then the body generator never runs, so it cannot release the slot itself).
+    """
+    def __init__(self, content, acquired_at: float, **kwargs):
+        super().__init__(content, **kwargs)
+        self.acquired_at = acquired_at
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            admission.release(self.acquired_at)
+
+@app.post("/run_case/stream", summary="Run the pipeline, streaming results as Server-Sent Events")
+async def run_case_stream_endpoint(case_input: CaseInput, request: Request):
+    """
+    Sends a `deterministic` event with the report minus the LLM analysis (rules,
+    carpet area, RL decision, massing and geometry URL) as soon as it is ready,
+    then one `token` event per piece of LLM text, then the complete `report`.
+    A failure after the stream has started is sent as an `error` event.
+    """
+    if not state.is_initialized:
+        raise HTTPException(status_code=503, detail="System is initializing. Please try again.")
+    if case_input.mode == "deferred":
+        raise HTTPException(status_code=400, detail="Streaming supports the full and deterministic modes.")
+    case_data = case_input.dict()
+    # The slot is held until the response ends, including when the client disconnects
+    acquired_at = await admission.acquire(client_id(request), case_input.project_id)
+
+    def pipeline_events():
+        try:
+            for event, data in stream_case_logic(case_data, state):
+                yield sse_event(event, data)
+        except Exception as e:
+            logger.error(f"Error in /run_case/stream: {e}", exc_info=True)
+            yield sse_event("error", {"detail": str(e)})
+
+    # Each pipeline step runs in the thread pool, like a sync endpoint. No proxy
+    # buffering, so each event reaches the client as soon as it is produced.
+    return AdmittedStreamingResponse(iterate_in_threadpool(pipeline_events()), acquired_at,
+                                     media_type="text/event-stream",
+                                     headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.post("/sweep", summary="Evaluate a grid of design parameters against a city's rules in one call")
+def sweep_endpoint(sweep_input: SweepInput) -> Dict[str, Any]:
+    if not state.is_initialized:
+        raise HTTPException(status_code=503, detail="System is initializing.")
+    # Without fsi_values the FSI axis is the single rule FSI of each point
+    fsi_count = 1 if sweep_input.fsi_values is None else len(sweep_input.fsi_values)
+    grid_size = len(sweep_input.plot_sizes) * len(sweep_input.road_widths) * fsi_count
+    if grid_size > MAX_SWEEP_POINTS:
+        raise HTTPException(status_code=400, detail=f"Sweep grid has {grid_size} points; the limit is {MAX_SWEEP_POINTS}.")
     try:
-        return process_case_logic(case_input.dict(), state)
+        sweep_agent = get_sweep_agent(state.mcp_client, sweep_input.city)
+        columns = sweep_agent.sweep(
+            sweep_input.plot_sizes, sweep_input.road_widths, sweep_input.fsi_values,
+            setback_area=sweep_input.setback_area, explain=sweep_input.explain
+        )
+        return {"city": sweep_input.city, "points": grid_size, "columns": {k: v.tolist() for k, v in columns.items()}}
     except Exception as e:
-        logger.error(f"Error in /run_case: {e}", exc_info=True)
+        logger.error(f"Error in /sweep: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+def load_case_report(project_id: str, case_id: str) -> Optional[Dict[str, Any]]:
+    """Returns the saved report of a processed case, or None if there is none."""
+    return storage.load_report(project_id, case_id)
+
 @app.post("/feedback", summary="Submit feedback for a processed case")
 def feedback_endpoint(feedback: FeedbackInput):
     if not state.is_initialized:
         raise HTTPException(status_code=503, detail="System is initializing.")
     try:
+        # Attach the case's inputs and report so the feedback can be used for RL fine-tuning
+        feedback_data = feedback.dict()
+        report = load_case_report(feedback.project_id, feedback.case_id)
+        if report:
+            feedback_data["input_case"] = {"case_id": report.get("case_id"), "city": report.get("city"), "parameters": report.get("inputs")}
+            feedback_data["output_report"] = report
         # Correctly use the MCP Client to handle feedback
-        feedback_record = state.mcp_client.add_feedback(feedback.dict())
+        feedback_record = state.mcp_client.add_feedback(feedback_data)
         logger.info(f"Feedback saved via MCP for case {feedback.case_id}")
         return {"status": "success", "feedback_id": feedback_record["feedback_id"]}
     except Exception as e:
         logger.error(f"Error in /feedback: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Could not save feedback.")
 
+@app.post("/rl_agent/reload", summary="Hot-swap the RL agent to the current checkpoint or distilled policy")
+def reload_rl_agent():
+    if not state.is_initialized:
+        raise HTTPException(status_code=503, detail="System is initializing.")
+    if state.master_pid:
+        # Under serve.py, reloading only this worker would leave the others on the old
+        # policy: the master reloads it once and replaces every worker instead
+        os.kill(state.master_pid, signal.SIGHUP)
+        logger.info(f"RL agent reload forwarded to the serve.py master ({state.master_pid}).")
+        return {"status": "reloading", "previous_version": state.rl_agent_version}
+    with state.rl_agent_lock:
+        try:
+            # Load fully before swapping; in-flight requests keep the agent they started with
+            new_agent, version = load_rl_agent()
+        except Exception as e:
+            logger.error(f"Could not load the RL policy: {e}", exc_info=True)
+            raise HTTPException(status_code=500, detail="Could not load the RL policy.")
+        if version == state.rl_agent_version:
+            return {"status": "unchanged", "version": version}
+        previous_version = state.rl_agent_version
+        state.rl_agent, state.rl_agent_version = new_agent, version
+    logger.info(f"RL agent hot-swapped from version {previous_version} to {version}.")
+    return {"status": "reloaded", "previous_version": previous_version, "version": version}
+
 @app.get("/logs/{case_id}", summary="Get all agent logs for a specific case_id")
 def logs_endpoint(case_id: str) -> List[Dict[str, Any]]:
     log_file = "reports/agent_log.jsonl"
@@ -117,40 +521,85 @@ def logs_endpoint(case_id: str) -> List[Dict[str, Any]]:
         with open(log_file, 'r') as f:
             for line in f:
                 log_entry = json.loads(line)
-                log_case_data = log_entry.get('extra_data', {}).get('case', {})
+                # The JSON formatter merges extra_data into the record; older lines may nest it
+                log_case_data = log_entry.get('case') or log_entry.get('extra_data', {}).get('case', {})
                 if log_case_data and log_case_data.get('case_id') == case_id:
                     case_logs.append(log_entry)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error reading log file: {e}")
     return case_logs
 
+@app.get("/metrics", summary="Runtime metrics in the Prometheus text format")
+async def metrics_endpoint():
+    # Sync endpoints run on AnyIO's worker thread pool; its saturation is read here, on the event loop
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    THREADPOOL_THREADS.set(limiter.borrowed_tokens, state="busy")
+    THREADPOOL_THREADS.set(limiter.total_tokens, state="total")
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/debug/timings", summary="Latency histograms of each pipeline stage since the server started")
+def debug_timings() -> Dict[str, Any]:
+    return stage_snapshot()
+
 # --- 7. Endpoints for AI Design Platform Bridge ---
 
 @app.get("/get_rules", summary="Fetches parsed rule JSON for a given city")
-def get_rules(city: str) -> List[Dict[str, Any]]:
+def get_rules(city: str, request: Request, rule_type: Optional[str] = None):
+    """
+    The city's rules, optionally only those of one rule_type. Responses carry an
+    ETag and the city's rule set version (X-Rule-Set-Version); pollers that send
+    If-None-Match get 304 until the rules change. Gzip is used when accepted.
+    """
     if not state.is_initialized:
         raise HTTPException(status_code=503, detail="System is initializing.")
     try:
-        # Use the MCP Client to query rules
-        rules_from_db = state.mcp_client.db.query(Rule).filter(Rule.city.ilike(city)).all()
-        # Correctly create a clean list of dictionaries
-        return [
-            {
-                "id": rule.id, "city": rule.city, "rule_type": rule.rule_type,
-                "conditions": rule.conditions, "entitlements": rule.entitlements,
-                "notes": rule.notes
-            } for rule in rules_from_db
-        ]
+        # Served from the MCP Client's cache of serialized rule sets, keyed by version
+        snapshot = state.mcp_client.get_rules_snapshot(city, rule_type)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Could not fetch rules: {e}")
+    headers = {
+        "ETag": snapshot["etag"],
+        "X-Rule-Set-Version": str(snapshot["version"]),
+        # Clients may keep the response but must revalidate it, which is a cheap 304
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding",
+    }
+    if etag_matches(request, snapshot["etag"]):
+        return Response(status_code=304, headers=headers)
+    if "gzip" in request.headers.get("accept-encoding", "") and len(snapshot["body"]) > GZIP_MIN_BYTES:
+        return Response(content=snapshot["gzip_body"], media_type="application/json",
+                        headers={**headers, "Content-Encoding": "gzip"})
+    return Response(content=snapshot["body"], media_type="application/json", headers=headers)
 
 @app.get("/get_geometry/{project_id}/{case_id}", summary="Serves the generated STL geometry file")
 def get_geometry(project_id: str, case_id: str):
+    # Recently processed cases are served from the geometry store (usually from memory)
+    geometry_key = get_recent_geometry(project_id, case_id)
+    stl_bytes = geometry_store.get_bytes(geometry_key) if geometry_key else None
+    if stl_bytes is not None:
+        return Response(
+            content=stl_bytes, media_type='application/vnd.ms-pki.stl',
+            headers={"Content-Disposition": f'attachment; filename="{case_id}.stl"'}
+        )
+    # Otherwise fall back to the case folder, whose file is a hard link into the store
     file_path = f"outputs/projects/{project_id}/{case_id}_geometry.stl"
     if not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="Geometry file not found.")
     return FileResponse(file_path, media_type='application/vnd.ms-pki.stl', filename=f"{case_id}.stl")
 
+@app.get("/geometry/{geometry_key}", summary="Serves a geometry file from the content-addressed store")
+def get_geometry_by_key(geometry_key: str):
+    if len(geometry_key) != 64 or not all(c in "0123456789abcdef" for c in geometry_key):
+        raise HTTPException(status_code=400, detail="Invalid geometry key.")
+    stl_bytes = geometry_store.get_bytes(geometry_key)
+    if stl_bytes is None:
+        raise HTTPException(status_code=404, detail="Geometry not found.")
+    # Content-addressed files never change, so clients may cache them indefinitely
+    return Response(
+        content=stl_bytes, media_type='application/vnd.ms-pki.stl',
+        headers={"Cache-Control": "public, max-age=31536000, immutable", "ETag": f'"{geometry_key}"'}
+    )
+
 @app.get("/get_feedback_summary", summary="Returns aggregated thumbs up/down stats")
 def get_feedback_summary():
     feedback_file = "io/feedback.jsonl"
@@ -173,29 +622,55 @@ def get_feedback_summary():
         raise HTTPException(status_code=500, detail="Could not process feedback file.")
     return summary
     
-@app.get("/projects/{project_id}/cases", summary="Get all case results for a specific project")
-def get_project_cases(project_id: str) -> List[Dict[str, Any]]:
+@app.get("/projects/{project_id}/cases", summary="List case summaries for a specific project")
+def get_project_cases(
+    project_id: str,
+    request: Request,
+    response: Response,
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    fields: Optional[str] = Query(None, description=f"Comma-separated subset of: {', '.join(SUMMARY_FIELDS)}")
+) -> List[Dict[str, Any]]:
     """
-    Searches the output directory and returns a list of all report.json files
-    associated with the given project_id.
+    Returns one summary per case from the report index, newest first. The full
+    report of a case is at GET /projects/{project_id}/cases/{case_id}.
+    The total number of cases is sent in X-Total-Count.
     """
-    project_dir = f"outputs/projects/{project_id}"
-    if not os.path.exists(project_dir):
-        # Return an empty list if the project folder doesn't exist, which is a valid case.
-        return []
-    
-    project_reports = []
+    # Read from the module each time: tests and benchmarks may swap in another index
+    index = main_pipeline.report_index
+    selected = [field.strip() for field in fields.split(",") if field.strip()] if fields else SUMMARY_FIELDS
+    unknown = set(selected) - set(SUMMARY_FIELDS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
     try:
-        for filename in os.listdir(project_dir):
-            if filename.endswith("_report.json"):
-                with open(os.path.join(project_dir, filename), 'r') as f:
-                    project_reports.append(json.load(f))
+        # Projects saved before the index existed are indexed on first access
+        index.backfill_project(project_id)
+        revision = index.revision(project_id)
+        # The revision changes with every saved report, so the ETag covers the whole listing
+        etag_source = f"{project_id}:{revision}:{limit}:{offset}:{','.join(selected)}"
+        etag = f'W/"{hashlib.sha256(etag_source.encode()).hexdigest()[:32]}"'
+        if etag_matches(request, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        cases = index.list_cases(project_id, limit=limit, offset=offset, fields=selected)
+        total = index.count(project_id)
     except Exception as e:
-        logger.error(f"Error reading reports for project {project_id}: {e}", exc_info=True)
+        logger.error(f"Error reading the report index for project {project_id}: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error reading project reports.")
-    return project_reports
+    response.headers["ETag"] = etag
+    response.headers["X-Total-Count"] = str(total)
+    return cases
+
+@app.get("/projects/{project_id}/cases/{case_id}", summary="Get the saved report of one case")
+def get_project_case(project_id: str, case_id: str) -> Dict[str, Any]:
+    """The full saved report; a deferred case has analysis_status "pending" until its narrative is written."""
+    report = load_case_report(project_id, case_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Case report not found.")
+    return report
+
 # --- 8. Main execution block for running the server ---
 if __name__ == "__main__":
+    # Development server with auto-reload; production runs `python serve.py` (see the Dockerfile)
     print("--- Starting MCP-Integrated API Server with Uvicorn ---")
     print("Access the interactive API docs at http://127.0.0.1:8000/docs")
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
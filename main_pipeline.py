@@ -2,44 +2,85 @@ import json
 import os
 import numpy as np
 import re
+from collections import OrderedDict
 from datetime import datetime
-import torch
+import threading
+import time
 
-from langchain.prompts import PromptTemplate
 from logging_config import logger
+from artifact_store import GeometryStore
+from report_index import ReportIndex
+import storage
+from timing import Timer
+import metrics
 
 # Import agents that are now simple, stateless tools
 from agents.calculator_agent import EntitlementsAgent, AllowableEnvelopeAgent
 from agents.geometry_agent import GeometryAgent
 from agents.interior_agent import InteriorDesignAgent
+from agents.massing_agent import MassingAgent, resolve_total_fsi
 
-def process_case_logic(case_data, system_state):
+# The specialist agents are stateless, so one instance of each serves every request
+entitlement_agent = EntitlementsAgent({"road_width_gt_18m_bonus": 0.5})
+envelope_agent = AllowableEnvelopeAgent()
+interior_agent = InteriorDesignAgent()
+geometry_agent = GeometryAgent()
+massing_agent = MassingAgent()
+
+# Shared, content-addressed geometry store. Only these massing fields determine the mesh.
+geometry_store = GeometryStore()
+GEOMETRY_PARAM_KEYS = ["origin", "footprint_width_m", "footprint_depth_m", "full_floors", "top_floor_fraction", "floor_height_m"]
+
+# How much of the pipeline a case runs (CaseInput.mode):
+#   full          - everything, including the LLM narrative
+#   deterministic - no LLM call; analysis_summary stays empty ("skipped")
+#   deferred      - no LLM call now; the report is saved as "pending" and the caller
+#                   queues a full run that fills in the narrative later
+CASE_MODES = ("full", "deterministic", "deferred")
+
+# Summary catalog of every saved report, for project listings
+report_index = ReportIndex()
+
+# Geometry keys of recently processed cases, so /get_geometry can go straight to the store
+RECENT_GEOMETRY_LIMIT = 4096
+_recent_geometry = OrderedDict()
+_recent_geometry_lock = threading.Lock()
+
+def remember_geometry(project_id, case_id, geometry_key):
+    with _recent_geometry_lock:
+        _recent_geometry[(project_id, case_id)] = geometry_key
+        _recent_geometry.move_to_end((project_id, case_id))
+        while len(_recent_geometry) > RECENT_GEOMETRY_LIMIT:
+            _recent_geometry.popitem(last=False)
+
+def get_recent_geometry(project_id, case_id):
+    """Returns the geometry store key of a recently processed case, or None if it is not known."""
+    with _recent_geometry_lock:
+        return _recent_geometry.get((project_id, case_id))
+
+def rl_decision(rl_agent, rl_state_np):
     """
-    This is the core pipeline logic, refactored to use the MCPClient as the single source of truth.
+    Returns (optimal action, its probability) for one RL state. A distilled policy
+    answers from its lookup grid; a PPO agent is evaluated with torch.
     """
-    # --- A. Unpack Inputs ---
-    project_id = case_data.get("project_id", "default_project")
-    case_id = case_data.get("case_id")
-    city = case_data.get("city")
-    parameters = case_data.get("parameters", {})
-    logger.info(f"Processing case {case_id} for project {project_id}.")
-    
-    # --- B. Query MCP for Hard Facts ---
-    logger.info(f"Querying MCP for rules for case {case_id}...")
-    db_parameters = {
-        "road_width_m": parameters.get("road_width"),
-        "plot_area_sqm": parameters.get("plot_size"),
-        "location": parameters.get("location")
-    }
-    matching_rules = system_state.mcp_client.query_rules(city, db_parameters)
-    deterministic_entitlements = [rule.entitlements for rule in matching_rules] if matching_rules else []
+    if hasattr(rl_agent, "predict_with_confidence"):
+        if rl_agent.out_of_range(rl_state_np).any():
+            # The grid is clamped to its edge here, where PPO may choose another action
+            metrics.RL_OUT_OF_RANGE.inc()
+            logger.warning(f"RL state {rl_state_np.tolist()} is outside the distilled policy's grid; "
+                           f"answering from the nearest grid point.")
+        return rl_agent.predict_with_confidence(rl_state_np)
 
-    # --- C. Use the LLM to Explain the Facts ---
-    logger.info(f"Executing LLM agent to generate expert report for {case_id}...")
-    context_for_llm = f"The following structured rules were found to be applicable from the master rule database:\n\n{json.dumps(deterministic_entitlements, indent=2)}"
-    
-    prompt = PromptTemplate.from_template(
-        """You are a professional AI consultant specializing in the detailed analysis of municipal development regulations. Your task is to act as an expert consultant and provide a comprehensive, clear, and actionable report based on the provided context and the user's query.
+    action, _ = rl_agent.predict(rl_state_np, deterministic=True)
+    rl_optimal_action = int(action)
+
+    import torch
+    rl_state_tensor = torch.as_tensor(rl_state_np, device=rl_agent.device).reshape(1, -1)
+    distribution = rl_agent.policy.get_distribution(rl_state_tensor)
+    action_probabilities = distribution.distribution.probs.detach().cpu().numpy()[0]
+    return rl_optimal_action, float(action_probabilities[rl_optimal_action])
+
+REPORT_PROMPT = """You are a professional AI consultant specializing in the detailed analysis of municipal development regulations. Your task is to act as an expert consultant and provide a comprehensive, clear, and actionable report based on the provided context and the user's query.
 
         **Your final output MUST be a well-structured Markdown report.** Use the following format precisely:
         
@@ -69,82 +110,273 @@ def process_case_logic(case_data, system_state):
         **User Query Parameters (for your reference):**
         {input}
         """
-    )
-    
-    llm_chain = prompt | system_state.llm
-    summary_response = llm_chain.invoke({
-        "context": context_for_llm,
-        "input": json.dumps(parameters),
-        "current_date": datetime.utcnow().strftime('%B %d, %Y'),
-        "plot_size": f'{parameters.get("plot_size", "N/A")} sq. m.',
-        "location": parameters.get("location", "N/A"),
-        "road_width": f'{parameters.get("road_width", "N/A")} m.'
-    })
-    analysis_report = summary_response.content
-    logger.info(f"LLM expert report complete for {case_id}.")
-
-    # --- D. Run Specialist Agents (now stateless) ---
-    entitlement_agent = EntitlementsAgent({"road_width_gt_18m_bonus": 0.5})
-    envelope_agent = AllowableEnvelopeAgent()
-    interior_agent = InteriorDesignAgent()
-    geometry_agent = GeometryAgent()
-
-    entitlement_result = entitlement_agent.calculate("road_width_gt_18m_bonus")
-    envelope_result = envelope_agent.calculate(plot_area=parameters.get("plot_size", 0), setback_area=150)
+
+def run_deterministic_stages(case_data, system_state, timer):
+    """
+    Everything in the pipeline that does not need the LLM: rules, specialist
+    agents, the RL decision and the geometry. Returns the report with an empty
+    analysis_summary, and the inputs of the LLM prompt.
+    """
+    # --- A. Unpack Inputs ---
+    project_id = case_data.get("project_id", "default_project")
+    case_id = case_data.get("case_id")
+    city = case_data.get("city")
+    parameters = case_data.get("parameters", {})
+    logger.info(f"Processing case {case_id} for project {project_id}.")
     
-    total_fsi = 1.0 
-    if deterministic_entitlements:
-        for ent in deterministic_entitlements:
-            if 'total_fsi' in ent:
-                fsi_value = ent['total_fsi']
-                if isinstance(fsi_value, dict): total_fsi = fsi_value.get('max', 1.0)
-                elif isinstance(fsi_value, (int, float)): total_fsi = fsi_value
-                break 
+    # --- B. Query MCP for Hard Facts ---
+    logger.info(f"Querying MCP for rules for case {case_id}...")
+    db_parameters = {
+        "road_width_m": parameters.get("road_width"),
+        "plot_area_sqm": parameters.get("plot_size"),
+        "location": parameters.get("location")
+    }
+    matching_rules = system_state.mcp_client.query_rules(city, db_parameters)
+    deterministic_entitlements = [rule.entitlements for rule in matching_rules] if matching_rules else []
+    city_label = (city or "").lower()
+    metrics.RULE_QUERIES.inc(city=city_label, matched=str(bool(matching_rules)).lower())
+    metrics.RULES_MATCHED.inc(len(deterministic_entitlements), city=city_label)
+    timer.lap("rules_query")
+
+    # --- C. Run Specialist Agents (stateless, created once at import) ---
+    entitlement_result = entitlement_agent.calculate("road_width_gt_18m_bonus", explain=False)
+    envelope_result = envelope_agent.calculate(plot_area=parameters.get("plot_size", 0), setback_area=150, explain=False)
     
+    # The same resolution as the massing and /sweep use
+    total_fsi = resolve_total_fsi(deterministic_entitlements)
     total_bua = parameters.get("plot_size", 0) * total_fsi
-    interior_result = interior_agent.calculate_carpet_area(total_bua)
+    interior_result = interior_agent.calculate_carpet_area(total_bua, explain=False)
 
-    # --- E. Run RL Agent for Optimal Policy Decision ---
+    # Setback-aware massing: buildable footprint stacked up to the height or FSI limit
+    massing_constraints = massing_agent.collect_constraints(deterministic_entitlements)
+    massing = massing_agent.massing_for_case(
+        massing_constraints,
+        plot_size=parameters.get("plot_size", 100),
+        plot_polygon=parameters.get("plot_polygon")
+    )
+    timer.lap("specialist_agents")
+
+    # --- D. Run RL Agent for Optimal Policy Decision ---
     location_map = {"urban": 0, "suburban": 1, "rural": 2}
     rl_state_np = np.array([parameters.get("plot_size",0), location_map.get(parameters.get("location", "urban"),0), parameters.get("road_width",0)]).astype(np.float32)
     
-    action, _ = system_state.rl_agent.predict(rl_state_np, deterministic=True)
-    rl_optimal_action = int(action)
-
-    rl_state_tensor = torch.as_tensor(rl_state_np, device=system_state.rl_agent.device).reshape(1, -1)
-    distribution = system_state.rl_agent.policy.get_distribution(rl_state_tensor)
-    action_probabilities = distribution.distribution.probs.detach().cpu().numpy()[0]
-    confidence_score = float(action_probabilities[rl_optimal_action])
+    # Take one reference so a concurrent hot-swap cannot change the agent mid-request
+    rl_agent = system_state.rl_agent
+    rl_started = time.perf_counter()
+    rl_optimal_action, confidence_score = rl_decision(rl_agent, rl_state_np)
+    metrics.RL_INFERENCE_DURATION.observe(
+        time.perf_counter() - rl_started, policy="distilled" if hasattr(rl_agent, "predict_with_confidence") else "ppo"
+    )
+    timer.lap("rl_decision")
 
-    # --- F. Compile Final, Standardized Report ---
+    # --- E. Compile the Standardized Report (the LLM analysis is added later) ---
     final_report = { 
         "project_id": project_id,
         "case_id": case_id,
         "city": city,
         "inputs": parameters,
         "entitlements": {
-            "analysis_summary": analysis_report,
+            "analysis_summary": None,
+            "analysis_status": None,
             "rules_from_db": deterministic_entitlements,
+            "total_fsi": total_fsi,
             "carpet_area_sqm": interior_result.get("result_carpet_area_sqm")
         },
         "rl_decision": {
             "optimal_action": rl_optimal_action,
-            "confidence_score": round(confidence_score, 2)
+            "confidence_score": round(confidence_score, 2),
+            "policy_version": getattr(system_state, "rl_agent_version", None)
+        },
+        "massing": {
+            "buildable": massing["buildable"],
+            "footprint_width_m": round(massing["footprint_width_m"], 2),
+            "footprint_depth_m": round(massing["footprint_depth_m"], 2),
+            "floors": massing["full_floors"] + (1 if massing["top_floor_fraction"] > 0 else 0),
+            "height_m": round(massing["height_m"], 2),
+            "built_up_area_sqm": round(massing["built_up_area_sqm"], 2),
+            "limited_by": massing["limited_by"]
         },
         "geometry_file": f"/outputs/projects/{project_id}/{case_id}_geometry.stl",
         "logs": f"/logs/{case_id}" 
     }
-    
-    # --- G. Save Outputs ---
+    timer.lap("report_compile")
+
+    # --- F. Build the Geometry (linked into the case folder when the report is saved) ---
+    if massing["buildable"]:
+        # Identical massings are generated once in the store and hard-linked into each case folder
+        def build_geometry(rounded_massing):
+            mesh_vectors = massing_agent.build_mesh_vectors(massing_agent.floor_blocks(rounded_massing))
+            return geometry_agent.create_mesh(output_path=None, vectors=mesh_vectors, as_bytes=True)
+
+        geometry_key, _ = geometry_store.get_or_create({key: massing[key] for key in GEOMETRY_PARAM_KEYS}, build_geometry)
+        final_report["geometry_key"] = geometry_key
+    else:
+        # No empty mesh: the report says why there is no geometry
+        final_report["massing"]["reason"] = massing["reason"]
+        final_report["geometry_file"] = None
+        final_report["geometry_key"] = None
+    timer.lap("geometry")
+
+    prompt_inputs = {
+        "context": f"The following structured rules were found to be applicable from the master rule database:\n\n{json.dumps(deterministic_entitlements, indent=2)}",
+        "input": json.dumps(parameters),
+        "current_date": datetime.utcnow().strftime('%B %d, %Y'),
+        "plot_size": f'{parameters.get("plot_size", "N/A")} sq. m.',
+        "location": parameters.get("location", "N/A"),
+        "road_width": f'{parameters.get("road_width", "N/A")} m.'
+    }
+    return final_report, prompt_inputs
+
+def build_llm_chain(system_state):
+    # Imported here so that importing the pipeline stays cheap for workers and tests
+    from langchain.prompts import PromptTemplate
+    return PromptTemplate.from_template(REPORT_PROMPT) | system_state.llm
+
+def record_llm_usage(usage):
+    usage = usage or {}
+    metrics.LLM_TOKENS.inc(usage.get("input_tokens", 0), direction="input")
+    metrics.LLM_TOKENS.inc(usage.get("output_tokens", 0), direction="output")
+
+def chunk_text(chunk) -> str:
+    """The text of a streamed message chunk; some models send a list of content parts."""
+    content = getattr(chunk, "content", chunk)
+    if isinstance(content, str):
+        return content
+    return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+
+# --- G. Use the LLM to Explain the Facts ---
+def generate_analysis(system_state, prompt_inputs):
+    """Returns the LLM's Markdown report for the case, from one blocking call."""
+    llm_started = time.perf_counter()
+    try:
+        summary_response = build_llm_chain(system_state).invoke(prompt_inputs)
+    except Exception:
+        metrics.LLM_CALLS.inc(status="error")
+        raise
+    metrics.LLM_CALLS.inc(status="ok")
+    metrics.LLM_CALL_DURATION.observe(time.perf_counter() - llm_started)
+    record_llm_usage(getattr(summary_response, "usage_metadata", None))
+    return summary_response.content
+
+def stream_analysis(system_state, prompt_inputs):
+    """Like generate_analysis, but yields the report text piece by piece as the LLM produces it."""
+    llm_started = time.perf_counter()
+    usage = {}
+    try:
+        for chunk in build_llm_chain(system_state).stream(prompt_inputs):
+            # Streamed chunks carry partial usage counts, which add up to the call's total
+            for key, value in (getattr(chunk, "usage_metadata", None) or {}).items():
+                if isinstance(value, (int, float)):
+                    usage[key] = usage.get(key, 0) + value
+            text = chunk_text(chunk)
+            if text:
+                yield text
+    except Exception:
+        metrics.LLM_CALLS.inc(status="error")
+        raise
+    metrics.LLM_CALLS.inc(status="ok")
+    metrics.LLM_CALL_DURATION.observe(time.perf_counter() - llm_started)
+    record_llm_usage(usage)
+
+# --- H. Save the Report ---
+def has_complete_analysis(report) -> bool:
+    """True for a saved report with an LLM narrative (reports from before analysis_status have only the summary)."""
+    entitlements = (report or {}).get("entitlements") or {}
+    return entitlements.get("analysis_status", "complete") == "complete" and bool(entitlements.get("analysis_summary"))
+
+def link_case_geometry(final_report):
+    """Points the case's STL file and /get_geometry at the geometry of the report being saved."""
+    project_id, case_id = final_report["project_id"], final_report["case_id"]
     output_dir = f"outputs/projects/{project_id}"
     os.makedirs(output_dir, exist_ok=True)
-    json_output_path = os.path.join(output_dir, f"{case_id}_report.json")
     stl_output_path = os.path.join(output_dir, f"{case_id}_geometry.stl")
+    geometry_key = final_report.get("geometry_key")
+    if geometry_key:
+        geometry_store.link(geometry_key, stl_output_path)
+    elif os.path.exists(stl_output_path):
+        os.remove(stl_output_path)
+    remember_geometry(project_id, case_id, geometry_key)
 
-    with open(json_output_path, "w") as f:
-        json.dump(final_report, f, indent=4)
-    
-    height = total_fsi * 10 
-    geometry_agent.create_block(output_path=stl_output_path, width=np.sqrt(max(0, parameters.get("plot_size", 100))), depth=np.sqrt(max(0, parameters.get("plot_size", 100))), height=height)
-    
-    return final_report
+def save_report(final_report, case_data, timer):
+    """
+    Writes the report, its index row and the case's STL link, logs the request's
+    timings and returns the response. A report without a narrative (deterministic
+    or deferred mode) never replaces a saved one with the same inputs that has it:
+    nothing is written and the response carries "saved": False.
+    """
+    project_id, case_id = final_report["project_id"], final_report["case_id"]
+    saved = True
+    if final_report["entitlements"]["analysis_status"] != "complete":
+        previous = storage.load_report(project_id, case_id)
+        # A cheap re-check of the same inputs must not throw away a paid LLM analysis
+        saved = not (has_complete_analysis(previous) and previous.get("city") == final_report["city"]
+                     and previous.get("inputs") == final_report["inputs"])
+    if saved:
+        storage.save_report(final_report)
+        # Catalog row for project listings, so they never have to open the report files
+        report_index.add(final_report)
+        link_case_geometry(final_report)
+    else:
+        logger.info(f"Case {case_id} already has a full report of these inputs; the "
+                    f"{final_report['entitlements']['analysis_status']} result is returned without replacing it.")
+    timer.lap("report_write")
+
+    timings = timer.finish()
+    logger.info(f"Case {case_id} processed in {timings['total_ms']:.1f} ms.", extra={"extra_data": {
+        "case": {"project_id": project_id, "case_id": case_id}, "timings": timings
+    }})
+    response = final_report if saved else {**final_report, "saved": False}
+    if case_data.get("debug"):
+        # Timings are only returned on request; the saved report stays the same
+        return {**response, "debug": {"timings": timings}}
+    return response
+
+def process_case_logic(case_data, system_state):
+    """
+    This is the core pipeline logic, refactored to use the MCPClient as the single source of truth.
+    """
+    # Each stage ends with a timer lap, so every stage of the request is timed
+    timer = Timer()
+    final_report, prompt_inputs = run_deterministic_stages(case_data, system_state, timer)
+    mode = case_data.get("mode") or "full"
+
+    if mode == "full":
+        logger.info(f"Executing LLM agent to generate expert report for {final_report['case_id']}...")
+        final_report["entitlements"]["analysis_summary"] = generate_analysis(system_state, prompt_inputs)
+        final_report["entitlements"]["analysis_status"] = "complete"
+        logger.info(f"LLM expert report complete for {final_report['case_id']}.")
+        timer.lap("llm")
+    else:
+        final_report["entitlements"]["analysis_status"] = "pending" if mode == "deferred" else "skipped"
+
+    return save_report(final_report, case_data, timer)
+
+def stream_case_logic(case_data, system_state):
+    """
+    The same pipeline as process_case_logic, as a generator of (event, data)
+    pairs: "deterministic" with the report minus the LLM analysis as soon as
+    it is computed, one "token" per piece of LLM text, and finally "report"
+    with the complete report, which is saved exactly as process_case_logic saves it.
+    In deterministic mode no tokens are sent.
+    """
+    timer = Timer()
+    final_report, prompt_inputs = run_deterministic_stages(case_data, system_state, timer)
+    # A copy, so the event keeps its empty analysis_summary after the report is completed
+    yield "deterministic", {**final_report, "entitlements": dict(final_report["entitlements"])}
+
+    if (case_data.get("mode") or "full") == "deterministic":
+        final_report["entitlements"]["analysis_status"] = "skipped"
+        yield "report", save_report(final_report, case_data, timer)
+        return
+
+    logger.info(f"Streaming LLM expert report for {final_report['case_id']}...")
+    pieces = []
+    for text in stream_analysis(system_state, prompt_inputs):
+        pieces.append(text)
+        yield "token", text
+    final_report["entitlements"]["analysis_summary"] = "".join(pieces)
+    final_report["entitlements"]["analysis_status"] = "complete"
+    logger.info(f"LLM expert report complete for {final_report['case_id']}.")
+    timer.lap("llm")
+
+    yield "report", save_report(final_report, case_data, timer)
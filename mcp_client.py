@@ -1,79 +1,194 @@
-from database_setup import SessionLocal, Rule
-from sqlalchemy.orm import Session
-from typing import List, Dict, Any
-import json
+from database_setup import SessionLocal, Rule, RuleSetVersion
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, scoped_session
+from typing import List, Dict, Any, Iterable, Optional
+from collections import OrderedDict
+import gzip
+import hashlib
 import os
+import threading
 from datetime import datetime
-import uuid
+
+import storage
+
+RULE_KEYS = ["id", "city", "rule_type", "conditions", "entitlements", "notes"]
 
 class MCPClient:
     """
     A client for interacting with the Managed Compliance Platform (our database).
     This centralizes all database logic, as required for a professional service.
     """
-    def __init__(self):
-        self.db: Session = SessionLocal()
+    def __init__(self, session_factory=SessionLocal, rules_cache_size: int = 64):
+        # One session per thread: the API serves requests from a thread pool, and a
+        # single SQLAlchemy session must not be used by several threads at once
+        self.db: Session = scoped_session(session_factory)
+        # Serialized rule sets keyed by (city, rule set version, rule_type)
+        self.rules_cache_size = rules_cache_size
+        self._rules_cache = OrderedDict()
+        self._rules_cache_lock = threading.Lock()
+        # Lookups of the rules snapshot cache, exported by /metrics
+        self.hits = 0
+        self.misses = 0
         print("MCPClient initialized, database session started.")
 
     def add_rule(self, rule_data: Dict[str, Any]):
         """Adds a new rule to the MCP, checking for duplicates."""
-        rule_id = rule_data.get("id")
-        if not rule_id: return False
-        
-        existing_rule = self.db.query(Rule).filter(Rule.id == rule_id).first()
-        if existing_rule: return False
+        added, _ = self.upsert_rules([rule_data], update_existing=False)
+        return added == 1
+
+    def upsert_rules(self, rules: Iterable[Dict[str, Any]], update_existing: bool = True):
+        """
+        Adds new rules and, with update_existing, overwrites existing ones with
+        the same id, in one transaction. Rules missing any of RULE_KEYS are
+        skipped. The rule set version of every city written to is bumped.
+        Returns (added, updated).
+        """
+        added, updated, cities = 0, 0, set()
+        try:
+            for rule_data in rules:
+                if not all(key in rule_data for key in RULE_KEYS):
+                    continue
+                existing_rule = self.db.query(Rule).filter(Rule.id == rule_data["id"]).first()
+                if existing_rule:
+                    if not update_existing:
+                        continue
+                    # A rule moved to another city changes both cities' rule sets
+                    cities.add(existing_rule.city)
+                    for key in RULE_KEYS[1:]:
+                        setattr(existing_rule, key, rule_data[key])
+                    updated += 1
+                else:
+                    self.db.add(Rule(**{key: rule_data[key] for key in RULE_KEYS}))
+                    added += 1
+                cities.add(rule_data["city"])
+            if cities:
+                self._bump_rule_set_versions(cities)
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        finally:
+            self.db.close()
+        return added, updated
 
-        new_rule = Rule(**rule_data)
-        self.db.add(new_rule)
-        self.db.commit()
-        return True
+    def _bump_rule_set_versions(self, cities):
+        # Databases created before versioning get the table on their first write
+        RuleSetVersion.__table__.create(bind=self.db.connection(), checkfirst=True)
+        for city in {city.lower() for city in cities}:
+            row = self.db.get(RuleSetVersion, city)
+            if row is None:
+                row = RuleSetVersion(city=city, version=0)
+                self.db.add(row)
+            row.version = (row.version or 0) + 1
+            row.updated_at = datetime.utcnow()
+
+    def rule_set_version(self, city: str) -> int:
+        """The city's rule set version: 0 until rules are first written through the MCP."""
+        try:
+            row = self.db.query(RuleSetVersion.version).filter(RuleSetVersion.city == city.lower()).first()
+        except OperationalError:
+            # No write has created the versions table yet
+            self.db.rollback()
+            return 0
+        finally:
+            self.db.close()
+        return row[0] if row else 0
 
     def query_rules(self, city: str, parameters: dict) -> List[Rule]:
         """
         Finds all rules that match the given case parameters by aggregating results.
         """
-        all_matching_rules = []
+        try:
+            all_matching_rules = []
         
-        if "road_width_m" in parameters:
-            width = parameters["road_width_m"]
-            width_rules = self.db.query(Rule).filter(
-                Rule.city.ilike(city),
-                Rule.conditions['road_width_m']['min'].as_float() <= width,
-                Rule.conditions['road_width_m']['max'].as_float() > width
-            ).all()
-            all_matching_rules.extend(width_rules)
+            if "road_width_m" in parameters:
+                width = parameters["road_width_m"]
+                width_rules = self.db.query(Rule).filter(
+                    Rule.city.ilike(city),
+                    Rule.conditions['road_width_m']['min'].as_float() <= width,
+                    Rule.conditions['road_width_m']['max'].as_float() > width
+                ).all()
+                all_matching_rules.extend(width_rules)
 
-        if "plot_area_sqm" in parameters:
-            area = parameters["plot_area_sqm"]
-            area_rules = self.db.query(Rule).filter(
-                Rule.city.ilike(city),
-                Rule.conditions['plot_area_sqm']['min'].as_float() <= area,
-                Rule.conditions['plot_area_sqm']['max'].as_float() >= area
-            ).all()
-            all_matching_rules.extend(area_rules)
+            if "plot_area_sqm" in parameters:
+                area = parameters["plot_area_sqm"]
+                area_rules = self.db.query(Rule).filter(
+                    Rule.city.ilike(city),
+                    Rule.conditions['plot_area_sqm']['min'].as_float() <= area,
+                    Rule.conditions['plot_area_sqm']['max'].as_float() >= area
+                ).all()
+                all_matching_rules.extend(area_rules)
             
-        return list({rule.id: rule for rule in all_matching_rules}.values())
+            return list({rule.id: rule for rule in all_matching_rules}.values())
+        finally:
+            # Return the connection to the pool; the loaded rules stay usable
+            self.db.close()
+
+    def cities(self) -> List[str]:
+        """Every city that has rules, sorted."""
+        try:
+            rows = self.db.query(Rule.city).distinct().all()
+        finally:
+            self.db.close()
+        return sorted({row[0] for row in rows if row[0]})
+
+    def get_rules(self, city: str) -> List[Dict[str, Any]]:
+        """Returns every rule for a city as plain dictionaries, in database order."""
+        try:
+            rules = self.db.query(Rule).filter(Rule.city.ilike(city)).all()
+        finally:
+            self.db.close()
+        return [
+            {
+                "id": rule.id, "city": rule.city, "rule_type": rule.rule_type,
+                "conditions": rule.conditions, "entitlements": rule.entitlements,
+                "notes": rule.notes
+            } for rule in rules
+        ]
+
+    def get_rules_snapshot(self, city: str, rule_type: Optional[str] = None) -> Dict[str, Any]:
+        """
+        The city's rules (optionally only one rule_type) serialized as JSON, with
+        the rule set version and an ETag of the body. The serialization is cached
+        per (city, version, rule_type), so while nothing is written, each call
+        costs one primary-key lookup of the version.
+        """
+        version = self.rule_set_version(city)
+        key = (city.lower(), version, rule_type)
+        with self._rules_cache_lock:
+            snapshot = self._rules_cache.get(key)
+            if snapshot is not None:
+                self._rules_cache.move_to_end(key)
+                self.hits += 1
+                return snapshot
+            self.misses += 1
+
+        rules = self.get_rules(city)
+        if rule_type:
+            rules = [rule for rule in rules if (rule["rule_type"] or "").lower() == rule_type.lower()]
+        body = storage.dumps(rules)
+        snapshot = {
+            "version": version,
+            "count": len(rules),
+            "etag": f'"{hashlib.sha256(body).hexdigest()[:32]}"',
+            "body": body,
+            # Compressed once per snapshot; mtime=0 keeps the bytes identical across runs
+            "gzip_body": gzip.compress(body, compresslevel=6, mtime=0),
+        }
+        with self._rules_cache_lock:
+            self._rules_cache[key] = snapshot
+            while len(self._rules_cache) > self.rules_cache_size:
+                self._rules_cache.popitem(last=False)
+        return snapshot
 
     def add_feedback(self, feedback_data: Dict[str, Any]):
         """
         Persists user feedback. In a full MCP, this would write to a 'feedback' table.
-        For now, it writes to the required feedback.jsonl file.
+        For now, it appends to io/feedback.jsonl, with the report stored by reference.
         """
-        log_file = "io/feedback.jsonl"
-        feedback_record = {
-            "feedback_id": str(uuid.uuid4()),
-            "project_id": feedback_data.get("project_id"),
-            "case_id": feedback_data.get("case_id"),
-            "user_feedback": feedback_data.get("user_feedback"),
-            "timestamp": datetime.utcnow().isoformat() + "Z",
-            "input": feedback_data.get("input_case"),
-            "output": feedback_data.get("output_report")
-        }
-        with open(log_file, "a") as f:
-            f.write(json.dumps(feedback_record) + "\n")
-        return feedback_record
+        return storage.append_feedback(feedback_data)
 
     def close(self):
         """Closes the database session."""
-        self.db.close()
+        self.db.remove()
         print("MCPClient session closed.")
\ No newline at end of file
@@ -0,0 +1,219 @@
+"""
+Low-overhead, in-process metrics rendered in the Prometheus text format.
+
+Counters and histograms are updated on the request path, each with a single
+lock. Gauges that describe other objects (thread pool, DB pool, caches) are
+read from callbacks only when /metrics is scraped. The values are per process:
+under serve.py every sample carries the pid of the worker that answered.
+"""
+import os
+import threading
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from timing import Histogram as _BucketHistogram, DEFAULT_BUCKETS_MS, stage_snapshot
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def _format_labels(labelnames, labelvalues, extra=()) -> str:
+    pairs = list(zip(labelnames, labelvalues)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def render(self, const_labels=()) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, key, const_labels)} {_format_value(value)}"
+            for key, value in values.items()
+        ]
+
+class Gauge(Metric):
+    """A gauge set directly, or read from `callback` (returning {label values tuple: value}) at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), callback: Callable[[], Dict[tuple, float]] = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self.callback = callback
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def render(self, const_labels=()) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        if self.callback is not None:
+            try:
+                values.update({tuple(map(str, key)): value for key, value in self.callback().items()})
+            except Exception:
+                # A failing collector must never break the scrape
+                pass
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, key, const_labels)} {_format_value(value)}"
+            for key, value in values.items()
+        ]
+
+class CallbackCounter(Gauge):
+    """A counter whose values are read from `callback` at scrape time, e.g. an object's own hit count."""
+    kind = "counter"
+
+class Histogram(Metric):
+    """Latency histogram in seconds, backed by timing.Histogram (which stores milliseconds)."""
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets_ms=DEFAULT_BUCKETS_MS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets_ms = list(buckets_ms)
+        self._histograms: Dict[Tuple[str, ...], _BucketHistogram] = {}
+
+    def _histogram(self, labels) -> _BucketHistogram:
+        key = self._key(labels)
+        with self._lock:
+            if key not in self._histograms:
+                self._histograms[key] = _BucketHistogram(self.buckets_ms)
+            return self._histograms[key]
+
+    def observe(self, seconds: float, **labels):
+        self._histogram(labels).observe(seconds * 1000)
+
+    def render(self, const_labels=()) -> List[str]:
+        with self._lock:
+            histograms = dict(self._histograms)
+        lines = self.header()
+        for key, histogram in histograms.items():
+            lines.extend(render_buckets(self.name, self.labelnames, key, histogram.snapshot(), const_labels))
+        return lines
+
+def render_buckets(name, labelnames, labelvalues, snapshot, const_labels=()) -> List[str]:
+    """Prometheus histogram lines from a timing.Histogram snapshot (bucket bounds in ms)."""
+    lines, cumulative = [], 0
+    for bound, count in snapshot["buckets"].items():
+        cumulative += count
+        le = "+Inf" if bound == "+Inf" else repr(float(bound) / 1000)
+        lines.append(f"{name}_bucket{_format_labels(labelnames, labelvalues, [*const_labels, ('le', le)])} {cumulative}")
+    labels = _format_labels(labelnames, labelvalues, const_labels)
+    lines.append(f"{name}_sum{labels} {_format_value(snapshot['sum_ms'] / 1000)}")
+    lines.append(f"{name}_count{labels} {snapshot['count']}")
+    return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self, const_labels=()) -> str:
+        """The text format of every metric; `const_labels` ((name, value) pairs) are added to each sample."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render(const_labels))
+        lines.extend(_render_stage_histograms(const_labels))
+        return "\n".join(lines) + "\n"
+
+def _render_stage_histograms(const_labels=()) -> List[str]:
+    # The per-stage histograms recorded by timing.Timer inside process_case_logic
+    name = "pipeline_stage_duration_seconds"
+    lines = [f"# HELP {name} Duration of each process_case_logic stage.", f"# TYPE {name} histogram"]
+    for stage, snapshot in stage_snapshot().items():
+        lines.extend(render_buckets(name, ("stage",), (stage,), snapshot, const_labels))
+    return lines
+
+REGISTRY = Registry()
+
+# --- Metrics shared by the API and the pipeline ---
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "http_requests_total", "HTTP requests by route, method and status code.", ["method", "route", "status"]))
+HTTP_REQUEST_DURATION = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route.", ["method", "route"]))
+HTTP_REQUESTS_IN_PROGRESS = REGISTRY.register(Gauge(
+    "http_requests_in_progress", "HTTP requests currently being served."))
+
+RULE_QUERIES = REGISTRY.register(Counter(
+    "rule_queries_total", "Rule DB queries by city and whether any rule matched.", ["city", "matched"]))
+RULES_MATCHED = REGISTRY.register(Counter(
+    "rules_matched_total", "Rules matched across all queries, by city.", ["city"]))
+
+LLM_CALLS = REGISTRY.register(Counter(
+    "llm_calls_total", "LLM calls by outcome (ok or error).", ["status"]))
+LLM_CALL_DURATION = REGISTRY.register(Histogram(
+    "llm_call_duration_seconds", "LLM call latency."))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "llm_tokens_total", "LLM tokens reported by the model, by direction (input or output).", ["direction"]))
+
+RL_INFERENCE_DURATION = REGISTRY.register(Histogram(
+    "rl_inference_duration_seconds", "RL policy inference latency, by policy type.", ["policy"]))
+RL_OUT_OF_RANGE = REGISTRY.register(Counter(
+    "rl_out_of_range_states_total", "RL states outside the distilled policy's grid, answered from its nearest edge."))
+
+_caches = {}
+
+def _cache_counts():
+    return {
+        key: value
+        for cache_name, cache in list(_caches.items())
+        for key, value in (((cache_name, "hit"), cache.hits), ((cache_name, "miss"), cache.misses))
+    }
+
+CACHE_REQUESTS = REGISTRY.register(CallbackCounter(
+    "cache_requests_total", "Cache lookups by cache and result (hit or miss).", ["cache", "result"], callback=_cache_counts))
+
+def register_cache(cache_name: str, cache):
+    """Exports the hit and miss counts of any object with `hits` and `misses` attributes."""
+    _caches[cache_name] = cache
+
+def render() -> str:
+    # Read at scrape time: serve.py workers are forked after this module is imported
+    return REGISTRY.render(const_labels=[("pid", os.getpid())])
@@ -1,4 +1,4 @@
-from database_setup import SessionLocal, Rule
+from mcp_client import MCPClient
 
 # --- 1. Define the Expanded, Structured Rule Data ---
 # This new set includes specific rules that will match our case studies.
@@ -81,31 +81,15 @@ RULES_DATA = [
 # --- 2. Database Population Logic (Now with Update logic) ---
 def populate_database():
     print("--- Connecting to the database to populate/update rules... ---")
-    db = SessionLocal()
+    # Written through the MCP Client, so the rule set versions (and API caches) are updated
+    client = MCPClient()
     try:
-        for rule_data in RULES_DATA:
-            existing_rule = db.query(Rule).filter(Rule.id == rule_data["id"]).first()
-            if existing_rule:
-                # If it exists, update it to ensure our data is fresh
-                print(f"  - Updating rule '{rule_data['id']}' for {rule_data['city']}.")
-                existing_rule.city = rule_data["city"]
-                existing_rule.rule_type = rule_data["rule_type"]
-                existing_rule.conditions = rule_data["conditions"]
-                existing_rule.entitlements = rule_data["entitlements"]
-                existing_rule.notes = rule_data["notes"]
-            else:
-                # If it doesn't exist, create it
-                print(f"  - Adding new rule '{rule_data['id']}' for {rule_data['city']}.")
-                new_rule = Rule(**rule_data)
-                db.add(new_rule)
-        
-        db.commit()
-        print("--- Successfully committed all rules to the database. ---")
+        added, updated = client.upsert_rules(RULES_DATA, update_existing=True)
+        print(f"--- Successfully committed all rules to the database ({added} added, {updated} updated). ---")
     except Exception as e:
         print(f"!!! An error occurred: {e}")
-        db.rollback()
     finally:
-        db.close()
+        client.close()
 
 if __name__ == "__main__":
-    populate_database()
\ No newline at end of file
+    populate_database()
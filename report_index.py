@@ -0,0 +1,150 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+import storage
+
+PROJECTS_DIR = "outputs/projects"
+REPORT_INDEX_PATH = os.path.join(PROJECTS_DIR, "report_index.sqlite")
+
+# Summary columns that can be requested with `fields`; the JSON ones are decoded on the way out
+SUMMARY_FIELDS = [
+    "case_id", "city", "inputs", "total_fsi", "carpet_area_sqm",
+    "optimal_action", "confidence_score", "policy_version", "geometry_key", "created_at",
+]
+JSON_FIELDS = {"inputs"}
+
+def summarize_report(report: dict, created_at: str = None) -> dict:
+    """The catalog row of a saved case report."""
+    entitlements = report.get("entitlements") or {}
+    rl_decision = report.get("rl_decision") or {}
+    return {
+        "project_id": report.get("project_id"),
+        "case_id": report.get("case_id"),
+        "city": report.get("city"),
+        "inputs": report.get("inputs"),
+        "total_fsi": entitlements.get("total_fsi"),
+        "carpet_area_sqm": entitlements.get("carpet_area_sqm"),
+        "optimal_action": rl_decision.get("optimal_action"),
+        "confidence_score": rl_decision.get("confidence_score"),
+        "policy_version": rl_decision.get("policy_version"),
+        "geometry_key": report.get("geometry_key"),
+        "created_at": created_at or datetime.utcnow().isoformat() + "Z",
+    }
+
+class ReportIndex:
+    """
+    A SQLite catalog of the case reports saved under outputs/projects, one
+    summary row per case, so project listings never open the report files.
+    Each project has a revision number that changes with every write and is
+    used to build ETags. Safe to share between threads.
+    """
+    def __init__(self, path: str = REPORT_INDEX_PATH, projects_dir: str = PROJECTS_DIR):
+        self.path = path
+        self.projects_dir = projects_dir
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS case_reports ("
+                "project_id TEXT NOT NULL, case_id TEXT NOT NULL, city TEXT, inputs TEXT, total_fsi REAL, "
+                "carpet_area_sqm REAL, optimal_action INTEGER, confidence_score REAL, policy_version INTEGER, "
+                "geometry_key TEXT, created_at TEXT, PRIMARY KEY (project_id, case_id))"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS case_reports_by_time ON case_reports (project_id, created_at DESC, case_id)"
+            )
+            self._conn.execute("CREATE TABLE IF NOT EXISTS projects (project_id TEXT PRIMARY KEY, revision INTEGER NOT NULL)")
+            self._conn.commit()
+
+    def add(self, report: dict, created_at: str = None):
+        """Adds or replaces the row of a saved report and bumps its project's revision."""
+        self._add_rows([summarize_report(report, created_at)])
+
+    def _add_rows(self, rows):
+        with self._lock:
+            for row in rows:
+                values = {k: json.dumps(v) if k in JSON_FIELDS else v for k, v in row.items()}
+                columns = ", ".join(values)
+                self._conn.execute(
+                    f"INSERT OR REPLACE INTO case_reports ({columns}) VALUES ({', '.join('?' * len(values))})",
+                    list(values.values())
+                )
+            for project_id in {row["project_id"] for row in rows}:
+                self._conn.execute(
+                    "INSERT INTO projects VALUES (?, 1) ON CONFLICT(project_id) DO UPDATE SET revision = revision + 1",
+                    (project_id,)
+                )
+            self._conn.commit()
+
+    def revision(self, project_id: str) -> int:
+        """0 for a project that has never been indexed."""
+        with self._lock:
+            row = self._conn.execute("SELECT revision FROM projects WHERE project_id = ?", (project_id,)).fetchone()
+        return row[0] if row else 0
+
+    def count(self, project_id: str) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM case_reports WHERE project_id = ?", (project_id,)).fetchone()[0]
+
+    def list_cases(self, project_id: str, limit: int = 50, offset: int = 0, fields=None):
+        """Summaries of a project's cases, newest first, restricted to `fields` (default: all)."""
+        fields = list(fields or SUMMARY_FIELDS)
+        unknown = set(fields) - set(SUMMARY_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(fields)} FROM case_reports WHERE project_id = ? "
+                "ORDER BY created_at DESC, case_id LIMIT ? OFFSET ?",
+                (project_id, limit, offset)
+            ).fetchall()
+        return [
+            {field: json.loads(value) if field in JSON_FIELDS and value is not None else value
+             for field, value in zip(fields, row)}
+            for row in rows
+        ]
+
+    def backfill_project(self, project_id: str) -> int:
+        """
+        Indexes the reports already on disk for a project that has never been
+        indexed (reports saved before the catalog existed). Returns the number added.
+        """
+        project_dir = os.path.join(self.projects_dir, project_id)
+        if self.revision(project_id) or not os.path.isdir(project_dir):
+            return 0
+        rows = []
+        for filename in sorted(os.listdir(project_dir)):
+            if not storage.is_report_file(filename):
+                continue
+            path = os.path.join(project_dir, filename)
+            try:
+                report = storage.load_json(path)
+            except (OSError, ValueError):
+                continue
+            report.setdefault("project_id", project_id)
+            created_at = datetime.utcfromtimestamp(os.path.getmtime(path)).isoformat() + "Z"
+            rows.append(summarize_report(report, created_at))
+        if rows:
+            self._add_rows(rows)
+        return len(rows)
+
+    def close(self):
+        self._conn.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index the case reports already saved under outputs/projects.")
+    parser.add_argument("--path", default=REPORT_INDEX_PATH)
+    args = parser.parse_args()
+
+    index = ReportIndex(args.path)
+    for project_id in sorted(os.listdir(PROJECTS_DIR)):
+        if os.path.isdir(os.path.join(PROJECTS_DIR, project_id)):
+            added = index.backfill_project(project_id)
+            print(f"{project_id}: {added} reports indexed" if added else f"{project_id}: already indexed")
+    index.close()
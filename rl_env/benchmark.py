@@ -0,0 +1,211 @@
+"""
+Training throughput and evaluation benchmark for the HIRL agent.
+
+Each configuration trains a fresh PPO agent in its own interpreter, so peak
+memory is measured per configuration. Reported per run:
+env steps/sec (training and raw env), gradient updates/sec, the rollout and
+update time split, peak RSS, and accuracy on the full oracle and feedback
+dataset. Results are written as JSON. With --baseline, the script exits
+non-zero when throughput or accuracy regress against an earlier result file.
+
+    python rl_env/benchmark.py
+    python rl_env/benchmark.py --n-envs 1 8 16 --net-arch 64,64 128,128 --threads 1 4
+    python rl_env/benchmark.py --baseline reports/rl_benchmark.json --output /tmp/rl_benchmark.json
+"""
+import argparse
+import itertools
+import json
+import math
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+RL_ENV_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(RL_ENV_DIR)
+ROLLOUT_SIZE = 2048
+
+def peak_rss_mb(who=resource.RUSAGE_SELF) -> float:
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(resource.getrusage(who).ru_maxrss / scale, 1)
+
+def dataset_accuracy(agent, env) -> dict:
+    """
+    Accuracy on every case: the share of oracle cases where the agent picks the
+    oracle's action, and of feedback cases where it agrees with the human vote
+    (repeats an upvoted action or avoids a downvoted one).
+    """
+    actions, _ = agent.predict(env.states, deterministic=True)
+    rewards = env.reward_table[np.arange(len(actions)), actions]
+    synthetic, human = ~env.is_human, env.is_human
+    return {
+        "oracle_accuracy": float((rewards[synthetic] > 0).mean()) if synthetic.any() else None,
+        "feedback_agreement": float((rewards[human] > 0).mean()) if human.any() else None,
+        "mean_reward": float(rewards.mean()),
+    }
+
+def env_steps_per_second(env, num_steps=20000) -> float:
+    """Raw environment throughput with random actions and no policy in the loop."""
+    env.reset()
+    actions = np.random.default_rng(0).integers(0, env.action_space.n, size=(num_steps // env.num_envs + 1, env.num_envs))
+    start = time.perf_counter()
+    for step_actions in actions:
+        env.step(step_actions)
+    return round(len(actions) * env.num_envs / (time.perf_counter() - start), 1)
+
+def run_config(config: dict) -> dict:
+    """Trains and evaluates one configuration in this process."""
+    import torch
+    from stable_baselines3 import PPO
+    from stable_baselines3.common.callbacks import BaseCallback
+    from complex_env import ComplexEnv
+    from vec_complex_env import make_complex_vec_env
+
+    class RolloutTimer(BaseCallback):
+        """Measures how much of learn() is spent collecting rollouts."""
+        def __init__(self):
+            super().__init__()
+            self.rollouts = 0
+            self.rollout_seconds = 0.0
+
+        def _on_rollout_start(self):
+            self._started = time.perf_counter()
+
+        def _on_rollout_end(self):
+            self.rollout_seconds += time.perf_counter() - self._started
+            self.rollouts += 1
+
+        def _on_step(self):
+            return True
+
+    torch.set_num_threads(config["threads"])
+    n_envs = config["n_envs"]
+    n_steps = max(1, ROLLOUT_SIZE // n_envs)
+    env = make_complex_vec_env(num_envs=n_envs, use_subprocess=config["subproc"], seed=0)
+    agent = PPO(
+        "MlpPolicy", env, n_steps=n_steps, batch_size=config["batch_size"], seed=0,
+        policy_kwargs=dict(net_arch=dict(pi=config["net_arch"], vf=config["net_arch"])),
+        ent_coef=0.01, device=config["device"], verbose=0
+    )
+
+    timer = RolloutTimer()
+    start = time.perf_counter()
+    agent.learn(total_timesteps=config["timesteps"], callback=timer)
+    train_seconds = time.perf_counter() - start
+
+    raw_env_sps = env_steps_per_second(env)
+    env.close()
+
+    update_seconds = train_seconds - timer.rollout_seconds
+    gradient_steps = timer.rollouts * agent.n_epochs * math.ceil(n_steps * n_envs / config["batch_size"])
+    result = {
+        "config": config,
+        "train_seconds": round(train_seconds, 3),
+        "env_steps": agent.num_timesteps,
+        "train_steps_per_sec": round(agent.num_timesteps / train_seconds, 1),
+        "raw_env_steps_per_sec": raw_env_sps,
+        "rollout_seconds": round(timer.rollout_seconds, 3),
+        "update_seconds": round(update_seconds, 3),
+        "gradient_steps": gradient_steps,
+        "updates_per_sec": round(gradient_steps / update_seconds, 1) if update_seconds > 0 else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "peak_child_rss_mb": peak_rss_mb(resource.RUSAGE_CHILDREN) if config["subproc"] else None,
+    }
+    result.update(dataset_accuracy(agent, ComplexEnv()))
+    return result
+
+def run_isolated(config: dict) -> dict:
+    """Runs one configuration in a fresh interpreter and returns its result."""
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--run-config", json.dumps(config)],
+        cwd=PROJECT_ROOT, capture_output=True, text=True
+    )
+    for line in reversed(completed.stdout.splitlines()):
+        if line.startswith("__RESULT__"):
+            return json.loads(line[len("__RESULT__"):])
+    return {"config": config, "error": (completed.stderr.strip().splitlines() or ["no output"])[-1]}
+
+def compare_to_baseline(results, baseline_path, tolerance):
+    """Returns regressions against a previous result file, matching runs by config."""
+    with open(baseline_path) as f:
+        baseline = {json.dumps(r["config"], sort_keys=True): r for r in json.load(f)["results"] if "error" not in r}
+    failures = []
+    for result in results:
+        previous = baseline.get(json.dumps(result["config"], sort_keys=True))
+        if previous is None or "error" in result:
+            continue
+        for metric in ("train_steps_per_sec", "updates_per_sec", "oracle_accuracy"):
+            old, new = previous.get(metric), result.get(metric)
+            if old and new is not None and new < old * (1 - tolerance):
+                failures.append(f"{result['config']}: {metric} fell from {old} to {new}")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark HIRL training throughput, memory and accuracy.")
+    parser.add_argument("--n-envs", type=int, nargs="+", default=[1, 8], help="Numbers of parallel environments.")
+    parser.add_argument("--net-arch", nargs="+", default=["128,128"], help="Hidden layer sizes, e.g. 64,64 128,128.")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1], help="torch.set_num_threads values.")
+    parser.add_argument("--batch-size", type=int, nargs="+", default=[64], help="PPO minibatch sizes.")
+    parser.add_argument("--timesteps", type=int, default=20480, help="Training steps per configuration.")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--subproc", action="store_true", help="Use SubprocVecEnv instead of the in-process vectorized env.")
+    parser.add_argument("--output", default="reports/rl_benchmark.json")
+    parser.add_argument("--baseline", help="Earlier result file to check for regressions.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative drop before a regression is reported.")
+    parser.add_argument("--run-config", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_config:
+        # Child process: train one configuration and report back on stdout
+        os.chdir(PROJECT_ROOT)
+        print("__RESULT__" + json.dumps(run_config(json.loads(args.run_config))))
+        return
+
+    configs = [
+        {"n_envs": n_envs, "net_arch": [int(size) for size in arch.split(",")], "threads": threads,
+         "batch_size": batch_size, "timesteps": args.timesteps, "device": args.device, "subproc": args.subproc}
+        for n_envs, arch, threads, batch_size in itertools.product(args.n_envs, args.net_arch, args.threads, args.batch_size)
+    ]
+
+    results = []
+    print(f"{'n_envs':>6} {'net_arch':>10} {'threads':>7} {'batch':>5} {'steps/s':>9} {'env steps/s':>11} "
+          f"{'updates/s':>9} {'rss MB':>7} {'oracle acc':>10}")
+    for config in configs:
+        result = run_isolated(config)
+        results.append(result)
+        arch = ",".join(map(str, config["net_arch"]))
+        if "error" in result:
+            print(f"{config['n_envs']:>6} {arch:>10} {config['threads']:>7} {config['batch_size']:>5}  ERROR: {result['error']}")
+            continue
+        print(f"{config['n_envs']:>6} {arch:>10} {config['threads']:>7} {config['batch_size']:>5} "
+              f"{result['train_steps_per_sec']:>9.0f} {result['raw_env_steps_per_sec']:>11.0f} "
+              f"{result['updates_per_sec'] or 0:>9.0f} {result['peak_rss_mb']:>7.0f} {result['oracle_accuracy']:>10.3f}")
+
+    import torch
+    report = {
+        "created_at": datetime.utcnow().isoformat() + "Z",
+        "system": {"python": platform.python_version(), "torch": torch.__version__,
+                   "platform": platform.platform(), "cpu_count": os.cpu_count()},
+        "results": results,
+    }
+    # Compare before writing, so --baseline and --output may name the same file
+    failures = compare_to_baseline(results, args.baseline, args.tolerance) if args.baseline else []
+    failures.extend(f"{r['config']}: {r['error']}" for r in results if "error" in r)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=4)
+    print(f"\nResults written to {args.output}")
+
+    if failures:
+        print("\nRL benchmark FAILED:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,50 +1,132 @@
 import gymnasium as gym
 from gymnasium import spaces
 import numpy as np
-import random
 import json
 import os
 
+LOCATION_MAP = {"urban": 0, "suburban": 1, "rural": 2}
+NUM_ACTIONS = 5 # 5 possible rule choices from the original design
+OBS_LOW = np.array([0, 0, 0])
+OBS_HIGH = np.array([10000, 2, 100])
+
+def feedback_to_case(feedback):
+    """
+    Converts one feedback record into the same state/action format as the oracle cases.
+    Raises KeyError/TypeError for records without the case inputs or the agent's action.
+    """
+    params = feedback['input']['parameters']
+    state = [params['plot_size'], LOCATION_MAP[params['location']], params['road_width']]
+
+    # The action the agent took that the human voted on. Compact records keep it inline
+    # and the report by reference; older ones embed the report, which has it under
+    # "rl_decision" or, for the oldest, at its top level.
+    if 'rl_decision' in feedback:
+        action_taken = feedback['rl_decision']['optimal_action']
+    elif 'rl_decision' in feedback['output']:
+        action_taken = feedback['output']['rl_decision']['optimal_action']
+    else:
+        action_taken = feedback['output']['rl_optimal_action']
+
+    return {
+        "state": state,
+        "action_taken": action_taken,
+        "feedback": feedback['user_feedback'], # 'up' or 'down'
+        "source": 'human'
+    }
+
+def load_feedback_cases(feedback_file="io/feedback.jsonl", start_line=0):
+    """
+    Reads human feedback cases from line `start_line` onwards.
+    Returns (cases, lines_read) so callers can resume from where they stopped.
+    """
+    human_feedback_cases = []
+    lines_read = 0
+    if os.path.exists(feedback_file):
+        with open(feedback_file, 'r') as f:
+            for line_number, line in enumerate(f):
+                lines_read = line_number + 1
+                if line_number < start_line:
+                    continue
+                try:
+                    human_feedback_cases.append(feedback_to_case(json.loads(line)))
+                except (json.JSONDecodeError, KeyError, TypeError):
+                    # Skip corrupted or incomplete lines in the feedback file
+                    continue
+    return human_feedback_cases, lines_read
+
+def load_training_cases(oracle_file="rl_env/oracle_data.json", feedback_file="io/feedback.jsonl"):
+    """
+    Loads both knowledge sources and returns (synthetic_cases, human_feedback_cases).
+    """
+    # Source A: Synthetic "Textbook" Knowledge from our original oracle
+    synthetic_cases = []
+    if os.path.exists(oracle_file):
+        with open(oracle_file) as f:
+            synthetic_data = json.load(f)
+            for item in synthetic_data:
+                item['source'] = 'synthetic' # Tag to identify the source
+                synthetic_cases.append(item)
+    
+    # Source B: Human-in-the-Loop "Real-World" Feedback
+    human_feedback_cases, _ = load_feedback_cases(feedback_file)
+
+    return synthetic_cases, human_feedback_cases
+
+def build_reward_table(cases, num_actions=NUM_ACTIONS):
+    """
+    Compiles training cases into arrays: the states (num_cases x 3), a dense reward
+    matrix (num_cases x num_actions) and a boolean mask of the human feedback cases.
+    """
+    states = np.array([case["state"] for case in cases], dtype=np.float32).reshape(-1, 3)
+    is_human = np.array([case.get("source") == "human" for case in cases], dtype=bool)
+    actions = np.arange(num_actions)
+
+    correct_action = np.array([case.get("correct_action", -1) for case in cases])[:, None]
+    action_taken = np.array([case.get("action_taken", -1) for case in cases])[:, None]
+    vote_up = np.array([case.get("feedback") == "up" for case in cases])[:, None]
+
+    # Synthetic cases: +1 for the oracle's action, -1 otherwise
+    synthetic_rewards = np.where(actions == correct_action, 1, -1)
+    # Human cases: +2 for repeating an upvoted action, -2 for repeating a downvoted one,
+    # +1 for avoiding a downvoted action, 0 otherwise
+    same = actions == action_taken
+    human_rewards = np.where(same, np.where(vote_up, 2, -2), np.where(vote_up, 0, 1))
+
+    rewards = np.where(is_human[:, None], human_rewards, synthetic_rewards).astype(np.float32)
+    return states, rewards, is_human
+
+def sampling_weights(is_human, human_fraction=None):
+    """
+    Per-case sampling probabilities. With `human_fraction=None` every case is equally
+    likely; otherwise human feedback cases get `human_fraction` of the total mass.
+    """
+    num_cases = len(is_human)
+    num_human = int(is_human.sum())
+    if human_fraction is None or num_human == 0 or num_human == num_cases:
+        return np.full(num_cases, 1.0 / num_cases)
+    return np.where(is_human, human_fraction / num_human, (1.0 - human_fraction) / (num_cases - num_human))
+
+def evaluate_actions(reward_table, actions, is_human=None):
+    """
+    Exact offline evaluation of one action per case against the whole dataset.
+    Returns the mean reward overall and per source.
+    """
+    rewards = reward_table[np.arange(len(reward_table)), np.asarray(actions).reshape(-1)]
+    result = {"num_cases": len(rewards), "mean_reward": float(rewards.mean())}
+    if is_human is not None:
+        for source, mask in (("synthetic", ~is_human), ("human", is_human)):
+            result[f"{source}_mean_reward"] = float(rewards[mask].mean()) if mask.any() else None
+        # Best achievable score, to put the mean reward in context
+        result["max_mean_reward"] = float(reward_table.max(axis=1).mean())
+    return result
+
 class ComplexEnv(gym.Env):
-    def __init__(self):
+    def __init__(self, human_fraction=None, cases=None):
         super().__init__()
         
         # --- 1. LOAD BOTH KNOWLEDGE SOURCES ---
-        
-        # Source A: Synthetic "Textbook" Knowledge from our original oracle
-        synthetic_cases = []
-        if os.path.exists("rl_env/oracle_data.json"):
-            with open("rl_env/oracle_data.json") as f:
-                synthetic_data = json.load(f)
-                for item in synthetic_data:
-                    item['source'] = 'synthetic' # Tag to identify the source
-                    synthetic_cases.append(item)
-        
-        # Source B: Human-in-the-Loop "Real-World" Feedback
-        human_feedback_cases = []
-        feedback_file = "io/feedback.jsonl"
-        if os.path.exists(feedback_file):
-            with open(feedback_file, 'r') as f:
-                for line in f:
-                    try:
-                        feedback = json.loads(line)
-                        # Convert feedback into the same state/action format
-                        params = feedback['input']['parameters']
-                        location_map = {"urban": 0, "suburban": 1, "rural": 2}
-                        state = [params['plot_size'], location_map[params['location']], params['road_width']]
-                        
-                        # The action the agent took that the human voted on
-                        action_taken = feedback['output']['rl_optimal_action']
-                        
-                        human_feedback_cases.append({
-                            "state": state,
-                            "action_taken": action_taken,
-                            "feedback": feedback['user_feedback'], # 'up' or 'down'
-                            "source": 'human'
-                        })
-                    except (json.JSONDecodeError, KeyError):
-                        # Skip corrupted lines in the feedback file
-                        continue
+        # `cases` is an optional (synthetic_cases, human_feedback_cases) pair, e.g. for fine-tuning
+        synthetic_cases, human_feedback_cases = cases if cases is not None else load_training_cases()
 
         # Combine both knowledge sources into the final training set
         self.training_cases = synthetic_cases + human_feedback_cases
@@ -52,50 +134,41 @@ class ComplexEnv(gym.Env):
         if not self.training_cases:
             raise ValueError("No training data found. Please create oracle_data.json or provide feedback.")
 
+        # Compile the cases once: step() becomes a lookup into the reward table, and
+        # `human_fraction` optionally sets how often human feedback cases are sampled
+        self.states, self.reward_table, self.is_human = build_reward_table(self.training_cases)
+        self.sample_weights = sampling_weights(self.is_human, human_fraction)
+
         # --- 2. DEFINE SPACES ---
-        self.action_space = spaces.Discrete(5) # 5 possible rule choices from the original design
-        low_obs = np.array([0, 0, 0])
-        high_obs = np.array([10000, 2, 100])
-        self.observation_space = spaces.Box(low=low_obs, high=high_obs, dtype=np.float32)
+        self.action_space = spaces.Discrete(NUM_ACTIONS)
+        self.observation_space = spaces.Box(low=OBS_LOW, high=OBS_HIGH, dtype=np.float32)
         
-        self.current_case = None
+        self.current_index = None
         print(f"ComplexEnv (HIRL) initialized with {len(self.training_cases)} total cases ({len(human_feedback_cases)} from human feedback).")
         
     def reset(self, seed=None, options=None):
         super().reset(seed=seed)
-        # Pick a new random case from our combined training data
-        self.current_case = random.choice(self.training_cases)
+        # Pick a new case from our combined training data. The env's own seeded
+        # generator keeps parallel copies (e.g. in SubprocVecEnv) from sampling in lockstep.
+        self.current_index = self.np_random.choice(len(self.states), p=self.sample_weights)
         info = {}
-        return np.array(self.current_case["state"]).astype(np.float32), info
+        return self.states[self.current_index].copy(), info
 
     def step(self, action):
-        # --- 3. IMPLEMENT THE NEW REWARD LOGIC ---
-        source = self.current_case.get('source', 'synthetic')
-        
-        if source == 'human':
-            # This case came from a human. Use the stronger +/- 2 reward.
-            action_the_human_saw = self.current_case['action_taken']
-            human_vote = self.current_case['feedback']
-            
-            # If the agent takes the same action that was UPVOTED
-            if action == action_the_human_saw and human_vote == 'up':
-                reward = 2  # Strong positive reward for agreeing with a good choice
-            # If the agent takes the same action that was DOWNVOTED
-            elif action == action_the_human_saw and human_vote == 'down':
-                reward = -2 # Strong negative reward for repeating a bad choice
-            # If the agent AVOIDS a downvoted action, that's good!
-            elif action != action_the_human_saw and human_vote == 'down':
-                reward = 1 # Small positive reward for avoiding a bad choice
-            else:
-                reward = 0 # Neutral reward for other scenarios
-        else:
-            # This is a synthetic case from the oracle. Use the original +/- 1 reward.
-            correct_action = self.current_case["correct_action"]
-            reward = 1 if action == correct_action else -1
+        # --- 3. LOOK UP THE REWARD ---
+        # Human cases give +/- 2 rewards, synthetic oracle cases +/- 1 (see build_reward_table)
+        reward = float(self.reward_table[self.current_index, action])
 
         terminated = True
         truncated = False
-        info = {}
+        info = {"source": "human" if self.is_human[self.current_index] else "synthetic"}
         
-        current_state = np.array(self.current_case["state"]).astype(np.float32)
-        return current_state, reward, terminated, truncated, info
\ No newline at end of file
+        return self.states[self.current_index].copy(), reward, terminated, truncated, info
+
+    def evaluate_policy(self, agent, deterministic=True):
+        """
+        Scores an agent (anything with an SB3-style `predict`) against every case
+        in the dataset at once, with no sampling noise.
+        """
+        actions, _ = agent.predict(self.states, deterministic=deterministic)
+        return evaluate_actions(self.reward_table, actions, self.is_human)
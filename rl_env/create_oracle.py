@@ -1,96 +1,252 @@
+import argparse
+import hashlib
 import json
 import os
 import re
-from dotenv import load_dotenv
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
 
-# Import all the necessary components from our RAG agent
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain.prompts import PromptTemplate
-from langchain.chains import create_retrieval_chain
-from langchain.chains.combine_documents import create_stuff_documents_chain
+FAISS_INDEX_PATH = "rules_kb/faiss_index_mpnet"
+ANSWER_CACHE_PATH = "rl_env/oracle_cache.sqlite"
+NUM_ACTIONS = 5
+LOCATION_MAP = {"urban": 0, "suburban": 1, "rural": 2}
 
-print("--- Starting Intelligent Oracle Creation Process ---")
-
-# --- 1. SETUP THE RAG AGENT (Our "Teacher") ---
-load_dotenv()
-os.environ["GOOGLE_API_KEY"] = os.getenv("GEMINI_API_KEY")
-
-embeddings = HuggingFaceEmbeddings(model_name="all-mpnet-base-v2")
-vector_store = FAISS.load_local("rules_kb/faiss_index_mpnet", embeddings, allow_dangerous_deserialization=True)
-retriever = vector_store.as_retriever(search_kwargs={"k": 5})
-llm = ChatGoogleGenerativeAI(model="gemini-pro-latest")
-prompt = PromptTemplate.from_template(
-    """You are an AI assistant that extracts information.
+PROMPT_TEMPLATE = """You are an AI assistant that extracts information.
     Based on the <context>, identify the specific point numbers of rules relevant to the <Question>.
     Your final output MUST be a Python list of ONLY the point numbers (e.g., ['(2)', 'section 34']).
     If no rules apply, return an empty list.
-    
+
     <context>{context}</context>
     Question: {input}"""
-)
-question_answer_chain = create_stuff_documents_chain(llm, prompt)
-retrieval_chain = create_retrieval_chain(retriever, question_answer_chain)
-print("Classification Agent (Teacher) is ready.")
-
-# --- 2. LOAD THE SYNTHETIC CASES ---
-with open("io/synthetic_cases.json") as f:
-    synthetic_cases = json.load(f)
-print(f"Loaded {len(synthetic_cases)} cases.")
-
-# --- 3. PROCESS CASES AND CREATE A LEARNABLE ORACLE ---
-print("Processing cases to create a learnable oracle. This will take a few minutes...")
-oracle_data = []
-location_map = {"urban": 0, "suburban": 1, "rural": 2}
-
-for i, case in enumerate(synthetic_cases):
-    print(f"  Processing case {i+1}/{len(synthetic_cases)}...")
-    
-    # --- NEW: Injecting Logical, Learnable Rules ---
-    plot_size = case["plot_size"]
-    location = case["location"]
-    road_width = case["road_width"]
-    
-    # This is our "secret pattern" that a smart agent can learn
-    if road_width > 25 and location == "urban":
-        correct_action = 4 # e.g., "Apply High-Density Bonus"
-    elif plot_size < 1000 and road_width < 10:
-        correct_action = 1 # e.g., "Apply Small Plot Restriction"
-    else:
-        # For all other cases, we use the RAG agent's output to create noisy, but realistic data
-        input_str = f"Find rules for: {json.dumps(case)}"
-        response = retrieval_chain.invoke({"input": input_str})
-        answer_str = response.get("answer", "[]")
-        
+
+# --- 1. SETUP THE RAG AGENT (Our "Teacher") ---
+def build_teacher_chain(index_path=FAISS_INDEX_PATH):
+    """
+    Builds the retrieval chain that labels the cases the hard-coded rules don't cover.
+    It is deliberately not wrapped in a SemanticCache: the case questions differ
+    only in their numbers, which sentence embeddings barely tell apart, so one
+    case's answer could be reused for another and end up in the training data.
+    True repeats are answered by the exact-match AnswerCache instead.
+    """
+    from dotenv import load_dotenv
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    from langchain_community.vectorstores import FAISS
+    from langchain.prompts import PromptTemplate
+    from langchain.chains import create_retrieval_chain
+    from langchain.chains.combine_documents import create_stuff_documents_chain
+
+    load_dotenv()
+    os.environ["GOOGLE_API_KEY"] = os.getenv("GEMINI_API_KEY")
+
+    embeddings = HuggingFaceEmbeddings(model_name="all-mpnet-base-v2")
+    vector_store = FAISS.load_local(index_path, embeddings, allow_dangerous_deserialization=True)
+    retriever = vector_store.as_retriever(search_kwargs={"k": 5})
+    llm = ChatGoogleGenerativeAI(model="gemini-pro-latest")
+    question_answer_chain = create_stuff_documents_chain(llm, PromptTemplate.from_template(PROMPT_TEMPLATE))
+    return create_retrieval_chain(retriever, question_answer_chain)
+
+# --- 2. LABELLING RULES ---
+def rule_based_action(case):
+    """The "secret pattern" that a smart agent can learn. Returns None when the teacher must decide."""
+    if case["road_width"] > 25 and case["location"] == "urban":
+        return 4 # e.g., "Apply High-Density Bonus"
+    if case["plot_size"] < 1000 and case["road_width"] < 10:
+        return 1 # e.g., "Apply Small Plot Restriction"
+    return None
+
+def stable_action(point_number: str) -> int:
+    """
+    Maps a rule point number to an action. Python's hash() is salted per process,
+    so a sha256 digest is used instead to keep labels the same on every run.
+    """
+    return int(hashlib.sha256(point_number.encode("utf-8")).hexdigest(), 16) % NUM_ACTIONS
+
+def action_from_answer(answer_str: str) -> int:
+    # Use the FIRST rule found to create a semi-random action, for noisy but realistic data
+    point_numbers = re.findall(r"'(.*?)'", answer_str or "")
+    return stable_action(point_numbers[0]) if point_numbers else 0 # Default action if no rules are found
+
+def case_question(case) -> str:
+    return f"Find rules for: {json.dumps(case)}"
+
+# --- 3. PERSISTENT ANSWER CACHE AND RATE LIMIT ---
+def index_content_version(index_path: str = FAISS_INDEX_PATH) -> str:
+    """
+    Fingerprint of the FAISS index files' contents. Unlike the in-memory cache's
+    mtime-based version, this survives fresh checkouts and copies of the index.
+    """
+    digest = hashlib.sha256()
+    if os.path.isdir(index_path):
+        for name in sorted(os.listdir(index_path)):
+            digest.update(name.encode("utf-8"))
+            with open(os.path.join(index_path, name), "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+class AnswerCache:
+    """
+    SQLite store of teacher answers keyed by a sha256 of the question and the
+    FAISS index version, so rebuilds only call the LLM for new cases or after
+    the index changes. Safe to share between threads.
+    """
+    def __init__(self, path: str = ANSWER_CACHE_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        # Same counters as the API's caches, so the hit rate can be exported the same way
+        self.hits = 0
+        self.misses = 0
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                "key TEXT PRIMARY KEY, question TEXT, answer TEXT, index_version TEXT, created_at TEXT)"
+            )
+            self._conn.commit()
+
+    @staticmethod
+    def key_for(question: str, version: str) -> str:
+        return hashlib.sha256(f"{version}\n{question}".encode("utf-8")).hexdigest()
+
+    def get(self, question: str, version: str):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT answer FROM answers WHERE key = ?", (self.key_for(question, version),)
+            ).fetchone()
+            if row:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return row[0] if row else None
+
+    def put(self, question: str, version: str, answer: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?)",
+                (self.key_for(question, version), question, answer, version, datetime.utcnow().isoformat() + "Z")
+            )
+            self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+class RateLimiter:
+    """Spaces out calls so that at most `rate_per_second` start per second across all threads."""
+    def __init__(self, rate_per_second: float):
+        self.interval = 1.0 / rate_per_second if rate_per_second > 0 else 0.0
+        self._next_slot = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+# --- 4. BUILD THE ORACLE ---
+def ask_teacher(chain, question, limiter, retries=3):
+    for attempt in range(retries):
+        limiter.wait()
         try:
-            point_numbers = re.findall(r"'(.*?)'", answer_str)
-        except Exception:
-            point_numbers = []
-        
-        if point_numbers:
-            # Use the hash of the FIRST rule found to create a semi-random action
-            correct_action = hash(point_numbers[0]) % 5
-        else:
-            correct_action = 0 # Default action if no rules are found
-
-    # Convert the case to a numerical state
-    state = [
-        case["plot_size"],
-        location_map[case["location"]],
-        case["road_width"]
+            return chain.invoke({"input": question}).get("answer", "[]")
+        except Exception as e:
+            if attempt == retries - 1:
+                raise
+            print(f"  Teacher call failed ({e}); retrying...")
+            time.sleep(2 ** attempt)
+
+def build_oracle(cases, chain_factory, answer_cache, version, workers=8, rate_per_second=4.0, retries=3):
+    """
+    Labels every case. Rule-based and cached cases are labelled immediately; the
+    rest are sent to the teacher concurrently, at most `rate_per_second` calls per
+    second. `chain_factory` is only called if some case needs the teacher.
+    Returns (oracle_data, stats). If some teacher calls still fail after
+    `retries` attempts, every answer that did arrive is cached first, and then
+    a RuntimeError is raised.
+    """
+    actions = [None] * len(cases)
+    pending = {}
+    stats = {"cases": len(cases), "teacher_calls": 0, "cached": 0}
+    for i, case in enumerate(cases):
+        action = rule_based_action(case)
+        if action is None:
+            answer = answer_cache.get(case_question(case), version)
+            if answer is None:
+                pending[i] = case_question(case)
+                continue
+            stats["cached"] += 1
+            action = action_from_answer(answer)
+        actions[i] = action
+    stats["teacher_calls"] = len(pending)
+
+    if pending:
+        chain = chain_factory()
+        limiter = RateLimiter(rate_per_second)
+        print(f"Asking the teacher about {len(pending)} cases with {workers} workers...")
+        failures = []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(ask_teacher, chain, question, limiter, retries): i for i, question in pending.items()}
+            for done, future in enumerate(as_completed(futures), start=1):
+                i = futures[future]
+                try:
+                    answer = future.result()
+                except Exception as e:
+                    # Keep going, so the answers still in flight are cached and a rerun does not pay for them again
+                    failures.append(e)
+                    continue
+                answer_cache.put(pending[i], version, answer)
+                actions[i] = action_from_answer(answer)
+                if done % 100 == 0 or done == len(futures):
+                    print(f"  Labelled {done}/{len(futures)} teacher cases...")
+        if failures:
+            raise RuntimeError(
+                f"The teacher failed on {len(failures)} of {len(pending)} cases (first error: {failures[0]}); "
+                f"the other {len(pending) - len(failures)} answers are cached, so a rerun only asks about the failed cases."
+            ) from failures[0]
+
+    # Convert each case to a numerical state
+    oracle_data = [
+        {"state": [case["plot_size"], LOCATION_MAP[case["location"]], case["road_width"]], "correct_action": action}
+        for case, action in zip(cases, actions)
     ]
-    
-    oracle_data.append({
-        "state": state,
-        "correct_action": correct_action
-    })
+    return oracle_data, stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Label the synthetic cases to create the RL oracle.")
+    parser.add_argument("--cases", default="io/synthetic_cases.json", help="Cases generated by generate_data.py.")
+    parser.add_argument("--output", default="rl_env/oracle_data.json")
+    parser.add_argument("--cache", default=ANSWER_CACHE_PATH, help="SQLite file of cached teacher answers.")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent teacher calls.")
+    parser.add_argument("--rate", type=float, default=4.0, help="Maximum teacher calls started per second.")
+    args = parser.parse_args()
+
+    print("--- Starting Intelligent Oracle Creation Process ---")
+    with open(args.cases) as f:
+        synthetic_cases = json.load(f)
+    print(f"Loaded {len(synthetic_cases)} cases.")
 
-# --- 4. SAVE THE NEW ORACLE ---
-output_path = "rl_env/oracle_data.json"
-with open(output_path, "w") as f:
-    json.dump(oracle_data, f, indent=4)
+    answer_cache = AnswerCache(args.cache)
+    start = time.perf_counter()
+    oracle_data, stats = build_oracle(
+        synthetic_cases, build_teacher_chain, answer_cache, index_content_version(FAISS_INDEX_PATH),
+        workers=args.workers, rate_per_second=args.rate
+    )
+    answer_cache.close()
 
-print(f"\nSuccessfully created new, learnable oracle with {len(oracle_data)} entries.")
+    # --- 5. SAVE THE NEW ORACLE ---
+    with open(args.output, "w") as f:
+        json.dump(oracle_data, f, indent=4)
+    print(f"\nSuccessfully created new, learnable oracle with {len(oracle_data)} entries in {time.perf_counter() - start:.1f}s "
+          f"({stats['teacher_calls']} teacher calls, {stats['cached']} cached answers).")
+    lookups = answer_cache.hits + answer_cache.misses
+    if lookups:
+        print(f"Answer cache hit rate: {answer_cache.hits / lookups:.1%} of {lookups} lookups.")
 
-    
+if __name__ == "__main__":
+    main()
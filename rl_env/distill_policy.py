@@ -0,0 +1,99 @@
+import argparse
+import json
+import time
+import numpy as np
+import torch
+from stable_baselines3 import PPO
+
+from complex_env import LOCATION_MAP, OBS_LOW, OBS_HIGH
+from distilled_policy import DistilledPolicy, DISTILLED_POLICY_PATH
+from policy_registry import current_checkpoint
+
+def policy_probabilities(agent, observations, batch_size=65536):
+    """Action probabilities of a PPO agent for a batch of observations."""
+    chunks = []
+    with torch.no_grad():
+        for start in range(0, len(observations), batch_size):
+            obs = torch.as_tensor(observations[start:start + batch_size], dtype=torch.float32, device=agent.device)
+            chunks.append(agent.policy.get_distribution(obs).distribution.probs.cpu().numpy())
+    return np.concatenate(chunks)
+
+def distill(agent, plot_step=10.0, road_step=1.0, metadata=None):
+    """
+    Samples the policy on a dense grid over the observation space and returns a
+    DistilledPolicy holding its action probabilities at every grid point.
+    """
+    plot_count = int(round((OBS_HIGH[0] - OBS_LOW[0]) / plot_step)) + 1
+    road_count = int(round((OBS_HIGH[2] - OBS_LOW[2]) / road_step)) + 1
+    plot_sizes = OBS_LOW[0] + plot_step * np.arange(plot_count)
+    road_widths = OBS_LOW[2] + road_step * np.arange(road_count)
+
+    grid = np.stack(np.meshgrid(plot_sizes, np.arange(len(LOCATION_MAP)), road_widths, indexing="ij"), axis=-1)
+    probabilities = policy_probabilities(agent, grid.reshape(-1, 3).astype(np.float32))
+    probabilities = probabilities.reshape(plot_count, len(LOCATION_MAP), road_count, -1)
+
+    return DistilledPolicy(
+        probabilities,
+        (float(OBS_LOW[0]), plot_step, plot_count),
+        (float(OBS_LOW[2]), road_step, road_count),
+        actions=probabilities.argmax(axis=-1),
+        metadata=metadata
+    )
+
+def agreement_report(agent, distilled, num_samples=100000, seed=0):
+    """
+    Compares the distilled policy with the PPO agent on random observations:
+    integer-valued ones like the API sends, and continuous ones between grid points.
+    """
+    rng = np.random.default_rng(seed)
+    report = {}
+    for name, integer in (("integer_inputs", True), ("continuous_inputs", False)):
+        obs = np.column_stack([
+            rng.uniform(OBS_LOW[0], OBS_HIGH[0], num_samples),
+            rng.integers(0, len(LOCATION_MAP), num_samples),
+            rng.uniform(OBS_LOW[2], OBS_HIGH[2], num_samples)
+        ])
+        if integer:
+            obs = np.rint(obs)
+        obs = obs.astype(np.float32)
+        ppo_probs = policy_probabilities(agent, obs)
+        ppo_actions = ppo_probs.argmax(axis=1)
+        distilled_actions, _ = distilled.predict(obs)
+        distilled_probs = distilled.action_probabilities(obs)
+        report[name] = {
+            "action_agreement": float((ppo_actions == distilled_actions).mean()),
+            "mean_confidence_error": float(np.abs(
+                ppo_probs[np.arange(num_samples), ppo_actions] - distilled_probs[np.arange(num_samples), ppo_actions]
+            ).mean())
+        }
+
+    # Single-request latency, as the API calls it
+    obs = np.array([1500, 1, 12], dtype=np.float32)
+    for name, predict in (("ppo", lambda: agent.predict(obs, deterministic=True)),
+                          ("distilled", lambda: distilled.predict_with_confidence(obs))):
+        start = time.perf_counter()
+        for _ in range(1000):
+            predict()
+        report[f"{name}_latency_us"] = round((time.perf_counter() - start) * 1000, 2)
+    return report
+
+if __name__ == "__main__":
+    checkpoint = current_checkpoint()
+    parser = argparse.ArgumentParser(description="Distill the HIRL PPO agent into a lookup grid served without torch.")
+    parser.add_argument("--model", default=checkpoint["path"], help="PPO model to distill (default: the current checkpoint).")
+    parser.add_argument("--output", default=DISTILLED_POLICY_PATH)
+    parser.add_argument("--plot-step", type=float, default=10.0, help="Grid spacing for plot_size.")
+    parser.add_argument("--road-step", type=float, default=1.0, help="Grid spacing for road_width.")
+    args = parser.parse_args()
+
+    agent = PPO.load(args.model, device="cpu")
+    source_version = checkpoint["version"] if args.model == checkpoint["path"] else None
+    print(f"--- Distilling {args.model} ---")
+    distilled = distill(agent, args.plot_step, args.road_step,
+                        metadata={"source_model": args.model, "source_version": source_version})
+    report = agreement_report(agent, distilled)
+    distilled.metadata["agreement"] = report
+    distilled.save(args.output)
+
+    print(f"Grid of {distilled.actions.size} points saved to {args.output}")
+    print(json.dumps(report, indent=4))
@@ -0,0 +1,95 @@
+"""
+Runtime for a PPO policy distilled into a quantized lookup grid.
+
+The grid holds the policy's action probabilities at evenly spaced
+(plot_size, location, road_width) points. Inference snaps the observation to
+the nearest grid point and reads one row, so it needs only NumPy. Observations
+outside the grid are answered from its nearest edge, where PPO may disagree;
+out_of_range() tells callers which ones those are. The API
+imports this module as `rl_env.distilled_policy`; the grid itself is built by
+rl_env/distill_policy.py.
+"""
+import json
+
+import numpy as np
+
+DISTILLED_POLICY_PATH = "rl_env/ppo_hirl_distilled.npz"
+
+class DistilledPolicy:
+    def __init__(self, probabilities, plot_size_axis, road_width_axis, actions=None, metadata=None):
+        # probabilities: (num_plot_sizes, num_locations, num_road_widths, num_actions)
+        self.probabilities = probabilities.astype(np.float32)
+        # The greedy actions are stored separately so float16 rounding cannot flip near-ties
+        self.actions = actions if actions is not None else self.probabilities.argmax(axis=-1)
+        self.plot_size_axis = plot_size_axis  # (start, step, count)
+        self.road_width_axis = road_width_axis
+        self.metadata = metadata or {}
+
+    @classmethod
+    def load(cls, path: str = DISTILLED_POLICY_PATH):
+        with np.load(path) as data:
+            return cls(
+                data["probabilities"],
+                tuple(data["plot_size_axis"].tolist()),
+                tuple(data["road_width_axis"].tolist()),
+                data["actions"],
+                json.loads(str(data["metadata"]))
+            )
+
+    def save(self, path: str = DISTILLED_POLICY_PATH):
+        np.savez_compressed(
+            path,
+            probabilities=self.probabilities.astype(np.float16),
+            plot_size_axis=np.array(self.plot_size_axis, dtype=np.float64),
+            road_width_axis=np.array(self.road_width_axis, dtype=np.float64),
+            actions=self.actions.astype(np.uint8),
+            metadata=np.array(json.dumps(self.metadata))
+        )
+
+    @property
+    def source_version(self):
+        return self.metadata.get("source_version")
+
+    @staticmethod
+    def _snap(values, axis):
+        start, step, count = axis
+        return np.clip(np.rint((values - start) / step), 0, int(count) - 1).astype(np.int64)
+
+    def _grid_index(self, observations):
+        obs = np.asarray(observations, dtype=np.float64).reshape(-1, 3)
+        return (
+            self._snap(obs[:, 0], self.plot_size_axis),
+            np.clip(np.rint(obs[:, 1]), 0, self.probabilities.shape[1] - 1).astype(np.int64),
+            self._snap(obs[:, 2], self.road_width_axis)
+        )
+
+    @staticmethod
+    def _outside(values, axis):
+        start, step, count = axis
+        return (values < start) | (values > start + step * (int(count) - 1))
+
+    def out_of_range(self, observations) -> np.ndarray:
+        """Boolean mask of the observations outside the grid, shape (N,)."""
+        obs = np.asarray(observations, dtype=np.float64).reshape(-1, 3)
+        return (
+            self._outside(obs[:, 0], self.plot_size_axis)
+            | (obs[:, 1] < 0) | (obs[:, 1] > self.probabilities.shape[1] - 1)
+            | self._outside(obs[:, 2], self.road_width_axis)
+        )
+
+    def action_probabilities(self, observations) -> np.ndarray:
+        """Action probabilities for a batch of observations, shape (N, num_actions)."""
+        return self.probabilities[self._grid_index(observations)]
+
+    def predict(self, observation, state=None, episode_start=None, deterministic=True):
+        """SB3-compatible predict. Always deterministic: the grid stores the greedy action."""
+        actions = self.actions[self._grid_index(observation)]
+        if np.ndim(observation) == 1:
+            return actions[0], None
+        return actions, None
+
+    def predict_with_confidence(self, observation):
+        """Returns (action, probability of that action) for a single observation."""
+        index = self._grid_index(observation)
+        action = int(self.actions[index][0])
+        return action, float(self.probabilities[index][0, action])
@@ -0,0 +1,96 @@
+import argparse
+import json
+import os
+from stable_baselines3 import PPO
+
+# --- Import our environment and the checkpoint registry ---
+from complex_env import ComplexEnv, load_training_cases, load_feedback_cases
+from vec_complex_env import make_complex_vec_env
+from policy_registry import (MANIFEST_PATH, current_checkpoint, consumed_feedback_lines, checkpoint_path,
+                             next_version, register_checkpoint)
+
+def finetune(feedback_file="io/feedback.jsonl", timesteps=10000, n_envs=8, human_fraction=0.5,
+             learning_rate=None, max_regression=0.05, notify_url=None, manifest_path=MANIFEST_PATH):
+    """
+    Fine-tunes the current policy on the feedback rows no earlier run has used.
+
+    The oracle cases are replayed alongside the new feedback so the agent does not
+    forget them. `human_fraction` sets how much of the training comes from the new
+    feedback. The new checkpoint is made current unless its offline mean reward on
+    the full dataset drops by more than `max_regression`; either way its feedback
+    counts as consumed, so a rejected batch is not retried on every later run.
+    """
+    # 1. Find the current policy and the feedback no run has used yet
+    current = current_checkpoint(manifest_path)
+    start_line = consumed_feedback_lines(manifest_path)
+    new_cases, feedback_lines = load_feedback_cases(feedback_file, start_line=start_line)
+    if not new_cases:
+        print(f"No new feedback since line {start_line} (current version {current['version']}). Nothing to do.")
+        return None
+    print(f"--- Fine-tuning version {current['version']} on {len(new_cases)} new feedback cases ---")
+
+    # 2. Train on the oracle replay plus the new feedback only
+    synthetic_cases, _ = load_training_cases(feedback_file=feedback_file)
+    env = make_complex_vec_env(num_envs=n_envs, human_fraction=human_fraction, cases=(synthetic_cases, new_cases))
+    custom_objects = {"learning_rate": learning_rate} if learning_rate is not None else None
+    agent = PPO.load(current["path"], env=env, custom_objects=custom_objects)
+
+    # 3. Score before and after on every oracle and feedback case
+    eval_env = ComplexEnv(cases=load_training_cases(feedback_file=feedback_file))
+    before = eval_env.evaluate_policy(agent)
+    agent.learn(total_timesteps=timesteps, reset_num_timesteps=False)
+    after = eval_env.evaluate_policy(agent)
+    env.close()
+    print(f"Offline mean reward: {before['mean_reward']:.3f} -> {after['mean_reward']:.3f}")
+
+    # 4. Save a new versioned checkpoint; the manifest is only updated once the file is complete
+    version = next_version(manifest_path)
+    path = checkpoint_path(version, os.path.dirname(manifest_path))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    agent.save(path)
+
+    promote = after["mean_reward"] >= before["mean_reward"] - max_regression
+    entry = register_checkpoint(
+        version, path, feedback_lines, promote=promote,
+        parent_version=current["version"], new_feedback_cases=len(new_cases),
+        timesteps=timesteps, evaluation_before=before, evaluation_after=after, manifest_path=manifest_path
+    )
+    if promote:
+        print(f"Checkpoint v{version} saved to {path} and promoted to current.")
+        if notify_url:
+            notify_server(notify_url)
+    else:
+        print(f"Checkpoint v{version} saved to {path} but NOT promoted: mean reward regressed.")
+    return entry
+
+def notify_server(url):
+    """
+    Asks a running API server to hot-swap to the current checkpoint. Under serve.py
+    the worker that receives the request forwards it to the master, which reloads
+    every worker.
+    """
+    import requests
+
+    try:
+        response = requests.post(url, timeout=30)
+        print(f"Server reload: {response.status_code} {response.text}")
+    except requests.RequestException as e:
+        print(f"Could not reach the server at {url}: {e}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incrementally fine-tune the HIRL agent on new human feedback.")
+    parser.add_argument("--feedback", default="io/feedback.jsonl", help="Feedback file to read new rows from.")
+    parser.add_argument("--timesteps", type=int, default=10000, help="Environment steps to fine-tune for.")
+    parser.add_argument("--n-envs", type=int, default=8, help="Number of parallel environments.")
+    parser.add_argument("--human-fraction", type=float, default=0.5, help="Share of samples drawn from the new feedback.")
+    parser.add_argument("--learning-rate", type=float, default=None, help="Override the checkpoint's learning rate.")
+    parser.add_argument("--max-regression", type=float, default=0.05,
+                        help="Largest drop in offline mean reward that still promotes the checkpoint.")
+    parser.add_argument("--notify-url", default=None,
+                        help="Reload endpoint of a running server, e.g. http://127.0.0.1:8000/rl_agent/reload")
+    args = parser.parse_args()
+
+    entry = finetune(args.feedback, args.timesteps, args.n_envs, args.human_fraction,
+                     args.learning_rate, args.max_regression, args.notify_url)
+    if entry:
+        print(json.dumps({k: entry[k] for k in ("version", "path", "feedback_lines", "promoted")}, indent=4))
@@ -1,26 +1,51 @@
+import argparse
 import json
 
-print("Generating a representative set of synthetic cases...")
-
-synthetic_cases = []
-
 # Define a representative set of values for each parameter
 plot_sizes = [500, 1500, 3000, 4500]
 locations = ["urban", "suburban", "rural"]
 road_widths = [6, 9, 12, 18, 24, 30]
 
-for size in plot_sizes:
-    for loc in locations:
-        for width in road_widths:
-            case = {
-                "plot_size": size,
-                "location": loc,
-                "road_width": width
-            }
-            synthetic_cases.append(case)
-
-output_path = "io/synthetic_cases.json"
-with open(output_path, "w") as f:
-    json.dump(synthetic_cases, f, indent=4)
-
-print(f"Successfully generated and saved {len(synthetic_cases)} representative cases to {output_path}")
\ No newline at end of file
+def value_range(start, stop, step):
+    """Inclusive range of evenly spaced values, e.g. value_range(500, 5000, 100)."""
+    if not step > 0:
+        raise ValueError(f"step must be positive, got {step}")
+    values = []
+    value = start
+    while value <= stop:
+        values.append(value)
+        value += step
+    return values
+
+def generate_cases(plot_sizes=plot_sizes, locations=locations, road_widths=road_widths):
+    return [
+        {"plot_size": size, "location": loc, "road_width": width}
+        for size in plot_sizes
+        for loc in locations
+        for width in road_widths
+    ]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate the synthetic cases that create_oracle.py labels.")
+    parser.add_argument("--plot-size-range", type=int, nargs=3, metavar=("START", "STOP", "STEP"),
+                        help="Plot sizes from START to STOP (inclusive), e.g. 500 5000 100.")
+    parser.add_argument("--road-width-range", type=int, nargs=3, metavar=("START", "STOP", "STEP"),
+                        help="Road widths from START to STOP (inclusive), e.g. 6 30 1.")
+    parser.add_argument("--output", default="io/synthetic_cases.json")
+    args = parser.parse_args()
+
+    if args.plot_size_range or args.road_width_range:
+        print("Generating a grid of synthetic cases...")
+    else:
+        print("Generating a representative set of synthetic cases...")
+
+    synthetic_cases = generate_cases(
+        value_range(*args.plot_size_range) if args.plot_size_range else plot_sizes,
+        locations,
+        value_range(*args.road_width_range) if args.road_width_range else road_widths
+    )
+
+    with open(args.output, "w") as f:
+        json.dump(synthetic_cases, f, indent=4)
+
+    print(f"Successfully generated and saved {len(synthetic_cases)} representative cases to {args.output}")
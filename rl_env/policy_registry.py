@@ -0,0 +1,85 @@
+"""
+Versioned checkpoints of the HIRL policy.
+
+The manifest (rl_env/checkpoints/manifest.json) lists every fine-tuned
+checkpoint and which one is current. The API loads the current policy, and the
+fine-tuner writes new checkpoints; once a manifest exists, a full retrain is
+registered in it too. The module only uses the standard library,
+so the API can import it as `rl_env.policy_registry`.
+"""
+import json
+import os
+from datetime import datetime
+
+BASE_POLICY_PATH = "rl_env/ppo_hirl_agent.zip"
+CHECKPOINT_DIR = "rl_env/checkpoints"
+MANIFEST_PATH = os.path.join(CHECKPOINT_DIR, "manifest.json")
+
+def read_manifest(manifest_path: str = MANIFEST_PATH) -> dict:
+    """Returns the manifest, or an empty one if no checkpoint has been written yet."""
+    if not os.path.exists(manifest_path):
+        return {"current": None, "checkpoints": []}
+    with open(manifest_path, "r") as f:
+        return json.load(f)
+
+def write_manifest(manifest: dict, manifest_path: str = MANIFEST_PATH):
+    """Writes the manifest atomically, so readers never see a half-written file."""
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(tmp_path, manifest_path)
+
+def current_checkpoint(manifest_path: str = MANIFEST_PATH) -> dict:
+    """
+    Returns the entry of the current policy. Before the first fine-tune this is the
+    base policy trained by train_complex_agent.py, at version 0 with no feedback consumed.
+    """
+    manifest = read_manifest(manifest_path)
+    for entry in manifest["checkpoints"]:
+        if entry["version"] == manifest["current"]:
+            return entry
+    return {"version": 0, "path": BASE_POLICY_PATH, "feedback_lines": 0}
+
+def consumed_feedback_lines(manifest_path: str = MANIFEST_PATH) -> int:
+    """
+    How many lines of the feedback file fine-tuning has used so far. Checkpoints
+    that were not promoted count too: their feedback was tried and rejected, and
+    is not trained on again by every later run. A full retrain restarts the count
+    at the lines it was trained on.
+    """
+    consumed = 0
+    for entry in read_manifest(manifest_path)["checkpoints"]:
+        consumed = entry["feedback_lines"] if entry.get("full_retrain") else max(consumed, entry["feedback_lines"])
+    return consumed
+
+def current_policy_path(manifest_path: str = MANIFEST_PATH) -> str:
+    return current_checkpoint(manifest_path)["path"]
+
+def checkpoint_path(version: int, checkpoint_dir: str = CHECKPOINT_DIR) -> str:
+    return os.path.join(checkpoint_dir, f"ppo_hirl_v{version:04d}.zip")
+
+def next_version(manifest_path: str = MANIFEST_PATH) -> int:
+    manifest = read_manifest(manifest_path)
+    return max([entry["version"] for entry in manifest["checkpoints"]], default=0) + 1
+
+def register_checkpoint(version: int, path: str, feedback_lines: int, promote: bool = True,
+                        manifest_path: str = MANIFEST_PATH, **details) -> dict:
+    """
+    Records a new checkpoint in the manifest and, if `promote`, makes it current.
+    `feedback_lines` is how many lines of the feedback file it has been trained on.
+    """
+    manifest = read_manifest(manifest_path)
+    entry = {
+        "version": version,
+        "path": path,
+        "feedback_lines": feedback_lines,
+        "created_at": datetime.utcnow().isoformat() + "Z",
+        "promoted": promote,
+        **details
+    }
+    manifest["checkpoints"].append(entry)
+    if promote:
+        manifest["current"] = version
+    write_manifest(manifest, manifest_path)
+    return entry
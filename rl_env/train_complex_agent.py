@@ -1,61 +1,102 @@
+import argparse
 import json
 import numpy as np
 import os
 from stable_baselines3 import PPO
 
-# --- Import our Human-in-the-Loop environment ---
-from complex_env import ComplexEnv
-
-# 1. Create the environment
-env = ComplexEnv()
-
-# 2. --- UPGRADE: Define a more powerful agent architecture ---
-# We'll give the agent a bigger "brain" with two hidden layers of 128 neurons each.
-policy_kwargs = dict(net_arch=dict(pi=[128, 128], vf=[128, 128]))
-
-# We create the agent with the new brain and encourage it to be more "curious"
-# The `ent_coef` parameter rewards the agent for exploring different actions.
-agent = PPO(
-    "MlpPolicy", 
-    env, 
-    policy_kwargs=policy_kwargs, 
-    ent_coef=0.01, # Entropy coefficient to encourage exploration
-    verbose=0
-) 
-
-# 3. Train the new, smarter agent
-print("\n--- Starting HIRL Training with Advanced Agent (100k steps)... ---")
-agent.learn(total_timesteps=100000)
-print("--- Training Complete. ---")
-
-# 4. Save the final, human-guided model
-output_path = "rl_env/ppo_hirl_agent.zip"
-agent.save(output_path)
-print(f"Human-in-the-Loop trained agent saved to {output_path}")
-
-# 5. Test the newly trained agent on the original "textbook" cases
-print("\n--- Testing Trained Agent on Original Oracle Cases ---")
-oracle_file = "rl_env/oracle_data.json"
-if os.path.exists(oracle_file):
-    with open(oracle_file, 'r') as f:
-        oracle_cases = json.load(f)
-    
-    correct_count = 0
-    test_cases = oracle_cases[:10] # Test on the first 10 cases
-
-    for case in test_cases:
-        obs = np.array(case["state"]).astype(np.float32)
-        action, _ = agent.predict(obs, deterministic=True)
-        correct_action = case["correct_action"]
-        
-        if action == correct_action:
-            correct_count += 1
-        
-        print(f"  - For state={case['state']}, Agent chose: {action}, Correct was: {correct_action}")
-    
-    if test_cases:
-        accuracy = (correct_count / len(test_cases)) * 100
-        print(f"\n>>> Agent Accuracy on Oracle Cases: {accuracy:.1f}% <<<")
-else:
-    print("Could not find oracle_data.json to run final tests.")
+# --- Import our vectorized Human-in-the-Loop environment ---
+from complex_env import ComplexEnv, load_feedback_cases, load_training_cases
+from vec_complex_env import make_complex_vec_env
+from policy_registry import MANIFEST_PATH, checkpoint_path, next_version, register_checkpoint
 
+# The original single-env agent collected 2048 steps per rollout; keep that per update
+ROLLOUT_SIZE = 2048
+
+def train(n_envs=8, use_subprocess=False, total_timesteps=100000, output_path="rl_env/ppo_hirl_agent.zip",
+          human_fraction=None, feedback_file="io/feedback.jsonl", manifest_path=MANIFEST_PATH):
+    # 1. Create the vectorized environment on the oracle and every feedback line so far
+    _, feedback_lines = load_feedback_cases(feedback_file)
+    env = make_complex_vec_env(num_envs=n_envs, use_subprocess=use_subprocess, human_fraction=human_fraction,
+                               cases=load_training_cases(feedback_file=feedback_file))
+
+    # 2. --- UPGRADE: Define a more powerful agent architecture ---
+    # We'll give the agent a bigger "brain" with two hidden layers of 128 neurons each.
+    policy_kwargs = dict(net_arch=dict(pi=[128, 128], vf=[128, 128]))
+
+    # We create the agent with the new brain and encourage it to be more "curious"
+    # The `ent_coef` parameter rewards the agent for exploring different actions.
+    agent = PPO(
+        "MlpPolicy",
+        env,
+        n_steps=max(1, ROLLOUT_SIZE // n_envs),
+        policy_kwargs=policy_kwargs,
+        ent_coef=0.01, # Entropy coefficient to encourage exploration
+        verbose=0
+    )
+
+    # 3. Train the new, smarter agent
+    print(f"\n--- Starting HIRL Training with Advanced Agent ({total_timesteps} steps, {n_envs} envs)... ---")
+    agent.learn(total_timesteps=total_timesteps)
+    print("--- Training Complete. ---")
+    env.close()
+
+    # 4. Save the final, human-guided model
+    agent.save(output_path)
+    print(f"Human-in-the-Loop trained agent saved to {output_path}")
+
+    # 5. Once fine-tuning has started a manifest, the server loads its current checkpoint and not
+    # the base model, so the retrain is registered as the newest version to reach the server
+    if os.path.exists(manifest_path):
+        version = next_version(manifest_path)
+        path = checkpoint_path(version, os.path.dirname(manifest_path))
+        agent.save(path)
+        register_checkpoint(version, path, feedback_lines, full_retrain=True, timesteps=total_timesteps,
+                            manifest_path=manifest_path)
+        print(f"Registered as checkpoint v{version} ({feedback_lines} feedback lines) and promoted to current.")
+    return agent
+
+def evaluate_offline(agent):
+    # 6. Score the agent against every oracle and feedback case using the reward table
+    print("\n--- Offline Evaluation on the Full Dataset ---")
+    env = ComplexEnv()
+    result = env.evaluate_policy(agent)
+    print(f"  - Mean reward: {result['mean_reward']:.3f} (best possible {result['max_mean_reward']:.3f}) over {result['num_cases']} cases")
+    print(f"  - Synthetic: {result['synthetic_mean_reward']}, Human: {result['human_mean_reward']}")
+    return result
+
+def test_on_oracle(agent):
+    # 5. Test the newly trained agent on the original "textbook" cases
+    print("\n--- Testing Trained Agent on Original Oracle Cases ---")
+    oracle_file = "rl_env/oracle_data.json"
+    if os.path.exists(oracle_file):
+        with open(oracle_file, 'r') as f:
+            oracle_cases = json.load(f)
+
+        # Score every oracle case in one batch; print the first 10 as examples
+        states = np.array([case["state"] for case in oracle_cases], dtype=np.float32)
+        correct_actions = np.array([case["correct_action"] for case in oracle_cases])
+        actions, _ = agent.predict(states, deterministic=True)
+
+        for case, action in list(zip(oracle_cases, actions))[:10]:
+            print(f"  - For state={case['state']}, Agent chose: {action}, Correct was: {case['correct_action']}")
+
+        if oracle_cases:
+            accuracy = (actions == correct_actions).mean() * 100
+            print(f"\n>>> Agent Accuracy on all {len(oracle_cases)} Oracle Cases: {accuracy:.1f}% <<<")
+    else:
+        print("Could not find oracle_data.json to run final tests.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the HIRL PPO agent on oracle data and human feedback.")
+    parser.add_argument("--n-envs", type=int, default=8, help="Number of parallel environments.")
+    parser.add_argument("--subproc", action="store_true", help="Run one ComplexEnv per process (SubprocVecEnv) instead of the in-process vectorized env.")
+    parser.add_argument("--human-fraction", type=float, default=None,
+                        help="Share of training samples drawn from human feedback (default: proportional to the data).")
+    parser.add_argument("--timesteps", type=int, default=100000, help="Total environment steps to train for.")
+    parser.add_argument("--feedback", default="io/feedback.jsonl", help="Feedback file to train on.")
+    args = parser.parse_args()
+
+    trained_agent = train(n_envs=args.n_envs, use_subprocess=args.subproc, total_timesteps=args.timesteps,
+                          human_fraction=args.human_fraction, feedback_file=args.feedback)
+    test_on_oracle(trained_agent)
+    evaluate_offline(trained_agent)
@@ -0,0 +1,99 @@
+from functools import partial
+import numpy as np
+from gymnasium import spaces
+from stable_baselines3.common.vec_env import VecEnv, SubprocVecEnv
+
+from complex_env import (ComplexEnv, load_training_cases, build_reward_table, sampling_weights,
+                         evaluate_actions, NUM_ACTIONS, OBS_LOW, OBS_HIGH)
+
+class VecComplexEnv(VecEnv):
+    """
+    A natively vectorized version of ComplexEnv. All training cases are held
+    as NumPy arrays, N states are sampled at once, and rewards are computed
+    with array operations. Every episode is a single step, so each step
+    finishes all N episodes and immediately samples N new states.
+
+    Rewards come from the same reward table as ComplexEnv.step.
+    """
+    def __init__(self, num_envs: int = 8, seed: int = None, human_fraction: float = None, cases=None):
+        # `cases` is an optional (synthetic_cases, human_feedback_cases) pair, as for ComplexEnv
+        synthetic_cases, human_feedback_cases = cases if cases is not None else load_training_cases()
+        cases = synthetic_cases + human_feedback_cases
+        if not cases:
+            raise ValueError("No training data found. Please create oracle_data.json or provide feedback.")
+
+        # --- 1. COMPILE THE TRAINING CASES INTO ARRAYS ---
+        self.states, self.reward_table, self.is_human = build_reward_table(cases)
+        self.sample_weights = sampling_weights(self.is_human, human_fraction)
+        self.num_human_cases = len(human_feedback_cases)
+
+        self.render_mode = None
+        self.rng = np.random.default_rng(seed)
+        self.current_indices = np.zeros(num_envs, dtype=np.int64)
+        self._actions = None
+
+        observation_space = spaces.Box(low=OBS_LOW, high=OBS_HIGH, dtype=np.float32)
+        super().__init__(num_envs, observation_space, spaces.Discrete(NUM_ACTIONS))
+        print(f"VecComplexEnv initialized with {num_envs} envs over {len(cases)} total cases ({self.num_human_cases} from human feedback).")
+
+    def compute_rewards(self, indices: np.ndarray, actions: np.ndarray) -> np.ndarray:
+        """Reward for taking `actions` in the cases at `indices`, looked up in the reward table."""
+        return self.reward_table[indices, actions]
+
+    def evaluate_policy(self, agent, deterministic=True):
+        """Scores an agent against every case in the dataset (see ComplexEnv.evaluate_policy)."""
+        actions, _ = agent.predict(self.states, deterministic=deterministic)
+        return evaluate_actions(self.reward_table, actions, self.is_human)
+
+    def _sample(self):
+        self.current_indices = self.rng.choice(len(self.states), size=self.num_envs, p=self.sample_weights)
+        return self.states[self.current_indices]
+
+    def reset(self):
+        if self._seeds[0] is not None:
+            self.rng = np.random.default_rng(self._seeds[0])
+        self._reset_seeds()
+        self._reset_options()
+        return self._sample()
+
+    def step_async(self, actions):
+        self._actions = np.asarray(actions).reshape(-1)
+
+    def step_wait(self):
+        rewards = self.compute_rewards(self.current_indices, self._actions)
+        terminal_obs = self.states[self.current_indices]
+        dones = np.ones(self.num_envs, dtype=bool)
+        infos = [{"terminal_observation": obs, "TimeLimit.truncated": False} for obs in terminal_obs]
+        # Every episode ends after one step, so auto-reset all envs at once
+        return self._sample(), rewards, dones, infos
+
+    def close(self):
+        pass
+
+    def get_attr(self, attr_name, indices=None):
+        return [getattr(self, attr_name) for _ in self._get_indices(indices)]
+
+    def set_attr(self, attr_name, value, indices=None):
+        setattr(self, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        method = getattr(self, method_name)
+        return [method(*method_args, **method_kwargs) for _ in self._get_indices(indices)]
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False for _ in self._get_indices(indices)]
+
+
+def make_complex_vec_env(num_envs: int = 8, use_subprocess: bool = False, seed: int = None,
+                         human_fraction: float = None, cases=None) -> VecEnv:
+    """
+    Returns the training environment for the HIRL agent. By default this is the
+    in-process VecComplexEnv; `use_subprocess=True` instead runs one ComplexEnv
+    per worker process through SB3's SubprocVecEnv.
+    """
+    if use_subprocess:
+        vec_env = SubprocVecEnv([partial(ComplexEnv, human_fraction=human_fraction, cases=cases) for _ in range(num_envs)])
+        if seed is not None:
+            vec_env.seed(seed)
+        return vec_env
+    return VecComplexEnv(num_envs=num_envs, seed=seed, human_fraction=human_fraction, cases=cases)
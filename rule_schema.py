@@ -0,0 +1,211 @@
+"""
+The schema of a rule as extracted by the LLM (extract_rules_ai.py), validated
+before it reaches the database. Validation is done by pydantic's compiled
+core; parsing by orjson.
+
+Conditions and entitlements stay open dictionaries, since DCRs use many
+different keys, but the values the application computes with are checked:
+- every {min, max} range has numeric bounds with min <= max (or, outside
+  the keys below, text bounds such as dates or ratios, which are kept as
+  they are), and the conditions MCPClient.query_rules matches on
+  (road_width_m, plot_area_sqm) must be numeric ranges;
+- the numeric entitlements used by the calculators and the sweep (FSI,
+  heights, margins, LOS) must be non-negative numbers or ranges.
+"""
+from typing import Any, Dict, List, Optional
+
+import orjson
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, ValidationError, field_validator, model_validator
+
+# Conditions matched as ranges in SQL by MCPClient.query_rules
+RANGE_CONDITIONS = {"road_width_m", "plot_area_sqm"}
+# Entitlements read as numbers (or {min, max} ranges) by the pipeline, the massing agent and the sweep
+NUMERIC_ENTITLEMENTS = {
+    "base_fsi", "total_fsi", "max_height_m", "los_percentage",
+    "front_margin_m", "side_margin_m", "rear_margin_m",
+}
+# Any other entitlement in a schema-constrained answer, as [{"name", "value"}]; merged into entitlements
+EXTRA_ENTITLEMENTS = "extra_entitlements"
+
+class ExtractionParseError(ValueError):
+    """The LLM's answer was not a JSON list of rules."""
+    def __init__(self, message: str, raw: str):
+        super().__init__(message)
+        self.raw = raw
+
+def _number(value, name: str) -> float:
+    # bool is an int in Python, and "true" is no bound
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError(f"{name} must be a number, got {value!r}")
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a number, got {value!r}")
+
+class Range(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    min: Optional[float] = None
+    max: Optional[float] = None
+
+    @field_validator("min", "max", mode="before")
+    @classmethod
+    def _numeric_bound(cls, value, info):
+        return None if value is None else _number(value, info.field_name)
+
+    @model_validator(mode="after")
+    def _ordered(self):
+        if self.min is None and self.max is None:
+            raise ValueError("a range needs a min or a max")
+        if self.min is not None and self.max is not None and self.min > self.max:
+            raise ValueError(f"min {self.min} is greater than max {self.max}")
+        return self
+
+def _message(error: dict) -> str:
+    """The message of a pydantic error, without the "Value error, " prefix of our own ValueErrors."""
+    return str(error.get("ctx", {}).get("error", error["msg"]))
+
+def _is_range(value) -> bool:
+    return isinstance(value, dict) and bool({"min", "max"} & value.keys())
+
+def _is_text_bound(value) -> bool:
+    if not isinstance(value, str):
+        return False
+    try:
+        float(value)
+    except ValueError:
+        return True
+    return False
+
+def _check_range(key: str, value, numeric: bool) -> dict:
+    bounds = [value[bound] for bound in ("min", "max") if bound in value]
+    if not numeric and value.keys() <= {"min", "max"} and all(_is_text_bound(bound) for bound in bounds):
+        # e.g. {"max": "1969-09-30"} or {"min": "1:400", "max": "1:300"}
+        return value
+    try:
+        return Range.model_validate(value).model_dump(exclude_none=True)
+    except ValidationError as e:
+        raise ValueError(f"{key}: {_message(e.errors()[0])}")
+
+class ExtractedRule(BaseModel):
+    id: str = Field(min_length=1)
+    city: str = Field(min_length=1)
+    rule_type: str = Field(min_length=1)
+    conditions: Dict[str, Any]
+    entitlements: Dict[str, Any] = Field(min_length=1)
+    notes: str = ""
+
+    @model_validator(mode="before")
+    @classmethod
+    def _merge_extra_entitlements(cls, data):
+        if not isinstance(data, dict) or EXTRA_ENTITLEMENTS not in data:
+            return data
+        data = dict(data)
+        extras = data.pop(EXTRA_ENTITLEMENTS) or []
+        entitlements = dict(data.get("entitlements") or {})
+        for extra in extras if isinstance(extras, list) else []:
+            if isinstance(extra, dict) and isinstance(extra.get("name"), str) and extra["name"].strip():
+                # A named key of the schema wins over the same key repeated as an extra
+                entitlements.setdefault(extra["name"].strip(), extra.get("value"))
+        data["entitlements"] = entitlements
+        return data
+
+    @field_validator("id", "city", "rule_type", "notes", mode="before")
+    @classmethod
+    def _strip(cls, value):
+        return value.strip() if isinstance(value, str) else value
+
+    @field_validator("conditions")
+    @classmethod
+    def _check_conditions(cls, conditions):
+        for key, value in conditions.items():
+            if key in RANGE_CONDITIONS and not isinstance(value, dict):
+                raise ValueError(f"{key} must be a {{min, max}} range, got {value!r}")
+            if _is_range(value):
+                conditions[key] = _check_range(key, value, numeric=key in RANGE_CONDITIONS)
+        return conditions
+
+    @field_validator("entitlements")
+    @classmethod
+    def _check_entitlements(cls, entitlements):
+        for key, value in entitlements.items():
+            if _is_range(value):
+                entitlements[key] = value = _check_range(key, value, numeric=key in NUMERIC_ENTITLEMENTS)
+            if key not in NUMERIC_ENTITLEMENTS:
+                continue
+            if isinstance(value, dict):
+                bounds = value.values()
+            else:
+                entitlements[key] = _number(value, key)
+                bounds = [entitlements[key]]
+            if any(bound < 0 for bound in bounds):
+                raise ValueError(f"{key} must not be negative")
+        return entitlements
+
+# Built once: the validator is compiled when the adapter is created
+_RULE_ADAPTER = TypeAdapter(ExtractedRule)
+
+def llm_response_schema() -> dict:
+    """
+    ExtractedRule as the schema the LLM must decode to: a list of rules, in the
+    OpenAPI subset Gemini's response_schema accepts. That subset has no open
+    objects, so conditions and entitlements list the keys the application
+    computes with (and the prompt's location_type and zone), and any other
+    entitlement goes to extra_entitlements as a name and a number, which
+    ExtractedRule merges back. Pydantic still validates the values.
+
+    langchain-google-genai makes every property of a nested object required
+    unless it has a default, so the optional keys get "default": None.
+    """
+    optional_number = {"type": "number", "default": None}
+    number_range = {"type": "object", "properties": {"min": optional_number, "max": optional_number}, "default": None}
+    properties = {name: {"type": "string"} for name, field in ExtractedRule.model_fields.items() if field.annotation is str}
+    properties["conditions"] = {"type": "object", "properties": {
+        **{key: number_range for key in sorted(RANGE_CONDITIONS)},
+        "location_type": {"type": "array", "items": {"type": "string"}, "default": None},
+        "zone": {"type": "string", "default": None},
+    }}
+    properties["entitlements"] = {"type": "object", "properties": {
+        key: optional_number for key in sorted(NUMERIC_ENTITLEMENTS)
+    }}
+    properties[EXTRA_ENTITLEMENTS] = {"type": "array", "items": {
+        "type": "object", "properties": {"name": {"type": "string"}, "value": {"type": "number"}}, "required": ["name", "value"]
+    }}
+    required = [name for name, field in ExtractedRule.model_fields.items() if field.is_required()]
+    return {"type": "array", "items": {"type": "object", "properties": properties, "required": required}}
+
+def parse_rules_json(text: str) -> List[Any]:
+    """
+    Parses the LLM's answer into a list. JSON mode answers are bare JSON; a
+    Markdown code fence around it is tolerated. Raises ExtractionParseError.
+    """
+    body = (text or "").strip()
+    if body.startswith("```"):
+        body = body.split("\n", 1)[1] if "\n" in body else ""
+        body = body.rsplit("```", 1)[0]
+    try:
+        data = orjson.loads(body)
+    except orjson.JSONDecodeError as e:
+        raise ExtractionParseError(f"invalid JSON: {e}", text)
+    if isinstance(data, dict) and isinstance(data.get("rules"), list):
+        data = data["rules"]
+    if not isinstance(data, list):
+        raise ExtractionParseError(f"expected a JSON list of rules, got {type(data).__name__}", text)
+    return data
+
+def validate_rules(items: List[Any], city: str):
+    """
+    Validates parsed rules one by one, filling in a missing city. Returns
+    (rules, rejected): the valid rules as plain dictionaries, and
+    {"rule", "errors"} for each invalid one.
+    """
+    rules, rejected = [], []
+    for item in items:
+        if isinstance(item, dict) and not item.get("city"):
+            item = {**item, "city": city}
+        try:
+            rules.append(_RULE_ADAPTER.validate_python(item).model_dump())
+        except ValidationError as e:
+            rejected.append({"rule": item, "errors": [
+                f"{'.'.join(str(part) for part in error['loc']) or 'rule'}: {_message(error)}" for error in e.errors()
+            ]})
+    return rules, rejected
@@ -0,0 +1,250 @@
+"""
+Production server: a pre-forking master that runs N uvicorn worker processes
+on one shared listening socket.
+
+The app module's preload_shared_state() runs once in the master before the
+workers are forked, so large read-only state (the RL policy weights, the rules
+snapshots and compiled sweep tables) lives in copy-on-write pages shared by
+every worker instead of one copy per process.
+Each worker then runs after_fork() and the app's startup event for its own
+connections, LLM client and job threads.
+
+A worker only accepts connections once its startup has finished, and tells
+the master it is ready through a pipe. Workers that die are replaced; SIGHUP
+re-runs the preload (e.g. after a new RL checkpoint) and replaces the workers
+one at a time, retiring an old worker only when a new one is ready; SIGTERM
+or SIGINT shut everything down gracefully.
+
+    python serve.py --workers 8 --port 8000
+"""
+import argparse
+import gc
+import importlib
+import os
+import select
+import signal
+import socket
+import sys
+import time
+
+import uvicorn
+
+# Exit code of a uvicorn worker whose startup failed
+STARTUP_FAILURE = 3
+
+def default_workers() -> int:
+    """WEB_CONCURRENCY if set, else the number of cores this process may run on."""
+    if os.getenv("WEB_CONCURRENCY"):
+        return int(os.environ["WEB_CONCURRENCY"])
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def bind_socket(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+def load_app(app_path: str):
+    """Imports "module:attribute" and returns (module, app)."""
+    module_name, _, attribute = app_path.partition(":")
+    sys.path.insert(0, ".")
+    module = importlib.import_module(module_name)
+    return module, getattr(module, attribute or "app")
+
+def log(message: str):
+    print(f"[serve {os.getpid()}] {message}", flush=True)
+
+class WorkerServer(uvicorn.Server):
+    """A uvicorn server that writes to `ready_fd` once its startup has finished and it is accepting."""
+    def __init__(self, config, ready_fd: int):
+        super().__init__(config)
+        self.ready_fd = ready_fd
+
+    async def startup(self, sockets=None):
+        await super().startup(sockets=sockets)
+        if self.started:
+            os.write(self.ready_fd, b"1")
+
+class Master:
+    def __init__(self, module, app, sock, args):
+        self.module = module
+        self.app = app
+        self.sock = sock
+        self.args = args
+        # pid -> {"ready_fd", "ready", "started_at"}
+        self.workers = {}
+        # Old workers waiting for their replacement during a reload
+        self.retiring = set()
+        # Workers we have asked to stop, which are not replaced when they exit
+        self.leaving = set()
+        self.stopping = False
+        self.reload_requested = False
+        self.any_ready = False
+        self.exit_code = 0
+
+    # --- 1. Workers ---
+    def spawn(self):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            self._run_worker(write_fd)
+        os.close(write_fd)
+        self.workers[pid] = {"ready_fd": read_fd, "ready": False, "started_at": time.monotonic()}
+        return pid
+
+    def _run_worker(self, ready_fd: int):
+        """Runs in the forked child and never returns."""
+        code = 0
+        try:
+            # uvicorn handles SIGTERM and SIGINT gracefully; SIGHUP is meant for the master
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            hook = getattr(self.module, "after_fork", None)
+            if hook:
+                hook()
+            config = uvicorn.Config(
+                self.app, log_level=self.args.log_level, timeout_keep_alive=self.args.timeout_keep_alive,
+                lifespan="on", access_log=self.args.access_log
+            )
+            WorkerServer(config, ready_fd).run(sockets=[self.sock])
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else 1
+        except BaseException:
+            import traceback
+            traceback.print_exc()
+            code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+
+    def _on_ready(self, pid: int):
+        worker = self.workers[pid]
+        os.close(worker["ready_fd"])
+        worker["ready_fd"] = None
+        worker["ready"] = True
+        self.any_ready = True
+        log(f"Worker {pid} is ready ({time.monotonic() - worker['started_at']:.1f}s).")
+        if self.retiring:
+            # Rolling restart: one old worker leaves for every new one that is ready
+            self._terminate(self.retiring.pop())
+
+    def _terminate(self, pid: int):
+        self.leaving.add(pid)
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    def _on_exit(self, pid: int, status: int):
+        worker = self.workers.pop(pid, None)
+        if worker is None:
+            return
+        if worker["ready_fd"] is not None:
+            os.close(worker["ready_fd"])
+        if pid in self.leaving or self.stopping:
+            self.leaving.discard(pid)
+            return
+        code = os.waitstatus_to_exitcode(status)
+        log(f"Worker {pid} died with exit code {code}.")
+        if code == STARTUP_FAILURE and not self.any_ready:
+            # Nothing has ever started: the app cannot boot, so restarting would only loop
+            log("Worker failed to boot; shutting down.")
+            self.stop()
+            self.exit_code = STARTUP_FAILURE
+            return
+        if time.monotonic() - worker["started_at"] < 1:
+            time.sleep(1)
+        self.spawn()
+
+    # --- 2. Signals ---
+    def stop(self, *_):
+        if not self.stopping:
+            log("Shutting down workers...")
+        self.stopping = True
+        for pid in list(self.workers):
+            self._terminate(pid)
+
+    def request_reload(self, *_):
+        self.reload_requested = True
+
+    def _reload(self):
+        self.reload_requested = False
+        hook = getattr(self.module, "preload_shared_state", None)
+        if self.args.preload and hook:
+            try:
+                hook()
+                gc.freeze()
+            except Exception as e:
+                log(f"Reload failed, keeping the current workers: {e}")
+                return
+        log("Reloaded; replacing workers one at a time.")
+        self.retiring = set(self.workers)
+        for _ in range(self.args.workers):
+            self.spawn()
+
+    # --- 3. Main loop ---
+    def run(self) -> int:
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGHUP, self.request_reload)
+        for _ in range(self.args.workers):
+            self.spawn()
+        log(f"Serving on {self.args.host}:{self.args.port} with {self.args.workers} workers.")
+
+        while self.workers:
+            if self.reload_requested and not self.stopping:
+                self._reload()
+            pending = {w["ready_fd"]: pid for pid, w in self.workers.items() if w["ready_fd"] is not None}
+            readable, _, _ = select.select(list(pending), [], [], 0.5)
+            for fd in readable:
+                if os.read(fd, 1):
+                    self._on_ready(pending[fd])
+                # An empty read means the worker exited before it was ready; it is reaped below
+            while True:
+                try:
+                    pid, status = os.waitpid(-1, os.WNOHANG)
+                except ChildProcessError:
+                    break
+                if pid == 0:
+                    break
+                self._on_exit(pid, status)
+        self.sock.close()
+        log("Stopped.")
+        return self.exit_code
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the API with N pre-forked worker processes.")
+    parser.add_argument("--app", default="main:app", help='The ASGI app as "module:attribute".')
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=default_workers(),
+                        help="Worker processes (default: WEB_CONCURRENCY, else the number of cores).")
+    parser.add_argument("--timeout-keep-alive", type=int, default=5)
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--no-access-log", dest="access_log", action="store_false")
+    parser.add_argument("--no-preload", dest="preload", action="store_false",
+                        help="Let each worker load its own state at startup.")
+    args = parser.parse_args()
+
+    module, app = load_app(args.app)
+    hook = getattr(module, "preload_shared_state", None)
+    if args.preload and hook:
+        started = time.monotonic()
+        hook()
+        log(f"Preloaded shared state in {time.monotonic() - started:.1f}s.")
+    # Move everything loaded so far out of the collector's reach, so garbage
+    # collections in the workers do not write to (and un-share) those pages
+    gc.collect()
+    gc.freeze()
+
+    sock = bind_socket(args.host, args.port)
+    sys.exit(Master(module, app, sock, args).run())
@@ -0,0 +1,99 @@
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller runs the
+    function, and callers that arrive while it is running wait for it and get
+    the same result (or exception) instead of running it again. Nothing is
+    cached once the call has finished.
+    """
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn):
+        """Returns (result of fn(), shared), where `shared` is True for callers that joined a running call."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.followers += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            # Forget the call before waking the followers, so later callers start a fresh run
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+class FileLocks:
+    """
+    The cross-process side of SingleFlight: an exclusive flock per key, so
+    processes sharing `lock_dir` (e.g. serve.py workers) never run the same key
+    at once. Keys are hashed onto `stripes` lock files, which keeps their number
+    bounded; two keys on one file only wait for each other. The lock is
+    released when the holder exits, even if it crashes.
+    """
+    def __init__(self, lock_dir: str, stripes: int = 4096):
+        self.lock_dir = lock_dir
+        self.stripes = stripes
+
+    def path_for(self, key: str) -> str:
+        stripe = int(hashlib.sha256(key.encode("utf-8")).hexdigest()[:8], 16) % self.stripes
+        return os.path.join(self.lock_dir, f"{stripe:04d}.lock")
+
+    @contextmanager
+    def hold(self, key: str):
+        """
+        Holds the key's lock for the duration of the block. Yields None if the lock
+        was free, else the time.time() at which the caller started waiting for it.
+        """
+        os.makedirs(self.lock_dir, exist_ok=True)
+        fd = os.open(self.path_for(key), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            waited_since = None
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                waited_since = time.time()
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            yield waited_since
+        finally:
+            # Closing the descriptor releases the lock
+            os.close(fd)
+
+def case_key(case_data: dict) -> str:
+    """The sha256 of the case's canonical JSON, so the order of its keys does not matter."""
+    canonical = json.dumps(case_data, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
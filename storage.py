@@ -0,0 +1,288 @@
+"""
+Compact on-disk storage for reports, feedback and rulebooks.
+
+- JSON is written compactly with orjson (no indentation) and read back with it.
+- Bulky or repeated documents go to a content-addressed BlobStore: one
+  zstd-compressed file per distinct document, named by the sha256 of its
+  compact JSON, so identical content is stored once.
+- Feedback lines keep the RL decision inline (all fine-tuning needs) and
+  refer to the report by its blob digest instead of embedding a copy.
+- Rulebooks (the OCR'd JSON of a DCR) are blobs with a small manifest that
+  maps their file names to digests.
+
+Existing files can be migrated with:
+    python storage.py compact-feedback
+    python storage.py import-rulebooks rules_kb/*.json --remove
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+import uuid
+from datetime import datetime
+
+import orjson
+import zstandard
+
+PROJECTS_DIR = "outputs/projects"
+FEEDBACK_PATH = "io/feedback.jsonl"
+REPORT_BLOBS_DIR = "io/report_blobs"
+RULEBOOKS_DIR = "rules_kb"
+ZSTD_LEVEL = 10
+
+# --- 1. Serialization ---
+def dumps(obj) -> bytes:
+    """Compact JSON bytes; numpy scalars and arrays are serialized as numbers and lists."""
+    return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+
+def loads(data):
+    return orjson.loads(data)
+
+def compress(data: bytes) -> bytes:
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+
+def decompress(data: bytes) -> bytes:
+    return zstandard.ZstdDecompressor().decompress(data)
+
+def write_atomic(path: str, data: bytes):
+    """Writes to a temporary file and renames it, so readers never see a partial file."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def save_json(path: str, obj, compressed: bool = False) -> str:
+    """Writes `obj` as compact JSON, zstd-compressed to `path`.zst if asked. Returns the path written."""
+    data = dumps(obj)
+    if compressed:
+        path, data = path + ".zst", compress(data)
+    write_atomic(path, data)
+    return path
+
+def load_json(path: str):
+    """Reads a file written by save_json (or any JSON file); `path` may omit the .zst suffix."""
+    if not os.path.exists(path) and os.path.exists(path + ".zst"):
+        path += ".zst"
+    with open(path, "rb") as f:
+        data = f.read()
+    return loads(decompress(data) if path.endswith(".zst") else data)
+
+# --- 2. Case reports ---
+def report_path(project_id: str, case_id: str, projects_dir: str = PROJECTS_DIR) -> str:
+    """The path of a case report without the compression suffix."""
+    return os.path.join(projects_dir, project_id, f"{case_id}_report.json")
+
+def save_report(report: dict, compressed: bool = None, projects_dir: str = PROJECTS_DIR) -> str:
+    """
+    Writes a case report compactly. With REPORT_COMPRESSION=zstd (or compressed=True)
+    it is stored as {case_id}_report.json.zst; the other variant is removed, so a
+    case only ever has one report file.
+    """
+    if compressed is None:
+        compressed = os.getenv("REPORT_COMPRESSION", "none") == "zstd"
+    path = report_path(report["project_id"], report["case_id"], projects_dir)
+    written = save_json(path, report, compressed=compressed)
+    stale = path if compressed else path + ".zst"
+    if os.path.exists(stale):
+        os.remove(stale)
+    return written
+
+def load_report(project_id: str, case_id: str, projects_dir: str = PROJECTS_DIR):
+    """Returns a saved case report, or None if the case has none."""
+    path = report_path(project_id, case_id, projects_dir)
+    if not (os.path.exists(path) or os.path.exists(path + ".zst")):
+        return None
+    return load_json(path)
+
+def report_modified_at(project_id: str, case_id: str, projects_dir: str = PROJECTS_DIR):
+    """The modification time of a saved case report, or None if the case has none."""
+    path = report_path(project_id, case_id, projects_dir)
+    for candidate in (path, path + ".zst"):
+        if os.path.exists(candidate):
+            return os.path.getmtime(candidate)
+    return None
+
+def is_report_file(filename: str) -> bool:
+    return filename.endswith("_report.json") or filename.endswith("_report.json.zst")
+
+# --- 3. Content-addressed blobs ---
+class BlobStore:
+    """
+    Immutable JSON documents stored once each, zstd-compressed, under
+    root/<first two hex digits>/<sha256>.json.zst. The digest is the sha256 of
+    the document's compact JSON, so equal documents share one file.
+    """
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], f"{digest}.json.zst")
+
+    def put(self, obj) -> str:
+        return self.put_bytes(dumps(obj))
+
+    def put_bytes(self, data: bytes) -> str:
+        """Stores compact JSON bytes unless an identical blob exists; returns the digest."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if not os.path.exists(path):
+            write_atomic(path, compress(data))
+        return digest
+
+    def get(self, digest: str):
+        with open(self.path(digest), "rb") as f:
+            return loads(decompress(f.read()))
+
+    def exists(self, digest: str) -> bool:
+        return os.path.exists(self.path(digest))
+
+# --- 4. Feedback ---
+report_blobs = BlobStore(REPORT_BLOBS_DIR)
+_feedback_lock = threading.Lock()
+
+def compact_feedback_record(record: dict, blobs: BlobStore = None) -> dict:
+    """
+    Moves the embedded report of a feedback record (key "output") to the blob
+    store, keeping its RL decision inline and its digest under "output_ref".
+    """
+    blobs = blobs or report_blobs
+    record = dict(record)
+    report = record.pop("output", None)
+    if report:
+        record["output_ref"] = blobs.put(report)
+        if "rl_decision" in report:
+            record["rl_decision"] = report["rl_decision"]
+        elif "rl_optimal_action" in report:
+            # Reports from before "rl_decision" existed
+            record["rl_decision"] = {"optimal_action": report["rl_optimal_action"]}
+    return record
+
+def append_feedback(feedback_data: dict, path: str = FEEDBACK_PATH, blobs: BlobStore = None) -> dict:
+    """Appends one compact feedback line and returns the record written."""
+    record = compact_feedback_record({
+        "feedback_id": str(uuid.uuid4()),
+        "project_id": feedback_data.get("project_id"),
+        "case_id": feedback_data.get("case_id"),
+        "user_feedback": feedback_data.get("user_feedback"),
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "input": feedback_data.get("input_case"),
+        "output": feedback_data.get("output_report"),
+    }, blobs)
+    line = dumps(record) + b"\n"
+    with _feedback_lock:
+        # One write per line in append mode, so lines from other processes do not interleave
+        with open(path, "ab") as f:
+            f.write(line)
+    return record
+
+def feedback_report(record: dict, blobs: BlobStore = None):
+    """The report a feedback record was given on: embedded in old records, by reference in new ones."""
+    if record.get("output") is not None:
+        return record["output"]
+    if record.get("output_ref"):
+        return (blobs or report_blobs).get(record["output_ref"])
+    return None
+
+def compact_feedback_file(path: str = FEEDBACK_PATH, blobs: BlobStore = None):
+    """
+    Rewrites a feedback file so every line refers to its report. Line numbers are
+    kept (blank lines included), since fine-tuning resumes from a line number.
+    Returns (lines, bytes before, bytes after).
+    """
+    before = os.path.getsize(path)
+    lines = []
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.strip():
+                lines.append(b"")
+                continue
+            try:
+                lines.append(dumps(compact_feedback_record(loads(line), blobs)))
+            except orjson.JSONDecodeError:
+                # Kept as is: the trainer skips corrupted lines too
+                lines.append(line.rstrip(b"\n"))
+    data = b"".join(line + b"\n" for line in lines)
+    with _feedback_lock:
+        write_atomic(path, data)
+    return len(lines), before, len(data)
+
+# --- 5. Rulebooks ---
+class RulebookStore:
+    """
+    OCR'd rulebooks stored once per distinct content. A manifest
+    (root/rulebooks.json) maps file names such as "mumbai_rules.json" to blob
+    digests, so several names can share one copy.
+    """
+    def __init__(self, root: str = RULEBOOKS_DIR):
+        self.root = root
+        self.blobs = BlobStore(os.path.join(root, "blobs"))
+        self.manifest_path = os.path.join(root, "rulebooks.json")
+
+    def manifest(self) -> dict:
+        if not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path) as f:
+            return json.load(f)
+
+    def add(self, name: str, rulebook) -> str:
+        """Stores a rulebook under `name` (a file name) and returns its digest."""
+        digest = self.blobs.put(rulebook)
+        manifest = self.manifest()
+        manifest[os.path.basename(name)] = digest
+        with open(self.manifest_path, "w") as f:
+            # Small and reviewed by hand, so kept readable
+            json.dump(dict(sorted(manifest.items())), f, indent=4)
+        return digest
+
+    def load(self, name_or_path: str):
+        """
+        Loads a rulebook by path or file name: a JSON file on disk is read
+        directly; otherwise the name is looked up in the manifest.
+        """
+        if os.path.exists(name_or_path):
+            return load_json(name_or_path)
+        digest = self.manifest().get(os.path.basename(name_or_path))
+        if digest is None:
+            raise FileNotFoundError(f"Rulebook not found: {name_or_path}.")
+        return self.blobs.get(digest)
+
+    def import_files(self, paths, remove: bool = False) -> dict:
+        """Adds rulebook files to the store, optionally deleting the originals. Returns {name: digest}."""
+        imported = {}
+        for path in paths:
+            imported[os.path.basename(path)] = self.add(path, load_json(path))
+            if remove:
+                os.remove(path)
+        return imported
+
+def load_rulebook(path: str):
+    """Loads a rulebook given the path scripts have always used, e.g. rules_kb/mumbai_rules.json."""
+    return RulebookStore(os.path.dirname(path) or ".").load(path)
+
+def save_rulebook(path: str, rulebook) -> str:
+    """Stores a rulebook under the name and directory of `path` instead of writing the file itself."""
+    return RulebookStore(os.path.dirname(path) or ".").add(path, rulebook)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate stored data to the compact formats.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    feedback_parser = commands.add_parser("compact-feedback", help="Replace embedded reports in a feedback file by references.")
+    feedback_parser.add_argument("--path", default=FEEDBACK_PATH)
+    rulebook_parser = commands.add_parser("import-rulebooks", help="Store rulebook JSON files once each by content.")
+    rulebook_parser.add_argument("paths", nargs="+")
+    rulebook_parser.add_argument("--root", default=RULEBOOKS_DIR)
+    rulebook_parser.add_argument("--remove", action="store_true", help="Delete the original files once stored.")
+    args = parser.parse_args()
+
+    if args.command == "compact-feedback":
+        count, before, after = compact_feedback_file(args.path)
+        print(f"{args.path}: {count} lines, {before} -> {after} bytes")
+    else:
+        store = RulebookStore(args.root)
+        for name, digest in store.import_files(args.paths, remove=args.remove).items():
+            print(f"{name}: {digest[:12]}")
+        blob_bytes = sum(os.path.getsize(os.path.join(dirpath, f))
+                         for dirpath, _, files in os.walk(store.blobs.root) for f in files)
+        print(f"{len(set(store.manifest().values()))} distinct rulebooks, {blob_bytes} bytes in {store.blobs.root}")
@@ -0,0 +1,131 @@
+import unittest
+import sys
+import os
+import asyncio
+import threading
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from admission import AdmissionController, AdmissionRejected, ConcurrencyLimiter, TokenBucket
+
+
+class TestAdmission(unittest.TestCase):
+
+    def test_token_bucket(self):
+        """
+        Tests that a bucket allows its burst, then refills at its rate and reports when to retry.
+        """
+        print("\nRunning test for the token bucket...")
+        bucket = TokenBucket(rate=2, burst=3)
+        now = bucket.updated
+        self.assertEqual([bucket.try_acquire(now)[0] for _ in range(4)], [True, True, True, False])
+        allowed, retry_after = bucket.try_acquire(now)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(retry_after, 0.5)
+        self.assertTrue(bucket.try_acquire(now + 0.5)[0])
+        print("✅ Burst, refill and Retry-After are correct.")
+
+    def test_concurrency_limiter_queues_and_sheds(self):
+        """
+        Tests that waiters get slots in order when released from another thread, and that
+        a full queue or a too-long wait is rejected.
+        """
+        print("\nRunning test for the concurrency limiter...")
+        limiter = ConcurrencyLimiter(limit=1, max_queue=1, max_wait=0.5)
+
+        async def scenario():
+            await limiter.acquire()
+            waiter = asyncio.ensure_future(limiter.acquire())
+            await asyncio.sleep(0.01)
+            # The queue holds one waiter, so a third request is shed at once
+            with self.assertRaises(AdmissionRejected) as rejected:
+                await limiter.acquire()
+            self.assertEqual(rejected.exception.reason, "queue_full")
+
+            # Released from a worker thread, as at the end of a streamed response
+            threading.Thread(target=limiter.release).start()
+            await asyncio.wait_for(waiter, 1)
+            self.assertEqual(limiter.active, 1)
+
+            with self.assertRaises(AdmissionRejected) as timed_out:
+                await limiter.acquire()
+            self.assertEqual(timed_out.exception.reason, "wait_timeout")
+            limiter.release()
+            self.assertEqual((limiter.active, limiter.queued), (0, 0))
+
+        asyncio.run(scenario())
+        print("✅ Slots are handed over in order and overload is shed.")
+
+    def test_endpoints_return_429(self):
+        """
+        Tests that over-limit /run_case calls get 429 with Retry-After while read endpoints still answer.
+        """
+        print("\nRunning test for admission on the API...")
+        from fastapi.testclient import TestClient
+        import main
+
+        previous = (main.admission, main.state.is_initialized)
+        main.state.is_initialized = True
+        case = {"project_id": "proj", "case_id": "c1", "city": "Mumbai", "document": "test",
+                "parameters": {"plot_size": 1000, "location": "urban", "road_width": 20}}
+        try:
+            client = TestClient(main.app)
+            # No slots and no queue: shed before the pipeline runs
+            main.admission = AdmissionController(max_concurrent=0, max_queue=0)
+            response = client.post("/run_case", json=case)
+            self.assertEqual(response.status_code, 429)
+            self.assertGreaterEqual(int(response.headers["Retry-After"]), 1)
+
+            # A client over its rate limit
+            main.admission = AdmissionController(client_rate_per_minute=1, client_burst=0)
+            response = client.post("/run_case/stream", json=case, headers={"X-Client-Id": "integration-a"})
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response.headers["Retry-After"], "60")
+
+            self.assertEqual(client.get("/debug/timings").status_code, 200)
+            self.assertIn(f'admission_rejections_total{{reason="client_rate",pid="{os.getpid()}"}}', client.get("/metrics").text)
+        finally:
+            main.admission, main.state.is_initialized = previous
+        print("✅ Over-limit requests get 429 with Retry-After.")
+
+    def test_stream_slot_released_when_client_disconnects_early(self):
+        """
+        Tests that a streamed response gives its slot back when the client is gone before any event is sent.
+        """
+        print("\nRunning test for stream slots on early disconnect...")
+        import main
+
+        scope = {"type": "http", "asgi": {"version": "3.0", "spec_version": "2.4"}, "method": "POST",
+                 "path": "/run_case/stream", "headers": []}
+        started = []
+
+        async def body():
+            started.append(True)
+            yield b"event: deterministic\n\n"
+
+        async def receive():
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            # The connection is gone before the response starts
+            raise OSError("connection reset")
+
+        async def scenario():
+            acquired_at = await main.admission.acquire("client", "proj")
+            self.assertEqual(main.admission.limiter.active, 1)
+            response = main.AdmittedStreamingResponse(body(), acquired_at, media_type="text/event-stream")
+            with self.assertRaises(Exception):
+                await response(scope, receive, send)
+
+        previous = main.admission
+        try:
+            main.admission = AdmissionController(max_concurrent=1, max_queue=0)
+            asyncio.run(scenario())
+            # The body generator never ran, and the slot was still released
+            self.assertEqual((started, main.admission.limiter.active), ([], 0))
+        finally:
+            main.admission = previous
+        print("✅ Abandoned streams give their slot back.")
+
+if __name__ == '__main__':
+    unittest.main()
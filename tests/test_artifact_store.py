@@ -0,0 +1,41 @@
+import unittest
+import sys
+import os
+import tempfile
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from artifact_store import GeometryStore
+
+
+class TestGeometryStore(unittest.TestCase):
+
+    def test_identical_massings_are_generated_once_and_linked(self):
+        """
+        Tests that parameters which round to the same values share one stored file.
+        """
+        print("\nRunning test for GeometryStore deduplication...")
+        root = tempfile.mkdtemp()
+        store = GeometryStore(root=os.path.join(root, "store"))
+        builds = []
+
+        def build(params):
+            builds.append(params)
+            return b"solid"
+
+        key_a, path_a = store.get_or_create({"footprint_width_m": 10.001, "full_floors": 3}, build)
+        key_b, path_b = store.get_or_create({"footprint_width_m": 10.004, "full_floors": 3}, build)
+
+        self.assertEqual(key_a, key_b)
+        self.assertEqual(len(builds), 1)
+        self.assertEqual(builds[0]["footprint_width_m"], 10.0)
+
+        case_path = os.path.join(root, "case_geometry.stl")
+        store.link(key_a, case_path)
+        self.assertTrue(os.path.samefile(case_path, path_a))
+        self.assertEqual(store.get_bytes(key_a), b"solid")
+        print("GeometryStore deduplication test passed. ✅")
+
+
+if __name__ == '__main__':
+    unittest.main()
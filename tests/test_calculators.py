@@ -5,7 +5,12 @@ import os
 # This is a bit of a trick to help Python find our 'agents' folder
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+import numpy as np
+
 from agents.calculator_agent import EntitlementsAgent, AllowableEnvelopeAgent
+from agents.interior_agent import InteriorDesignAgent
+from agents.sweep_agent import DesignSpaceSweepAgent
+from agents.massing_agent import resolve_total_fsi
 
 class TestCalculatorAgents(unittest.TestCase):
 
@@ -44,5 +49,55 @@ class TestCalculatorAgents(unittest.TestCase):
         self.assertEqual(result["result"], 800)
         print("AllowableEnvelopeAgent test passed. ✅")
 
+    def test_batch_calculators_match_scalar_versions(self):
+        """
+        Tests that the array-based calculators agree with the scalar ones.
+        """
+        print("\nRunning test for batch calculators...")
+        plot_areas = np.array([500.0, 1000.0, 2000.0])
+
+        envelope = AllowableEnvelopeAgent().calculate_batch(plot_areas, 100)
+        carpet = InteriorDesignAgent().calculate_carpet_area_batch(plot_areas * 2.4)
+        lookups = EntitlementsAgent({"a": 0.5}).calculate_batch(["a", "b", "a"])
+
+        for i, plot_area in enumerate(plot_areas):
+            self.assertEqual(envelope["result"][i], AllowableEnvelopeAgent().calculate(plot_area, 100, explain=False)["result"])
+            self.assertEqual(carpet["result_carpet_area_sqm"][i], InteriorDesignAgent().calculate_carpet_area(plot_area * 2.4)["result_carpet_area_sqm"])
+        np.testing.assert_array_equal(lookups["rule_value"], [0.5, 0.0, 0.5])
+        self.assertNotIn("explanation", EntitlementsAgent({"a": 0.5}).calculate("a", explain=False))
+        print("Batch calculators test passed. ✅")
+
+    def test_design_space_sweep_picks_first_matching_fsi_rule(self):
+        """
+        Tests that the sweep resolves FSI per grid point like the pipeline: road-width
+        rules before plot-area rules, falling back to an FSI of 1.0.
+        """
+        print("\nRunning test for DesignSpaceSweepAgent...")
+        rules = [
+            {"id": "AREA", "conditions": {"plot_area_sqm": {"min": 1000, "max": 5000}}, "entitlements": {"total_fsi": 1.5}},
+            {"id": "WIDTH", "conditions": {"road_width_m": {"min": 18, "max": 27}}, "entitlements": {"total_fsi": {"max": 2.4}}}
+        ]
+        columns = DesignSpaceSweepAgent(rules).sweep(plot_sizes=[500, 2000], road_widths=[9, 20], explain=True)
+
+        # Grid order is (500, 9), (500, 20), (2000, 9), (2000, 20)
+        np.testing.assert_allclose(columns["total_fsi"], [1.0, 2.4, 1.5, 2.4])
+        np.testing.assert_allclose(columns["carpet_area_sqm"], [350.0, 840.0, 2100.0, 3360.0])
+        self.assertEqual(list(columns["fsi_rule_id"]), [None, "WIDTH", "AREA", "WIDTH"])
+        print("DesignSpaceSweepAgent test passed. ✅")
+
+    def test_sweep_and_pipeline_resolve_fsi_alike(self):
+        """
+        Tests that a rule with only a minimum FSI gives the same total_fsi in the sweep and in /run_case.
+        """
+        print("\nRunning test for shared FSI resolution...")
+        rules = [
+            {"id": "MIN", "conditions": {"road_width_m": {"min": 9, "max": 18}}, "entitlements": {"total_fsi": {"min": 1.8}}},
+            {"id": "TEXT", "conditions": {"road_width_m": {"min": 18, "max": 27}}, "entitlements": {"total_fsi": "as per table"}}
+        ]
+        columns = DesignSpaceSweepAgent(rules).sweep(plot_sizes=[500], road_widths=[12, 20])
+        np.testing.assert_allclose(columns["total_fsi"], [1.8, 1.0])
+        self.assertEqual([resolve_total_fsi([rule["entitlements"]]) for rule in rules], [1.8, 1.0])
+        print("Shared FSI resolution test passed. ✅")
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,252 @@
+import unittest
+import sys
+import os
+import json
+import shutil
+import numpy as np
+import tempfile
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(PROJECT_ROOT, 'rl_env'))
+
+from complex_env import ComplexEnv, build_reward_table, sampling_weights, evaluate_actions, feedback_to_case, NUM_ACTIONS
+from vec_complex_env import VecComplexEnv
+import policy_registry
+from distilled_policy import DistilledPolicy
+
+
+class TestComplexEnv(unittest.TestCase):
+
+    def setUp(self):
+        # The environments load their training data relative to the project root
+        self._cwd = os.getcwd()
+        os.chdir(PROJECT_ROOT)
+
+    def tearDown(self):
+        os.chdir(self._cwd)
+
+    def test_reward_table_follows_reward_rules(self):
+        """
+        Tests the compiled reward table for synthetic and human feedback cases.
+        """
+        print("\nRunning test for the ComplexEnv reward table...")
+        cases = [
+            {"state": [500, 0, 12], "correct_action": 2, "source": "synthetic"},
+            {"state": [800, 1, 9], "action_taken": 1, "feedback": "up", "source": "human"},
+            {"state": [900, 2, 15], "action_taken": 3, "feedback": "down", "source": "human"},
+        ]
+        states, rewards, is_human = build_reward_table(cases)
+
+        self.assertEqual(states.shape, (3, 3))
+        self.assertEqual(rewards.shape, (3, NUM_ACTIONS))
+        np.testing.assert_array_equal(rewards[0], [-1, -1, 1, -1, -1])
+        np.testing.assert_array_equal(rewards[1], [0, 2, 0, 0, 0])
+        np.testing.assert_array_equal(rewards[2], [1, 1, 1, -2, 1])
+        np.testing.assert_array_equal(is_human, [False, True, True])
+        print("✅ Reward table matches the reward rules.")
+
+    def test_sampling_weights_and_offline_evaluation(self):
+        """
+        Tests the human/synthetic sampling mix and the exact offline evaluator.
+        """
+        print("\nRunning test for sampling weights and offline evaluation...")
+        is_human = np.array([False, False, False, True])
+        np.testing.assert_allclose(sampling_weights(is_human), [0.25] * 4)
+        np.testing.assert_allclose(sampling_weights(is_human, human_fraction=0.5), [1 / 6, 1 / 6, 1 / 6, 0.5])
+
+        env = ComplexEnv()
+        best_actions = env.reward_table.argmax(axis=1)
+        result = evaluate_actions(env.reward_table, best_actions, env.is_human)
+        self.assertEqual(result["num_cases"], len(env.training_cases))
+        self.assertAlmostEqual(result["mean_reward"], result["max_mean_reward"])
+        self.assertEqual(result["synthetic_mean_reward"], 1.0)
+        print(f"✅ Offline evaluation of the best policy: {result['mean_reward']:.3f}")
+
+    def test_vectorized_rewards_match_single_env(self):
+        """
+        Tests that VecComplexEnv gives the same reward as ComplexEnv.step for every case and action.
+        """
+        print("\nRunning test for VecComplexEnv reward parity...")
+        env = ComplexEnv()
+        vec_env = VecComplexEnv(num_envs=4, seed=0)
+
+        indices = np.repeat(np.arange(len(env.training_cases)), NUM_ACTIONS)
+        actions = np.tile(np.arange(NUM_ACTIONS), len(env.training_cases))
+        vec_rewards = vec_env.compute_rewards(indices, actions)
+
+        for i, (index, action) in enumerate(zip(indices, actions)):
+            env.current_index = index
+            _, reward, _, _, _ = env.step(int(action))
+            self.assertEqual(reward, vec_rewards[i])
+        print("✅ Vectorized rewards match the single environment.")
+
+    def test_step_auto_resets_every_env(self):
+        """
+        Tests that one step ends every one-step episode and returns fresh observations.
+        """
+        print("\nRunning test for VecComplexEnv auto-reset...")
+        vec_env = VecComplexEnv(num_envs=8, seed=0)
+        obs = vec_env.reset()
+        self.assertEqual(obs.shape, (8, 3))
+
+        next_obs, rewards, dones, infos = vec_env.step(np.zeros(8, dtype=np.int64))
+        self.assertEqual(next_obs.shape, (8, 3))
+        self.assertEqual(rewards.shape, (8,))
+        self.assertTrue(dones.all())
+        np.testing.assert_array_equal(infos[0]["terminal_observation"], obs[0])
+        print("✅ All environments were reset after their single step.")
+
+
+class TestFineTuningSupport(unittest.TestCase):
+
+    def test_feedback_to_case_reads_old_and_new_reports(self):
+        """
+        Tests that feedback is converted for both report formats, and that records without inputs are rejected.
+        """
+        print("\nRunning test for feedback record conversion...")
+        inputs = {"parameters": {"plot_size": 900, "location": "rural", "road_width": 15}}
+        old_record = {"input": inputs, "output": {"rl_optimal_action": 4}, "user_feedback": "down"}
+        new_record = {"input": inputs, "output": {"rl_decision": {"optimal_action": 1}}, "user_feedback": "up"}
+
+        self.assertEqual(feedback_to_case(old_record)["action_taken"], 4)
+        self.assertEqual(feedback_to_case(new_record),
+                         {"state": [900, 2, 15], "action_taken": 1, "feedback": "up", "source": "human"})
+        with self.assertRaises(TypeError):
+            feedback_to_case({"input": None, "output": None, "user_feedback": "up"})
+        print("✅ Feedback records converted correctly.")
+
+    def test_checkpoints_are_versioned_in_the_manifest(self):
+        """
+        Tests that promoted checkpoints become current and unpromoted ones do not.
+        """
+        print("\nRunning test for the policy checkpoint manifest...")
+        manifest_path = os.path.join(tempfile.mkdtemp(), "manifest.json")
+        self.assertEqual(policy_registry.current_checkpoint(manifest_path)["path"], policy_registry.BASE_POLICY_PATH)
+
+        policy_registry.register_checkpoint(1, "v1.zip", feedback_lines=10, manifest_path=manifest_path)
+        version = policy_registry.next_version(manifest_path)
+        policy_registry.register_checkpoint(version, "v2.zip", feedback_lines=12, promote=False, manifest_path=manifest_path)
+
+        current = policy_registry.current_checkpoint(manifest_path)
+        self.assertEqual(version, 2)
+        self.assertEqual((current["version"], current["path"], current["feedback_lines"]), (1, "v1.zip", 10))
+        # The rejected checkpoint's feedback still counts as used
+        self.assertEqual(policy_registry.consumed_feedback_lines(manifest_path), 12)
+        print("✅ Manifest tracks the current checkpoint.")
+
+    def test_finetune_resumes_after_the_consumed_feedback(self):
+        """
+        Tests that fine-tuning skips when there is no new feedback, does not retrain on the
+        feedback of a checkpoint that was not promoted, and promotes a checkpoint that passes.
+        """
+        print("\nRunning test for incremental fine-tuning...")
+        from finetune_agent import finetune
+
+        workdir = tempfile.mkdtemp()
+        manifest_path = os.path.join(workdir, "checkpoints", "manifest.json")
+        feedback_file = os.path.join(workdir, "feedback.jsonl")
+
+        def add_feedback(*states):
+            with open(feedback_file, "a") as f:
+                for plot_size, location, road_width in states:
+                    f.write(json.dumps({"input": {"parameters": {"plot_size": plot_size, "location": location, "road_width": road_width}},
+                                        "user_feedback": "up", "rl_decision": {"optimal_action": 1}}) + "\n")
+
+        cwd = os.getcwd()
+        os.chdir(PROJECT_ROOT)
+        try:
+            add_feedback((900, "rural", 15), (2000, "urban", 20))
+            # A negative allowance can never be met, so this checkpoint is not promoted
+            rejected = finetune(feedback_file, timesteps=64, n_envs=1, max_regression=-1e9, manifest_path=manifest_path)
+            self.assertEqual((rejected["version"], rejected["promoted"], rejected["feedback_lines"]), (1, False, 2))
+            self.assertIsNone(finetune(feedback_file, timesteps=64, n_envs=1, manifest_path=manifest_path))
+
+            add_feedback((500, "suburban", 9))
+            promoted = finetune(feedback_file, timesteps=64, n_envs=1, max_regression=1e9, manifest_path=manifest_path)
+            self.assertEqual((promoted["version"], promoted["promoted"]), (2, True))
+            self.assertEqual((promoted["new_feedback_cases"], promoted["parent_version"]), (1, 0))
+            self.assertEqual(policy_registry.current_checkpoint(manifest_path)["path"], promoted["path"])
+            self.assertTrue(os.path.exists(promoted["path"]))
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(workdir)
+        print("✅ Fine-tuning consumes each feedback line once.")
+
+    def test_full_retrain_after_finetuning_becomes_current(self):
+        """
+        Tests that a full retrain after a fine-tune is registered as the current checkpoint, and that
+        fine-tuning then resumes after the feedback the retrain was trained on.
+        """
+        print("\nRunning test for a full retrain after fine-tuning...")
+        from finetune_agent import finetune
+        from train_complex_agent import train
+
+        workdir = tempfile.mkdtemp()
+        manifest_path = os.path.join(workdir, "checkpoints", "manifest.json")
+        feedback_file = os.path.join(workdir, "feedback.jsonl")
+        with open(feedback_file, "w") as f:
+            f.write(json.dumps({"input": {"parameters": {"plot_size": 900, "location": "rural", "road_width": 15}},
+                                "user_feedback": "up", "rl_decision": {"optimal_action": 1}}) + "\n")
+        # A fine-tuned checkpoint that consumed more lines than the file now has (e.g. after a rotation)
+        policy_registry.register_checkpoint(1, "v1.zip", feedback_lines=5, manifest_path=manifest_path)
+
+        cwd = os.getcwd()
+        os.chdir(PROJECT_ROOT)
+        try:
+            train(n_envs=8, total_timesteps=64, output_path=os.path.join(workdir, "base.zip"),
+                  feedback_file=feedback_file, manifest_path=manifest_path)
+            current = policy_registry.current_checkpoint(manifest_path)
+            self.assertEqual((current["version"], current["full_retrain"], current["feedback_lines"]), (2, True, 1))
+            self.assertTrue(os.path.exists(current["path"]))
+            self.assertEqual(policy_registry.consumed_feedback_lines(manifest_path), 1)
+            self.assertIsNone(finetune(feedback_file, timesteps=64, n_envs=1, manifest_path=manifest_path))
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(workdir)
+        print("✅ A full retrain reaches the server after fine-tuning.")
+
+    def test_distilled_policy_reproduces_ppo_at_grid_points(self):
+        """
+        Tests that the lookup grid reproduces the PPO agent's actions and confidences, and survives a save/load.
+        """
+        print("\nRunning test for policy distillation...")
+        from stable_baselines3 import PPO
+        from distill_policy import distill, policy_probabilities
+
+        agent = PPO.load(os.path.join(PROJECT_ROOT, policy_registry.BASE_POLICY_PATH), device="cpu")
+        distilled = distill(agent, plot_step=500, road_step=10, metadata={"source_version": 0})
+        path = os.path.join(tempfile.mkdtemp(), "distilled.npz")
+        distilled.save(path)
+        loaded = DistilledPolicy.load(path)
+
+        obs = np.array([[1500, 1, 20], [500, 0, 30], [9500, 2, 100]], dtype=np.float32)
+        ppo_probs = policy_probabilities(agent, obs)
+        actions, _ = loaded.predict(obs)
+        np.testing.assert_array_equal(actions, ppo_probs.argmax(axis=1))
+        action, confidence = loaded.predict_with_confidence(obs[0])
+        self.assertAlmostEqual(confidence, ppo_probs[0, action], places=2)
+        self.assertEqual(loaded.source_version, 0)
+        print(f"✅ Distilled grid of {loaded.actions.size} points matches the PPO agent.")
+
+    def test_distilled_policy_flags_states_outside_its_grid(self):
+        """
+        Tests that states past the grid's edges are flagged, and that the pipeline counts them.
+        """
+        print("\nRunning test for states outside the distilled grid...")
+        sys.path.append(PROJECT_ROOT)
+        import metrics
+        from main_pipeline import rl_decision
+
+        # A 0-10000 x 3 x 0-100 grid, like the one distill() builds
+        policy = DistilledPolicy(np.full((11, 3, 11, NUM_ACTIONS), 1.0 / NUM_ACTIONS), (0.0, 1000.0, 11), (0.0, 10.0, 11))
+        states = np.array([[12000, 0, 20], [1500, 1, 150], [1500, 3, 20], [1500, 1, 20], [10000, 2, 100]], dtype=np.float32)
+        np.testing.assert_array_equal(policy.out_of_range(states), [True, True, True, False, False])
+
+        before = metrics.RL_OUT_OF_RANGE.value()
+        for state in states:
+            rl_decision(policy, state)
+        self.assertEqual(metrics.RL_OUT_OF_RANGE.value(), before + 3)
+        print("✅ Out-of-range states are flagged and counted.")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import unittest
+import sys
+import os
+import io
+
+import numpy as np
+from stl import mesh
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from agents.geometry_agent import GeometryAgent
+from agents.massing_agent import MassingAgent
+
+
+class TestGeometryAgent(unittest.TestCase):
+
+    def test_block_vertices_span_the_requested_box(self):
+        """
+        Tests that the vectorized block covers exactly [0, width] x [0, depth] x [0, height].
+        """
+        print("\nRunning test for GeometryAgent block vertices...")
+        block = GeometryAgent().build_block(width=10, depth=20, height=30)
+
+        self.assertEqual(block.vectors.shape, (12, 3, 3))
+        points = block.vectors.reshape(-1, 3)
+        np.testing.assert_allclose(points.min(axis=0), [0, 0, 0])
+        np.testing.assert_allclose(points.max(axis=0), [10, 20, 30])
+        print("GeometryAgent vertices test passed. ✅")
+
+    def test_in_memory_stl_is_binary(self):
+        """
+        Tests that `as_bytes=True` returns a binary STL that round-trips through numpy-stl.
+        """
+        print("\nRunning test for GeometryAgent in-memory STL...")
+        stl_bytes = GeometryAgent().create_block(None, width=10, depth=20, height=30, as_bytes=True)
+
+        # Binary STL: 80-byte header, 4-byte triangle count, 50 bytes per triangle
+        self.assertEqual(len(stl_bytes), 80 + 4 + 12 * 50)
+        loaded = mesh.Mesh.from_file("block.stl", fh=io.BytesIO(stl_bytes))
+        self.assertEqual(len(loaded.vectors), 12)
+        print("GeometryAgent in-memory STL test passed. ✅")
+
+
+class TestMassingAgent(unittest.TestCase):
+
+    def test_setbacks_shrink_footprint_and_fsi_limits_floors(self):
+        """
+        Tests a 40m x 40m plot with 3m front, 1.5m side/rear setbacks and FSI 2.4.
+        """
+        print("\nRunning test for MassingAgent FSI-limited massing...")
+        agent = MassingAgent(floor_height_m=3.0)
+        constraints = agent.collect_constraints([
+            {"total_fsi": 2.4},
+            {"front_margin_m": 3.0, "side_margin_m": 1.5, "rear_margin_m": 1.5}
+        ])
+        massing = agent.massing_for_case(constraints, plot_polygon=[[0, 0], [40, 0], [40, 40], [0, 40]])
+
+        self.assertAlmostEqual(massing["footprint_width_m"], 37.0)
+        self.assertAlmostEqual(massing["footprint_depth_m"], 35.5)
+        self.assertEqual(massing["full_floors"], 2)
+        self.assertEqual(massing["limited_by"], "fsi")
+        # The built-up area uses the full FSI entitlement
+        self.assertAlmostEqual(massing["built_up_area_sqm"], 1600 * 2.4)
+        self.assertEqual(massing["origin"], [1.5, 3.0, 0.0])
+        print("MassingAgent FSI test passed. ✅")
+
+    def test_height_limit_caps_floors_and_mesh_stacks_blocks(self):
+        """
+        Tests that max_height_m caps the floor count and that one block is emitted per floor.
+        """
+        print("\nRunning test for MassingAgent height-limited massing...")
+        agent = MassingAgent(floor_height_m=3.0)
+        constraints = agent.collect_constraints([{"total_fsi": 10.0}, {"max_height_m": {"max": 25.0}}])
+        massing = agent.massing_for_case(constraints, plot_size=400)
+
+        self.assertEqual(massing["full_floors"], 8)
+        self.assertEqual(massing["top_floor_fraction"], 0.0)
+        self.assertEqual(massing["limited_by"], "height")
+
+        vectors = agent.build_mesh_vectors(agent.floor_blocks(massing))
+        self.assertEqual(vectors.shape, (8 * 12, 3, 3))
+        self.assertAlmostEqual(float(vectors[..., 2].max()), 24.0)
+        print("MassingAgent height test passed. ✅")
+
+    def test_compute_massing_broadcasts_over_samples(self):
+        """
+        Tests that the massing engine evaluates whole arrays of design samples at once.
+        """
+        print("\nRunning test for vectorized MassingAgent...")
+        sides = np.array([20.0, 30.0, 40.0])
+        result = MassingAgent().compute_massing(sides, sides, total_fsi=np.array([1.0, 2.0, 3.0]))
+
+        np.testing.assert_array_equal(result["full_floors"], [1, 2, 3])
+        np.testing.assert_allclose(result["built_up_area_sqm"], [400.0, 1800.0, 4800.0])
+        print("Vectorized MassingAgent test passed. ✅")
+
+    def test_non_rectangular_plots_are_rejected(self):
+        """
+        Tests that only axis-aligned rectangles are accepted as plot polygons, so a triangle
+        is never massed (and FSI-limited) as its twice-as-large bounding box.
+        """
+        print("\nRunning test for MassingAgent plot polygons...")
+        agent = MassingAgent()
+        # A rectangle with an extra vertex along its front edge is still a rectangle
+        self.assertEqual(agent.plot_rectangle(plot_polygon=[[0, 0], [10, 0], [20, 0], [20, 30], [0, 30]]),
+                         (0.0, 0.0, 20.0, 30.0))
+        for polygon in ([[0, 0], [40, 0], [0, 40]],
+                        [[0, 0], [40, 0], [40, 20], [20, 20], [20, 40], [0, 40]],
+                        [[0, 0], [40, 40]]):
+            with self.assertRaises(ValueError):
+                agent.massing_for_case(agent.collect_constraints([{"total_fsi": 2.0}]), plot_polygon=polygon)
+        print("MassingAgent polygon test passed. ✅")
+
+    def test_unbuildable_plot_has_no_floor_blocks(self):
+        """
+        Tests that setbacks covering the whole plot give an explicit unbuildable result instead of an empty mesh.
+        """
+        print("\nRunning test for MassingAgent unbuildable plots...")
+        agent = MassingAgent()
+        constraints = agent.collect_constraints([{"side_margin_m": 6.0}])
+        massing = agent.massing_for_case(constraints, plot_size=100)
+
+        self.assertFalse(massing["buildable"])
+        self.assertIn("no buildable footprint", massing["reason"])
+        with self.assertRaises(ValueError):
+            agent.floor_blocks(massing)
+        self.assertTrue(agent.massing_for_case(constraints, plot_size=400)["buildable"])
+        print("MassingAgent unbuildable test passed. ✅")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+import unittest
+import sys
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from job_queue import JobQueue, JobWorkerPool
+
+
+def make_case(project_id, case_id):
+    return {"project_id": project_id, "case_id": case_id, "city": "Mumbai",
+            "parameters": {"plot_size": 1000, "location": "urban", "road_width": 20}}
+
+
+class TestJobQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.workdir, "jobs.sqlite")
+        self.queue = JobQueue(self.path)
+
+    def tearDown(self):
+        self.queue.close()
+        shutil.rmtree(self.workdir)
+
+    def test_priority_and_project_fairness(self):
+        """
+        Tests that higher priorities run first and that projects take turns instead of running in arrival order.
+        """
+        print("\nRunning test for job priority and fairness...")
+        for i in range(3):
+            self.queue.submit(make_case("burst", f"burst_{i}"))
+        self.queue.submit(make_case("small", "small_0"))
+        urgent = self.queue.submit(make_case("small", "urgent"), priority=5)
+
+        order = []
+        while True:
+            claimed = self.queue.claim()
+            if claimed is None:
+                break
+            job_id, case = claimed
+            order.append(case["case_id"])
+            self.queue.complete(job_id, {"case_id": case["case_id"]})
+
+        self.assertEqual(order[0], "urgent")
+        # After the urgent job, "small" was served last, so "burst" goes next and then the two alternate
+        self.assertEqual(order[1:], ["burst_0", "small_0", "burst_1", "burst_2"])
+        self.assertEqual(self.queue.get(urgent)["result"], {"case_id": "urgent"})
+        self.assertEqual(self.queue.counts(), {"done": 5})
+        print(f"✅ Claim order: {order}")
+
+    def test_recovery_after_restart(self):
+        """
+        Tests that a job left running by a dead process is queued again when the queue is reopened.
+        """
+        print("\nRunning test for job recovery...")
+        job_id = self.queue.submit(make_case("proj", "case_a"))
+        self.queue.claim()
+        # Pretend the job was claimed by a process that has since exited
+        self.queue._conn.execute("UPDATE jobs SET owner = ? WHERE id = ?", (f"{self.queue.owner.rsplit(':', 1)[0]}:999999999", job_id))
+
+        reopened = JobQueue(self.path)
+        self.assertEqual(reopened.recover(), 1)
+        self.assertEqual(reopened.get(job_id)["status"], "queued")
+        self.assertEqual(reopened.claim()[0], job_id)
+        self.assertEqual(reopened.get(job_id)["attempts"], 2)
+        reopened.close()
+        print("✅ The orphaned job was queued again.")
+
+    def test_worker_pool_runs_and_retries(self):
+        """
+        Tests that workers store results, and retry a failing job up to max_attempts before marking it failed.
+        """
+        print("\nRunning test for the job worker pool...")
+        self.queue.max_attempts = 2
+
+        def handler(case):
+            if case["case_id"] == "broken":
+                raise ValueError("no rules")
+            return {"case_id": case["case_id"], "ok": True}
+
+        ok_job = self.queue.submit(make_case("proj", "fine"))
+        bad_job = self.queue.submit(make_case("proj", "broken"))
+        pool = JobWorkerPool(self.queue, handler, concurrency=2, poll_interval=0.05)
+        pool.start()
+        deadline = time.time() + 10
+        while time.time() < deadline and self.queue.counts().get("queued", 0) + self.queue.counts().get("running", 0):
+            time.sleep(0.05)
+        pool.stop()
+
+        self.assertEqual(self.queue.get(ok_job)["result"], {"case_id": "fine", "ok": True})
+        failed = self.queue.get(bad_job)
+        self.assertEqual((failed["status"], failed["attempts"], failed["error"]), ("failed", 2, "no rules"))
+        print("✅ Results stored and failures retried.")
+
+    def test_worker_survives_storage_errors(self):
+        """
+        Tests that a result that cannot be stored fails its job instead of killing the worker thread,
+        and that a failing claim is retried.
+        """
+        print("\nRunning test for job worker resilience...")
+        self.queue.max_attempts = 1
+        real_claim, claim_errors = self.queue.claim, []
+
+        def flaky_claim():
+            if not claim_errors:
+                claim_errors.append(True)
+                raise sqlite3.OperationalError("database is locked")
+            return real_claim()
+
+        self.queue.claim = flaky_claim
+        unserializable = self.queue.submit(make_case("proj", "unserializable"))
+        later = self.queue.submit(make_case("proj", "later"))
+
+        def handler(case):
+            if case["case_id"] == "unserializable":
+                return {"case_id": case["case_id"], "area": object()}
+            return {"case_id": case["case_id"]}
+
+        # One thread, so the second job only runs if the thread survived the first
+        pool = JobWorkerPool(self.queue, handler, concurrency=1, poll_interval=0.05)
+        pool.start()
+        deadline = time.time() + 10
+        while time.time() < deadline and self.queue.counts().get("queued", 0) + self.queue.counts().get("running", 0):
+            time.sleep(0.05)
+        pool.stop()
+
+        failed = self.queue.get(unserializable)
+        self.assertEqual(failed["status"], "failed")
+        self.assertTrue(failed["error"].startswith("Could not store the result"))
+        self.assertEqual(self.queue.get(later)["result"], {"case_id": "later"})
+        self.assertEqual(claim_errors, [True])
+        print("✅ The worker kept running after a claim error and an unstorable result.")
+
+    def test_job_endpoints(self):
+        """
+        Tests that POST /jobs queues a case and GET /jobs/{job_id} reports it.
+        """
+        print("\nRunning test for the job endpoints...")
+        from fastapi.testclient import TestClient
+        import main
+
+        previous = (main.state.job_queue, main.state.is_initialized)
+        main.state.job_queue, main.state.is_initialized = self.queue, True
+        try:
+            client = TestClient(main.app)
+            case = make_case("proj", "case_api")
+            case["document"] = "test"
+            response = client.post("/jobs", json=case, params={"priority": 3})
+            self.assertEqual(response.status_code, 202)
+            job_id = response.json()["job_id"]
+            self.assertEqual(response.headers["Location"], f"/jobs/{job_id}")
+
+            job = client.get(f"/jobs/{job_id}").json()
+            self.assertEqual((job["status"], job["priority"], job["jobs_ahead"]), ("queued", 3, 0))
+            self.assertEqual(client.get("/jobs/unknown").status_code, 404)
+        finally:
+            main.state.job_queue, main.state.is_initialized = previous
+        print("✅ Jobs are queued and reported over the API.")
+
+if __name__ == '__main__':
+    unittest.main()
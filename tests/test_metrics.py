@@ -0,0 +1,67 @@
+import unittest
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import metrics
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_text_format(self):
+        """
+        Tests that counters, gauges and histograms render in the Prometheus text format.
+        """
+        print("\nRunning test for the Prometheus text format...")
+        registry = metrics.Registry()
+        counter = registry.register(metrics.Counter("test_events_total", "Events.", ["kind"]))
+        gauge = registry.register(metrics.Gauge("test_depth", "Depth.", callback=lambda: {(): 7}))
+        histogram = registry.register(metrics.Histogram("test_latency_seconds", "Latency.", buckets_ms=[10, 100]))
+
+        counter.inc(kind='a"b')
+        counter.inc(2, kind='a"b')
+        histogram.observe(0.005)
+        histogram.observe(0.05)
+        histogram.observe(5)
+        text = registry.render()
+
+        self.assertIn("# TYPE test_events_total counter", text)
+        self.assertIn('test_events_total{kind="a\\"b"} 3', text)
+        self.assertIn("test_depth 7", text)
+        self.assertIn('test_latency_seconds_bucket{le="0.01"} 1', text)
+        self.assertIn('test_latency_seconds_bucket{le="0.1"} 2', text)
+        self.assertIn('test_latency_seconds_bucket{le="+Inf"} 3', text)
+        self.assertIn("test_latency_seconds_count 3", text)
+        self.assertIn("test_latency_seconds_sum 5.055", text)
+
+        # Labels added to every sample, like the worker pid of /metrics
+        text = registry.render(const_labels=[("pid", 42)])
+        self.assertIn('test_events_total{kind="a\\"b",pid="42"} 3', text)
+        self.assertIn('test_depth{pid="42"} 7', text)
+        self.assertIn('test_latency_seconds_bucket{pid="42",le="0.01"} 1', text)
+        self.assertIn('test_latency_seconds_count{pid="42"} 3', text)
+        print("✅ Counters, gauges and histograms render correctly.")
+
+    def test_metrics_endpoint(self):
+        """
+        Tests that /metrics is served and counts requests by route template.
+        """
+        print("\nRunning test for the /metrics endpoint...")
+        from fastapi.testclient import TestClient
+        import main
+
+        # No context manager: the startup event would need the real LLM client
+        client = TestClient(main.app)
+        client.get("/logs/some_case")
+        response = client.get("/metrics")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("text/plain"))
+        self.assertIn(f'http_requests_total{{method="GET",route="/logs/{{case_id}}",status="200",pid="{os.getpid()}"}}', response.text)
+        for name in ("threadpool_threads", "db_pool_connections", "cache_requests_total", "llm_calls_total"):
+            self.assertIn(f"# TYPE {name} ", response.text)
+        print("✅ /metrics exposes request, pool and cache metrics.")
+
+if __name__ == '__main__':
+    unittest.main()
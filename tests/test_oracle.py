@@ -0,0 +1,98 @@
+import unittest
+import sys
+import os
+import tempfile
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(PROJECT_ROOT, 'rl_env'))
+
+from create_oracle import AnswerCache, build_oracle, stable_action, action_from_answer
+from generate_data import generate_cases, value_range
+
+
+class FakeTeacher:
+    """Stands in for the retrieval chain and counts how often it is asked."""
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, inputs):
+        self.calls += 1
+        return {"answer": "['(2)', 'section 34']"}
+
+
+class TestOracleCreation(unittest.TestCase):
+
+    def test_labels_are_stable(self):
+        """
+        Tests that answers map to the same action on every run (no salted hash()).
+        """
+        print("\nRunning test for stable oracle labels...")
+        self.assertEqual(stable_action("(2)"), 4)
+        self.assertEqual(action_from_answer("['(2)', 'section 34']"), stable_action("(2)"))
+        self.assertEqual(action_from_answer("[]"), 0)
+        print("✅ Labels are reproducible.")
+
+    def test_value_range_needs_a_positive_step(self):
+        """
+        Tests that the grid is inclusive of its end, and that a step that never reaches it is refused.
+        """
+        print("\nRunning test for value ranges...")
+        self.assertEqual(value_range(6, 12, 3), [6, 9, 12])
+        for step in (0, -1):
+            with self.assertRaises(ValueError):
+                value_range(6, 30, step)
+        print("✅ Non-positive steps are rejected.")
+
+    def test_teacher_answers_are_cached_between_builds(self):
+        """
+        Tests that a rebuild labels every case from the persistent cache without asking the teacher.
+        """
+        print("\nRunning test for the oracle answer cache...")
+        cases = generate_cases(value_range(500, 3000, 500), ["urban", "rural"], [6, 12, 30])
+        cache = AnswerCache(os.path.join(tempfile.mkdtemp(), "cache.sqlite"))
+        teacher = FakeTeacher()
+
+        first, stats = build_oracle(cases, lambda: teacher, cache, "v1", workers=4, rate_per_second=0)
+        self.assertEqual(len(first), 36)
+        self.assertEqual(teacher.calls, stats["teacher_calls"])
+
+        second, stats = build_oracle(cases, lambda: teacher, cache, "v1", workers=4, rate_per_second=0)
+        self.assertEqual(stats["teacher_calls"], 0)
+        self.assertEqual(first, second)
+        self.assertEqual((cache.hits, cache.misses), (stats["cached"], stats["cached"]))
+
+        # A new index version invalidates the cached answers
+        _, stats = build_oracle(cases, lambda: teacher, cache, "v2", workers=4, rate_per_second=0)
+        self.assertGreater(stats["teacher_calls"], 0)
+        cache.close()
+        print(f"✅ Rebuild served {stats['cases']} cases, teacher asked {teacher.calls} times in total.")
+
+    def test_failed_teacher_calls_keep_the_other_answers(self):
+        """
+        Tests that a failing teacher call is raised only after every other answer is cached,
+        so the rerun asks the teacher about the failed case alone.
+        """
+        print("\nRunning test for failed teacher calls...")
+        cases = generate_cases([1500, 3000], ["rural"], [12, 18])
+        cache = AnswerCache(os.path.join(tempfile.mkdtemp(), "cache.sqlite"))
+
+        class FlakyTeacher(FakeTeacher):
+            def invoke(self, inputs):
+                if '"plot_size": 1500, "location": "rural", "road_width": 12' in inputs["input"]:
+                    raise ConnectionError("quota exceeded")
+                return super().invoke(inputs)
+
+        flaky = FlakyTeacher()
+        with self.assertRaises(RuntimeError) as failure:
+            build_oracle(cases, lambda: flaky, cache, "v1", workers=2, rate_per_second=0, retries=1)
+        self.assertIn("1 of 4 cases", str(failure.exception))
+        self.assertEqual(flaky.calls, 3)
+
+        teacher = FakeTeacher()
+        oracle, stats = build_oracle(cases, lambda: teacher, cache, "v1", workers=2, rate_per_second=0)
+        self.assertEqual((stats["teacher_calls"], stats["cached"], len(oracle)), (1, 3, 4))
+        cache.close()
+        print("✅ Answers received before a failure are cached.")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,55 @@
 import pytest
 import os
+import sys
 import json
-from main import process_case # We import our main function to test it
+import shutil
+import tempfile
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+TEST_PROJECT_ID = "test_pipeline"
+
+
+@pytest.fixture(scope="module")
+def system_state():
+    """
+    The real rules DB and RL agent, with a fake LLM so the pipeline runs offline.
+    """
+    from langchain_core.messages import AIMessage
+    from langchain_core.runnables import RunnableLambda
+    from stable_baselines3 import PPO
+    from mcp_client import MCPClient
+
+    import main_pipeline
+    from report_index import ReportIndex
+
+    cwd = os.getcwd()
+    os.chdir(PROJECT_ROOT)
+    # Keep test reports out of the real report index
+    index_dir = tempfile.mkdtemp(prefix="test_pipeline_index_")
+    real_index, main_pipeline.report_index = main_pipeline.report_index, ReportIndex(os.path.join(index_dir, "index.sqlite"))
+
+    class State:
+        mcp_client = MCPClient()
+        llm = RunnableLambda(lambda prompt: AIMessage(content="### **AI Consultant Report: Planning & Zoning Analysis**"))
+        rl_agent = PPO.load("rl_env/ppo_hirl_agent.zip", device="cpu")
+        rl_agent_version = 0
+
+    yield State()
+
+    State.mcp_client.close()
+    main_pipeline.report_index.close()
+    main_pipeline.report_index = real_index
+    shutil.rmtree(index_dir, ignore_errors=True)
+    shutil.rmtree(os.path.join("outputs", "projects", TEST_PROJECT_ID), ignore_errors=True)
+    os.chdir(cwd)
+
+def load_case(name):
+    with open(os.path.join(PROJECT_ROOT, "inputs", "case_studies", name)) as f:
+        case = json.load(f)
+    case["project_id"] = TEST_PROJECT_ID
+    return case
 
 # Test to ensure the core knowledge bases can be loaded
 def test_knowledge_bases_load():
@@ -9,17 +57,17 @@ def test_knowledge_bases_load():
     Tests if the FAISS vector stores for Mumbai and Pune can be loaded.
     This is a critical check of our data assets.
     """
+    pytest.importorskip("faiss")
+    pytest.importorskip("sentence_transformers")
     from langchain_community.embeddings import HuggingFaceEmbeddings
     from langchain_community.vectorstores import FAISS
 
+    mumbai_path = os.path.join(PROJECT_ROOT, "rules_kb/faiss_index_mpnet")
+    pune_path = os.path.join(PROJECT_ROOT, "rules_kb/faiss_index_pune")
+    if not (os.path.exists(mumbai_path) and os.path.exists(pune_path)):
+        pytest.skip("Vector stores have not been built (see the data pipeline in the README).")
+
     embeddings = HuggingFaceEmbeddings(model_name="all-mpnet-base-v2")
-    
-    mumbai_path = "rules_kb/faiss_index_mpnet"
-    pune_path = "rules_kb/faiss_index_pune"
-    
-    assert os.path.exists(mumbai_path), "Mumbai vector store not found!"
-    assert os.path.exists(pune_path), "Pune vector store not found!"
-    
     # Try to load them
     try:
         FAISS.load_local(mumbai_path, embeddings, allow_dangerous_deserialization=True)
@@ -28,46 +76,202 @@ def test_knowledge_bases_load():
         pytest.fail(f"Failed to load vector stores. Error: {e}")
 
 # A simple "smoke test" to ensure the pipeline can run without errors
-def test_pipeline_runs_without_errors():
+def test_pipeline_runs_without_errors(system_state):
     """
-    Tests if the main `process_case` function can run a full cycle on a 
-    sample case without crashing.
+    Tests if `process_case_logic` can run a full cycle on a sample case without crashing.
     """
-    # Use the Mumbai case as our test input
-    case_path = "inputs/case_studies/mumbai_case.json"
-    assert os.path.exists(case_path), "Mumbai case study file not found!"
-    
+    from main_pipeline import process_case_logic
+
     try:
-        process_case(case_path)
+        process_case_logic(load_case("mumbai_case.json"), system_state)
     except Exception as e:
         pytest.fail(f"The main pipeline crashed while processing the Mumbai case. Error: {e}")
 
 # Test to validate the structure of the final output
-def test_output_json_has_required_keys():
+def test_output_json_has_required_keys(system_state):
     """
-    Runs the pipeline and checks if the final JSON report contains all the
+    Runs the pipeline and checks if the saved JSON report contains all the
     necessary top-level keys. This validates the output contract.
     """
-    case_path = "inputs/case_studies/mumbai_case.json"
-    process_case(case_path) # This will generate the output file
+    from main_pipeline import process_case_logic
+
+    case = load_case("pune_case.json")
+    process_case_logic(case, system_state) # This will generate the output file
 
-    output_path = "outputs/case_studies/mumbai_001_report.json"
-    assert os.path.exists(output_path), "Output report for Mumbai case was not generated!"
+    output_path = os.path.join("outputs", "projects", TEST_PROJECT_ID, f"{case['case_id']}_report.json")
+    assert os.path.exists(output_path), "Output report for the Pune case was not generated!"
 
     with open(output_path, 'r') as f:
         report = json.load(f)
 
     expected_keys = [
-        "input_case",
-        "rag_analysis",
-        "entitlement_calculation",
-        "envelope_calculation",
-        "rl_optimal_action"
+        "project_id",
+        "case_id",
+        "inputs",
+        "entitlements",
+        "rl_decision",
+        "massing",
+        "geometry_key"
     ]
 
     for key in expected_keys:
         assert key in report, f"Missing required key '{key}' in the final JSON report."
+    assert 0 <= report["rl_decision"]["optimal_action"] < 5
+
+    # The saved report is also summarized in the report index
+    from main_pipeline import report_index
+    summary = report_index.list_cases(TEST_PROJECT_ID, fields=["case_id", "optimal_action"])
+    assert {"case_id": case["case_id"], "optimal_action": report["rl_decision"]["optimal_action"]} in summary
+
+# Test that the debug flag returns the per-stage timings
+def test_debug_flag_returns_stage_timings(system_state):
+    """
+    Runs the pipeline with debug enabled and checks that every stage was timed,
+    while the saved report stays free of timings.
+    """
+    from main_pipeline import process_case_logic
+
+    case = load_case("mumbai_case.json")
+    case["debug"] = True
+    response = process_case_logic(case, system_state)
+
+    stages = response["debug"]["timings"]["stages_ms"]
+    for stage in ["rules_query", "llm", "specialist_agents", "rl_decision", "report_compile", "geometry", "report_write"]:
+        assert stage in stages, f"Stage '{stage}' was not timed."
+
+    output_path = os.path.join("outputs", "projects", TEST_PROJECT_ID, f"{case['case_id']}_report.json")
+    with open(output_path, 'r') as f:
+        assert "debug" not in json.load(f)
+
+# Test that the streaming pipeline sends the deterministic results before the LLM text
+def test_stream_sends_facts_before_tokens(system_state):
+    """
+    Streams a case with a fake chat model that emits several chunks, and checks
+    the event order and that the saved report holds the joined analysis.
+    """
+    from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+    from langchain_core.messages import AIMessage
+    from main_pipeline import stream_case_logic
+
+    class StreamingState:
+        mcp_client = system_state.mcp_client
+        rl_agent = system_state.rl_agent
+        rl_agent_version = 0
+        llm = GenericFakeChatModel(messages=iter([AIMessage(content="### Report\nThe plot is eligible for a bonus.")]))
+
+    case = load_case("mumbai_case.json")
+    events = list(stream_case_logic(case, StreamingState()))
+    names = [name for name, _ in events]
+
+    assert names[0] == "deterministic" and names[-1] == "report"
+    assert names.count("token") > 1, "The analysis was not streamed in pieces."
+    assert events[0][1]["rl_decision"]["optimal_action"] == events[-1][1]["rl_decision"]["optimal_action"]
+
+    analysis = "".join(data for name, data in events if name == "token")
+    assert analysis == "### Report\nThe plot is eligible for a bonus."
+    output_path = os.path.join("outputs", "projects", TEST_PROJECT_ID, f"{case['case_id']}_report.json")
+    with open(output_path, 'r') as f:
+        assert json.load(f)["entitlements"]["analysis_summary"] == analysis
+
+# Test that the deterministic and deferred modes skip the LLM
+def test_modes_without_llm(system_state, tmp_path):
+    """
+    Runs a case in deterministic mode with an LLM that fails if called, then in
+    deferred mode through the API, which must answer without the narrative and
+    queue a full run of the same case.
+    """
+    from fastapi.testclient import TestClient
+    from langchain_core.runnables import RunnableLambda
+    import main
+    from job_queue import JobQueue
+    from main_pipeline import process_case_logic
+
+    def no_llm(prompt):
+        raise AssertionError("The LLM must not be called in this mode.")
+
+    class NoLLMState:
+        mcp_client = system_state.mcp_client
+        rl_agent = system_state.rl_agent
+        rl_agent_version = 0
+        llm = RunnableLambda(no_llm)
+
+    # A case with no saved report yet, so each mode's report is saved
+    case = {**load_case("mumbai_case.json"), "case_id": "mumbai_no_llm"}
+    report = process_case_logic({**case, "mode": "deterministic"}, NoLLMState())
+    assert report["entitlements"]["analysis_status"] == "skipped"
+    assert report["entitlements"]["analysis_summary"] is None
+    assert report["entitlements"]["rules_from_db"], "The deterministic results are missing."
+
+    saved = (main.state.mcp_client, main.state.llm, main.state.rl_agent, main.state.job_queue, main.state.is_initialized)
+    queue = JobQueue(str(tmp_path / "jobs.sqlite"))
+    main.state.mcp_client, main.state.llm, main.state.rl_agent = NoLLMState.mcp_client, NoLLMState.llm, NoLLMState.rl_agent
+    main.state.job_queue, main.state.is_initialized = queue, True
+    try:
+        client = TestClient(main.app)
+        response = client.post("/run_case", json={**case, "document": "test", "mode": "deferred"})
+        assert response.status_code == 200, response.text
+        body = response.json()
+        assert body["entitlements"]["analysis_status"] == "pending"
+
+        job = queue.get(body["narrative_job"]["job_id"])
+        assert job["status"] == "queued" and job["priority"] == main.NARRATIVE_JOB_PRIORITY
+        _, queued_case = queue.claim()
+        assert queued_case["mode"] == "full" and queued_case["case_id"] == case["case_id"]
+
+        saved_report = client.get(body["narrative_job"]["report_url"]).json()
+        assert saved_report["entitlements"]["analysis_status"] == "pending"
+    finally:
+        queue.close()
+        main.state.mcp_client, main.state.llm, main.state.rl_agent, main.state.job_queue, main.state.is_initialized = saved
+
+# Test that a deterministic re-check keeps a saved LLM analysis
+def test_deterministic_run_keeps_full_report(system_state):
+    """
+    Runs a case in full mode, then in deterministic mode: the second run answers
+    with fresh facts but must not overwrite the saved report and its narrative.
+    """
+    from main_pipeline import process_case_logic, get_recent_geometry
+    import storage
+
+    case = {**load_case("pune_case.json"), "case_id": "pune_recheck"}
+    full = process_case_logic(case, system_state)
+    assert full["entitlements"]["analysis_status"] == "complete"
+
+    recheck = process_case_logic({**case, "mode": "deterministic"}, system_state)
+    assert recheck["entitlements"]["analysis_status"] == "skipped"
+    assert recheck["saved"] is False
+    assert recheck["rl_decision"] == full["rl_decision"]
+
+    saved = storage.load_report(TEST_PROJECT_ID, case["case_id"])
+    assert saved["entitlements"]["analysis_status"] == "complete"
+    assert saved["entitlements"]["analysis_summary"] == full["entitlements"]["analysis_summary"]
+    assert "saved" not in saved
+    # The case's geometry still belongs to the saved report
+    assert get_recent_geometry(TEST_PROJECT_ID, case["case_id"]) == saved["geometry_key"]
+
+# Test that a deterministic run of new inputs replaces the full report of the old ones
+def test_deterministic_run_of_new_inputs_is_saved(system_state):
+    """
+    Runs a case in full mode, then in deterministic mode with a larger plot: the
+    old narrative describes other inputs, so the new report, its STL file and
+    its geometry replace the old ones.
+    """
+    from main_pipeline import process_case_logic, get_recent_geometry, geometry_store
+    import storage
 
+    case = {**load_case("pune_case.json"), "case_id": "pune_new_inputs"}
+    full = process_case_logic(case, system_state)
 
-#### **Step 3: Run Your Tests**
+    bigger = {**case, "mode": "deterministic",
+              "parameters": {**case["parameters"], "plot_size": case["parameters"]["plot_size"] * 3}}
+    recheck = process_case_logic(bigger, system_state)
+    assert "saved" not in recheck
+    assert recheck["geometry_key"] != full["geometry_key"]
 
+    saved = storage.load_report(TEST_PROJECT_ID, case["case_id"])
+    assert saved["inputs"] == bigger["parameters"]
+    assert saved["entitlements"]["analysis_status"] == "skipped"
+    assert get_recent_geometry(TEST_PROJECT_ID, case["case_id"]) == recheck["geometry_key"]
+    stl_path = os.path.join("outputs", "projects", TEST_PROJECT_ID, f"{case['case_id']}_geometry.stl")
+    with open(stl_path, "rb") as f:
+        assert f.read() == geometry_store.get_bytes(recheck["geometry_key"])
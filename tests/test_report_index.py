@@ -0,0 +1,106 @@
+import unittest
+import sys
+import os
+import json
+import shutil
+import tempfile
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from report_index import ReportIndex
+
+
+def make_report(case_id, action=2, project_id="proj_test"):
+    return {
+        "project_id": project_id, "case_id": case_id, "city": "Mumbai",
+        "inputs": {"plot_size": 1200, "location": "urban", "road_width": 15},
+        "entitlements": {"analysis_summary": "# A long report", "total_fsi": 2.5, "carpet_area_sqm": 2400.0},
+        "rl_decision": {"optimal_action": action, "confidence_score": 0.9, "policy_version": 0},
+        "geometry_key": "ab" * 32,
+    }
+
+
+class TestReportIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.index = ReportIndex(os.path.join(self.workdir, "index.sqlite"), projects_dir=self.workdir)
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.workdir)
+
+    def test_listing_pagination_and_projection(self):
+        """
+        Tests that saved reports are listed newest first, paginated, projected, and bump the revision.
+        """
+        print("\nRunning test for report index listings...")
+        for i in range(5):
+            self.index.add(make_report(f"case_{i}"), created_at=f"2025-01-0{i + 1}T00:00:00Z")
+        self.index.add(make_report("case_0", action=4), created_at="2025-01-01T00:00:00Z")
+
+        self.assertEqual(self.index.count("proj_test"), 5)
+        self.assertEqual(self.index.revision("proj_test"), 6)
+        page = self.index.list_cases("proj_test", limit=2, offset=1, fields=["case_id", "total_fsi"])
+        self.assertEqual(page, [{"case_id": "case_3", "total_fsi": 2.5}, {"case_id": "case_2", "total_fsi": 2.5}])
+
+        full = self.index.list_cases("proj_test")[-1]
+        self.assertEqual(full["case_id"], "case_0")
+        self.assertEqual(full["optimal_action"], 4)
+        self.assertEqual(full["inputs"]["road_width"], 15)
+        self.assertNotIn("analysis_summary", json.dumps(full))
+        with self.assertRaises(ValueError):
+            self.index.list_cases("proj_test", fields=["analysis_summary"])
+        print("✅ Listings are ordered, paginated and projected.")
+
+    def test_backfill_existing_reports(self):
+        """
+        Tests that a project saved before the index existed is indexed once, from its report files.
+        """
+        print("\nRunning test for report index backfill...")
+        project_dir = os.path.join(self.workdir, "proj_old")
+        os.makedirs(project_dir)
+        for case_id in ("old_1", "old_2"):
+            with open(os.path.join(project_dir, f"{case_id}_report.json"), "w") as f:
+                json.dump(make_report(case_id, project_id="proj_old"), f)
+
+        self.assertEqual(self.index.backfill_project("proj_old"), 2)
+        self.assertEqual(self.index.backfill_project("proj_old"), 0)
+        self.assertEqual(self.index.count("proj_old"), 2)
+        print("✅ Existing reports were indexed once.")
+
+    def test_endpoint_etag(self):
+        """
+        Tests that /projects/{project_id}/cases answers 304 to a matching If-None-Match until a report is added.
+        """
+        print("\nRunning test for the project cases endpoint...")
+        from fastapi.testclient import TestClient
+        import main
+        import main_pipeline
+
+        real_index, main_pipeline.report_index = main_pipeline.report_index, self.index
+        try:
+            self.index.add(make_report("case_a"))
+            client = TestClient(main.app)
+            response = client.get("/projects/proj_test/cases", params={"fields": "case_id,optimal_action"})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), [{"case_id": "case_a", "optimal_action": 2}])
+            self.assertEqual(response.headers["X-Total-Count"], "1")
+
+            etag = response.headers["ETag"]
+            cached = client.get("/projects/proj_test/cases", params={"fields": "case_id,optimal_action"},
+                                headers={"If-None-Match": etag})
+            self.assertEqual(cached.status_code, 304)
+
+            self.index.add(make_report("case_b"))
+            changed = client.get("/projects/proj_test/cases", params={"fields": "case_id,optimal_action"},
+                                 headers={"If-None-Match": etag})
+            self.assertEqual(changed.status_code, 200)
+            self.assertEqual(len(changed.json()), 2)
+            self.assertEqual(client.get("/projects/proj_test/cases", params={"fields": "nope"}).status_code, 400)
+        finally:
+            main_pipeline.report_index = real_index
+        print("✅ ETags are honoured and change with new reports.")
+
+if __name__ == '__main__':
+    unittest.main()
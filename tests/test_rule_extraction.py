@@ -0,0 +1,205 @@
+import unittest
+import sys
+import os
+import importlib.util
+import json
+import shutil
+import tempfile
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+from rule_schema import EXTRA_ENTITLEMENTS, ExtractedRule, ExtractionParseError, llm_response_schema, parse_rules_json, validate_rules
+from extract_rules_ai import RuleExtractionAgent, process_page
+
+VALID_RULE = {
+    "id": "PUN-FSI-001", "rule_type": "FSI",
+    "conditions": {"road_width_m": {"min": "9", "max": 18}, "location_type": ["Urban"]},
+    "entitlements": {"total_fsi": 1.1, "parking": "as per table 8"},
+    "notes": "FSI on 9m-18m roads.",
+}
+
+
+def fake_agent(answers):
+    """An agent whose LLM returns the given answers in turn (the last one repeats)."""
+    calls = []
+
+    def answer(prompt):
+        calls.append(prompt)
+        return AIMessage(content=answers[min(len(calls), len(answers)) - 1])
+
+    return RuleExtractionAgent(llm=RunnableLambda(answer)), calls
+
+def make_page(page_number, text="FSI shall be 1.1 on roads between 9 m and 18 m. "):
+    return {"page_number": page_number, "point_numbers": [], "content": text * 10}
+
+
+class TestRuleExtraction(unittest.TestCase):
+
+    def test_schema_validates_ranges_and_types(self):
+        """
+        Tests that valid rules are normalised and invalid ones are rejected one by one with their errors.
+        """
+        print("\nRunning test for the rule schema...")
+        inverted = {**VALID_RULE, "id": "PUN-FSI-002", "conditions": {"road_width_m": {"min": 27, "max": 18}}}
+        not_a_range = {**VALID_RULE, "id": "PUN-FSI-003", "conditions": {"plot_area_sqm": 500}}
+        bad_fsi = {**VALID_RULE, "id": "PUN-FSI-004", "entitlements": {"total_fsi": "high"}}
+        dated = {**VALID_RULE, "id": "PUN-OLD-001", "conditions": {"building_existence_date": {"max": "1969-09-30"}}}
+
+        rules, rejected = validate_rules([VALID_RULE, inverted, not_a_range, bad_fsi, dated, "text"], "Pune")
+        self.assertEqual([rule["id"] for rule in rules], ["PUN-FSI-001", "PUN-OLD-001"])
+        self.assertEqual(rules[0]["city"], "Pune")
+        self.assertEqual(rules[0]["conditions"]["road_width_m"], {"min": 9.0, "max": 18.0})
+        self.assertEqual(len(rejected), 4)
+        self.assertIn("min 27.0 is greater than max 18.0", rejected[0]["errors"][0])
+        self.assertIn("plot_area_sqm must be a {min, max} range", rejected[1]["errors"][0])
+        self.assertIn("total_fsi must be a number", rejected[2]["errors"][0])
+        print("✅ Valid rules pass, invalid ones are rejected individually.")
+
+    def test_parse_rules_json(self):
+        """
+        Tests that bare and fenced JSON lists parse, and anything else raises with the raw answer kept.
+        """
+        print("\nRunning test for parsing LLM answers...")
+        self.assertEqual(parse_rules_json("[]"), [])
+        self.assertEqual(parse_rules_json('```json\n[{"id": "a"}]\n```'), [{"id": "a"}])
+        self.assertEqual(parse_rules_json('{"rules": [{"id": "a"}]}'), [{"id": "a"}])
+        for answer in ('Here are the rules: [{"id": "a"}', '{"id": "a"}', ""):
+            with self.assertRaises(ExtractionParseError) as failure:
+                parse_rules_json(answer)
+            self.assertEqual(failure.exception.raw, answer)
+        print("✅ Only JSON lists are accepted.")
+
+    def test_llm_response_schema(self):
+        """
+        Tests that the decoding schema covers every rule field, gives every object its properties, and
+        that an answer shaped by it passes validation.
+        """
+        print("\nRunning test for the LLM response schema...")
+        schema = llm_response_schema()
+        self.assertEqual(schema["type"], "array")
+        rule = schema["items"]
+        self.assertEqual(set(rule["properties"]), set(ExtractedRule.model_fields) | {EXTRA_ENTITLEMENTS})
+        self.assertEqual(rule["required"], ["id", "city", "rule_type", "conditions", "entitlements"])
+
+        def objects(node):
+            if node.get("type") == "object":
+                yield node
+            children = list(node.get("properties", {}).values()) + ([node["items"]] if "items" in node else [])
+            for child in children:
+                yield from objects(child)
+        # Gemini rejects objects without properties, and keywords outside its OpenAPI subset
+        for node in objects(schema):
+            self.assertTrue(node["properties"])
+        for keyword in ('"additionalProperties"', '"title"', '"$ref"'):
+            self.assertNotIn(keyword, json.dumps(schema))
+
+        answer = [{"id": "PUN-FSI-001", "city": "Pune", "rule_type": "FSI",
+                   "conditions": {"road_width_m": {"min": 9, "max": 18}, "location_type": ["Urban"]},
+                   "entitlements": {"total_fsi": 1.1}, "notes": "FSI on 9m-18m roads.",
+                   EXTRA_ENTITLEMENTS: [{"name": "ground_coverage_percentage", "value": 40},
+                                        {"name": "total_fsi", "value": 2.0}]}]
+        rules, rejected = validate_rules(answer, "Pune")
+        self.assertEqual((len(rules), rejected), (1, []))
+        # Other entitlements are merged back; a named key wins over the same key repeated as an extra
+        self.assertEqual(rules[0]["entitlements"], {"total_fsi": 1.1, "ground_coverage_percentage": 40})
+        print("✅ The response schema matches the rule model.")
+
+    def test_installed_gemini_client_accepts_the_response_schema(self):
+        """
+        Tests that the installed ChatGoogleGenerativeAI takes the schema as passed, and keeps the
+        keys of conditions and entitlements optional when it converts it for the API.
+        """
+        print("\nRunning test for the schema in the Gemini client...")
+        try:
+            import langchain_google_genai  # noqa: F401
+        except ImportError:
+            self.skipTest("langchain-google-genai is not installed")
+        from unittest import mock
+        from langchain_core.messages import HumanMessage
+        import extract_rules_ai
+
+        with mock.patch.dict(os.environ, {"GEMINI_API_KEY": "test"}):
+            llm = extract_rules_ai.build_extraction_llm()
+            request = llm._prepare_request([HumanMessage("Extract the rules.")])
+        rule = request.generation_config.response_schema.items
+        self.assertEqual(list(rule.required), ["id", "city", "rule_type", "conditions", "entitlements"])
+        conditions, entitlements = rule.properties["conditions"], rule.properties["entitlements"]
+        self.assertEqual((list(conditions.required), list(entitlements.required)), ([], []))
+        self.assertEqual(list(conditions.properties["road_width_m"].required), [])
+        self.assertIn("total_fsi", entitlements.properties)
+        self.assertEqual(list(rule.properties[EXTRA_ENTITLEMENTS].items.required), ["name", "value"])
+        print("✅ The installed client accepts the response schema.")
+
+    def test_process_page_retries_and_records_failures(self):
+        """
+        Tests that an unparseable answer is retried, and recorded on the page when every attempt fails.
+        """
+        print("\nRunning test for per-page retries...")
+        agent, calls = fake_agent(["not json", json.dumps([VALID_RULE])])
+        result = process_page(make_page(3), "Pune", agent, max_attempts=2)
+        self.assertEqual((len(calls), result["error"]), (2, None))
+        self.assertEqual([rule["id"] for rule in result["rules"]], ["PUN-FSI-001"])
+
+        agent, calls = fake_agent(["Sorry, I cannot help with that."])
+        result = process_page(make_page(4), "Pune", agent, max_attempts=2)
+        self.assertEqual(len(calls), 2)
+        self.assertTrue(result["error"].startswith("parse_error"))
+        self.assertEqual(result["raw"], "Sorry, I cannot help with that.")
+
+        # Short pages never reach the LLM
+        agent, calls = fake_agent(["[]"])
+        self.assertEqual(process_page(make_page(5, text="x"), "Pune", agent)["rules"], [])
+        self.assertEqual(calls, [])
+        print("✅ Failed pages are retried and recorded.")
+
+    @unittest.skipUnless(importlib.util.find_spec("tqdm"), "tqdm is not installed")
+    def test_pipeline_retries_only_failed_pages(self):
+        """
+        Tests that a run records its failed pages and that --retry-failed sends only those to the LLM again.
+        """
+        print("\nRunning test for retrying failed pages...")
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+        from database_setup import Base
+        from mcp_client import MCPClient
+        from extract_rules_ai import run_extraction_pipeline
+
+        workdir = tempfile.mkdtemp()
+        engine = create_engine(f"sqlite:///{os.path.join(workdir, 'rules.db')}")
+        Base.metadata.create_all(bind=engine)
+        client = MCPClient(session_factory=sessionmaker(bind=engine))
+        rulebook = os.path.join(workdir, "pune_rules.json")
+        with open(rulebook, "w") as f:
+            json.dump([make_page(1, "Page one: FSI on 9 m to 18 m roads. "),
+                       make_page(2, "Page two: setbacks for 500 sqm plots. ")], f)
+        failures_file = os.path.join(workdir, "failures.json")
+
+        def flaky(prompt):
+            if "Page two" in prompt.to_string():
+                return AIMessage(content="[{\"id\": \"PUN-1\", truncated")
+            return AIMessage(content=json.dumps([VALID_RULE]))
+
+        try:
+            run_extraction_pipeline(rulebook, "Pune", agent=RuleExtractionAgent(llm=RunnableLambda(flaky)),
+                                    client=client, failures_file=failures_file, workers=2)
+            self.assertEqual(client.rule_set_version("Pune"), 1)
+            with open(failures_file) as f:
+                self.assertEqual([page["page_number"] for page in json.load(f)["pages"]], [2])
+
+            agent, calls = fake_agent([json.dumps([{**VALID_RULE, "id": "PUN-FSI-009"}])])
+            run_extraction_pipeline(rulebook, "Pune", retry_failed=True, agent=agent,
+                                    client=client, failures_file=failures_file)
+            self.assertEqual(len(calls), 1)
+            self.assertIn("Page two", calls[0].to_string())
+            self.assertFalse(os.path.exists(failures_file))
+            self.assertEqual(sorted(rule["id"] for rule in client.get_rules("Pune")), ["PUN-FSI-001", "PUN-FSI-009"])
+        finally:
+            client.close()
+            engine.dispose()
+            shutil.rmtree(workdir)
+        print("✅ Only the failed page was retried.")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import unittest
+import sys
+import os
+import gzip
+import json
+import shutil
+import tempfile
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from database_setup import Base, Rule
+from mcp_client import MCPClient
+
+
+def make_rule(rule_id, city="Pune", rule_type="FSI", fsi=1.1):
+    return {"id": rule_id, "city": city, "rule_type": rule_type,
+            "conditions": {"road_width_m": {"min": 0, "max": 100}},
+            "entitlements": {"total_fsi": fsi}, "notes": "x" * 600}
+
+
+class TestRulesCache(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.engine = create_engine(f"sqlite:///{os.path.join(self.workdir, 'rules.db')}")
+        # Only the rules table, like a database created before rule set versioning
+        Base.metadata.create_all(bind=self.engine, tables=[Rule.__table__])
+        self.client = MCPClient(session_factory=sessionmaker(bind=self.engine))
+
+    def tearDown(self):
+        self.client.close()
+        self.engine.dispose()
+        shutil.rmtree(self.workdir)
+
+    def test_versions_bump_on_writes(self):
+        """
+        Tests that every write through the MCP Client bumps the city's rule set version and refreshes the cache.
+        """
+        print("\nRunning test for rule set versions...")
+        self.assertEqual(self.client.rule_set_version("Pune"), 0)
+        self.assertEqual(self.client.upsert_rules([make_rule("P-1"), make_rule("P-2", rule_type="Setback")]), (2, 0))
+        self.assertEqual(self.client.rule_set_version("pune"), 1)
+
+        first = self.client.get_rules_snapshot("Pune")
+        self.assertIs(self.client.get_rules_snapshot("PUNE"), first)
+        self.assertEqual(self.client.get_rules_snapshot("Pune", rule_type="setback")["count"], 1)
+        self.assertEqual((self.client.hits, self.client.misses), (1, 2))
+
+        self.assertFalse(self.client.add_rule(make_rule("P-1")))
+        self.assertEqual(self.client.rule_set_version("Pune"), 1)
+        self.assertEqual(self.client.upsert_rules([make_rule("P-1", fsi=2.0)]), (0, 1))
+        self.assertEqual(self.client.rule_set_version("Pune"), 2)
+
+        second = self.client.get_rules_snapshot("Pune")
+        self.assertNotEqual(second["etag"], first["etag"])
+        fsi_values = [rule["entitlements"]["total_fsi"] for rule in json.loads(second["body"])]
+        self.assertIn(2.0, fsi_values)
+        self.assertEqual(gzip.decompress(second["gzip_body"]), second["body"])
+        print("✅ Versions bump on writes and the cache follows them.")
+
+    def test_get_rules_endpoint(self):
+        """
+        Tests ETag/304, gzip and rule_type filtering on /get_rules.
+        """
+        print("\nRunning test for the /get_rules endpoint...")
+        from fastapi.testclient import TestClient
+        import main
+
+        self.client.upsert_rules([make_rule("P-1"), make_rule("P-2", rule_type="Setback")])
+        previous = (main.state.mcp_client, main.state.is_initialized)
+        main.state.mcp_client, main.state.is_initialized = self.client, True
+        try:
+            api = TestClient(main.app)
+            response = api.get("/get_rules", params={"city": "Pune"}, headers={"Accept-Encoding": "gzip"})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.headers["Content-Encoding"], "gzip")
+            self.assertEqual(response.headers["X-Rule-Set-Version"], "1")
+            self.assertEqual(len(response.json()), 2)
+
+            etag = response.headers["ETag"]
+            self.assertEqual(api.get("/get_rules", params={"city": "Pune"}, headers={"If-None-Match": etag}).status_code, 304)
+
+            filtered = api.get("/get_rules", params={"city": "Pune", "rule_type": "Setback"})
+            self.assertEqual([rule["id"] for rule in filtered.json()], ["P-2"])
+
+            self.client.upsert_rules([make_rule("P-3")])
+            changed = api.get("/get_rules", params={"city": "Pune"}, headers={"If-None-Match": etag})
+            self.assertEqual((changed.status_code, len(changed.json())), (200, 3))
+        finally:
+            main.state.mcp_client, main.state.is_initialized = previous
+        print("✅ /get_rules revalidates, compresses and filters.")
+
+    def test_warm_rules_caches(self):
+        """
+        Tests that the preload builds every city's snapshot and sweep agent, and that both follow rule writes.
+        """
+        print("\nRunning test for warming the rules caches...")
+        import main
+
+        # The cache is module-wide; keep this test's agents out of the others
+        self.addCleanup(main.sweep_agents.clear)
+        self.client.upsert_rules([make_rule("P-1"), make_rule("M-1", city="Mumbai", fsi=2.5)])
+        self.assertEqual(self.client.cities(), ["Mumbai", "Pune"])
+        main.warm_rules_caches(self.client)
+        self.assertEqual((self.client.hits, self.client.misses), (0, 0))
+
+        self.client.get_rules_snapshot("Mumbai")
+        self.client.get_rules_snapshot("pune")
+        self.assertEqual((self.client.hits, self.client.misses), (2, 0))
+
+        agent = main.get_sweep_agent(self.client, "PUNE")
+        self.assertIs(main.get_sweep_agent(self.client, "Pune"), agent)
+        self.client.upsert_rules([make_rule("P-1", fsi=3.0)])
+        refreshed = main.get_sweep_agent(self.client, "Pune")
+        self.assertIsNot(refreshed, agent)
+        self.assertEqual(refreshed.rules[0]["entitlements"]["total_fsi"], 3.0)
+        self.assertEqual([key for key in main.sweep_agents if key[0] == "pune"], [("pune", 2)])
+        print("✅ The rules caches are warmed for every city and follow writes.")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+import sys
+import os
+import tempfile
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from agents.semantic_cache import SemanticCache, CachedRetrievalChain, index_version
+
+
+class FakeEmbeddings:
+    """Bag-of-words embeddings, so that questions sharing words are similar."""
+    VOCAB = ["open", "space", "spaces", "building", "buildings", "requirements", "around", "fsi", "road", "height"]
+
+    def embed_query(self, text):
+        words = text.lower().replace("?", "").split()
+        return [float(words.count(w)) for w in self.VOCAB]
+
+
+class FakeChain:
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, inputs):
+        self.calls += 1
+        return {"input": inputs["input"], "answer": f"answer {self.calls}", "context": ["doc"]}
+
+
+class TestSemanticCache(unittest.TestCase):
+
+    def setUp(self):
+        self.index_dir = tempfile.mkdtemp()
+        with open(os.path.join(self.index_dir, "index.faiss"), "w") as f:
+            f.write("v1")
+
+    def test_near_duplicate_question_is_served_from_cache(self):
+        print("\nRunning test for SemanticCache hits...")
+        chain = FakeChain()
+        cached_chain = CachedRetrievalChain(chain, SemanticCache(FakeEmbeddings(), similarity_threshold=0.7), "Mumbai", self.index_dir)
+
+        first = cached_chain.invoke({"input": "open space requirements around a building"})
+        second = cached_chain.invoke({"input": "open space requirements around buildings"})
+        third = cached_chain.invoke({"input": "road fsi height"})
+
+        self.assertFalse(first["cache_hit"])
+        self.assertTrue(second["cache_hit"])
+        self.assertEqual(second["answer"], first["answer"])
+        self.assertFalse(third["cache_hit"])
+        self.assertEqual(chain.calls, 2)
+        print("SemanticCache hit test passed. ✅")
+
+    def test_index_change_invalidates_entries(self):
+        print("\nRunning test for SemanticCache invalidation...")
+        chain = FakeChain()
+        cached_chain = CachedRetrievalChain(chain, SemanticCache(FakeEmbeddings()), "Mumbai", self.index_dir)
+        old_version = index_version(self.index_dir)
+
+        cached_chain.invoke({"input": "open space around a building"})
+        with open(os.path.join(self.index_dir, "index.faiss"), "w") as f:
+            f.write("rebuilt index")
+        self.assertNotEqual(index_version(self.index_dir), old_version)
+
+        response = cached_chain.invoke({"input": "open space around a building"})
+        self.assertFalse(response["cache_hit"])
+        self.assertEqual(chain.calls, 2)
+        print("SemanticCache invalidation test passed. ✅")
+
+    def test_eviction_is_size_bounded(self):
+        print("\nRunning test for SemanticCache eviction...")
+        cache = SemanticCache(FakeEmbeddings(), max_entries=2)
+        for question in ["open", "road", "height"]:
+            cache.store("Mumbai", "v1", question, cache.embed(question), {"answer": question, "context": []})
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.lookup("Mumbai", "v1", cache.embed("open")))
+        self.assertEqual(cache.lookup("Mumbai", "v1", cache.embed("height"))["answer"], "height")
+        print("SemanticCache eviction test passed. ✅")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,182 @@
+import unittest
+import sys
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import tempfile
+import time
+
+import requests
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+SERVE_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'serve.py'))
+
+TEST_APP = '''
+import os
+from fastapi import FastAPI
+
+app = FastAPI()
+shared = {"loaded_by": None}
+
+def preload_shared_state():
+    shared["loaded_by"] = os.getpid()
+
+@app.get("/whoami")
+def whoami():
+    return {"pid": os.getpid(), "loaded_by": shared["loaded_by"]}
+'''
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def child_pids(pid):
+    children = []
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    # The parent pid is the second field after the parenthesised command name
+                    if int(f.read().rsplit(")", 1)[1].split()[1]) == pid:
+                        children.append(int(entry))
+            except (OSError, IndexError):
+                pass
+    return children
+
+
+class TestServe(unittest.TestCase):
+
+    def test_health_endpoints(self):
+        """
+        Tests that /health/ready is 503 until the worker is initialized, while /health/live always answers.
+        """
+        print("\nRunning test for the health endpoints...")
+        from fastapi.testclient import TestClient
+        import main
+
+        previous = main.state.is_initialized
+        try:
+            client = TestClient(main.app)
+            main.state.is_initialized = False
+            self.assertEqual(client.get("/health/live").json()["pid"], os.getpid())
+            self.assertEqual(client.get("/health/ready").status_code, 503)
+            main.state.is_initialized = True
+            self.assertEqual(client.get("/health/ready").json()["status"], "ready")
+        finally:
+            main.state.is_initialized = previous
+        print("✅ Readiness follows initialization.")
+
+    def test_rl_agent_reload(self):
+        """
+        Tests that /rl_agent/reload swaps the policy in a single process, and that a serve.py
+        worker forwards it to the master instead of reloading only itself.
+        """
+        print("\nRunning test for the RL agent reload endpoint...")
+        import numpy as np
+        from fastapi.testclient import TestClient
+        import main
+        from rl_env.distilled_policy import DistilledPolicy
+
+        workdir = tempfile.mkdtemp()
+        policy_path = os.path.join(workdir, "distilled.npz")
+        DistilledPolicy(np.full((2, 3, 2, 5), 0.2), (0, 1000, 2), (0, 10, 2), metadata={"source_version": 7}).save(policy_path)
+        # Stands in for the serve.py master: exits 0 on SIGHUP
+        master = subprocess.Popen([sys.executable, "-c", (
+            "import signal, sys, time\n"
+            "signal.signal(signal.SIGHUP, lambda *_: sys.exit(0))\n"
+            "print('ready', flush=True)\n"
+            "time.sleep(30)\n"
+        )], stdout=subprocess.PIPE, text=True)
+        master.stdout.readline()
+
+        saved = (main.state.rl_agent, main.state.rl_agent_version, main.state.master_pid, main.state.is_initialized)
+        environ = {key: os.environ.get(key) for key in ("RL_POLICY", "RL_DISTILLED_PATH")}
+        os.environ.update(RL_POLICY="distilled", RL_DISTILLED_PATH=policy_path)
+        try:
+            client = TestClient(main.app)
+            main.state.rl_agent, main.state.rl_agent_version, main.state.is_initialized = None, 0, True
+            self.assertEqual(client.post("/rl_agent/reload").json(),
+                             {"status": "reloaded", "previous_version": 0, "version": 7})
+            self.assertIsInstance(main.state.rl_agent, DistilledPolicy)
+            self.assertEqual(client.post("/rl_agent/reload").json()["status"], "unchanged")
+
+            main.state.master_pid = master.pid
+            self.assertEqual(client.post("/rl_agent/reload").json()["status"], "reloading")
+            self.assertEqual(master.wait(timeout=10), 0)
+        finally:
+            main.state.rl_agent, main.state.rl_agent_version, main.state.master_pid, main.state.is_initialized = saved
+            for key, value in environ.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+            if master.poll() is None:
+                master.kill()
+            master.wait()
+            shutil.rmtree(workdir)
+        print("✅ Reloads swap the policy, or go to the master under serve.py.")
+
+    @unittest.skipUnless(sys.platform.startswith("linux"), "uses fork and /proc")
+    def test_prefork_workers(self):
+        """
+        Tests that serve.py preloads in the master, forks the workers, replaces a dead one, reloads them all on
+        SIGHUP and stops on SIGTERM.
+        """
+        print("\nRunning test for the pre-forking server...")
+        workdir = tempfile.mkdtemp()
+        with open(os.path.join(workdir, "serve_test_app.py"), "w") as f:
+            f.write(TEST_APP)
+        port = free_port()
+        master = subprocess.Popen(
+            [sys.executable, SERVE_PATH, "--app", "serve_test_app:app", "--workers", "2",
+             "--host", "127.0.0.1", "--port", str(port), "--no-access-log"],
+            cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        url = f"http://127.0.0.1:{port}/whoami"
+
+        def wait_for_workers(count, gone=()):
+            deadline = time.monotonic() + 20
+            while time.monotonic() < deadline:
+                workers = child_pids(master.pid)
+                if len(workers) == count and not set(gone) & set(workers):
+                    try:
+                        return workers, requests.get(url, timeout=2).json()
+                    except requests.ConnectionError:
+                        pass
+                time.sleep(0.1)
+            self.fail(f"Expected {count} workers")
+
+        try:
+            workers, answer = wait_for_workers(2)
+            self.assertIn(answer["pid"], workers)
+            # Loaded once in the master, before the fork
+            self.assertEqual(answer["loaded_by"], master.pid)
+
+            os.kill(workers[0], signal.SIGKILL)
+            replaced, _ = wait_for_workers(2, gone=[workers[0]])
+            self.assertIn(workers[1], replaced)
+
+            # A reload preloads again and replaces every worker
+            master.send_signal(signal.SIGHUP)
+            reloaded, answer = wait_for_workers(2, gone=replaced)
+            self.assertEqual(answer["loaded_by"], master.pid)
+            replaced = reloaded
+
+            master.send_signal(signal.SIGTERM)
+            self.assertEqual(master.wait(timeout=15), 0)
+            # The master waits for its workers before exiting
+            self.assertFalse(any(os.path.exists(f"/proc/{pid}") for pid in replaced))
+        finally:
+            if master.poll() is None:
+                master.kill()
+                master.wait()
+            shutil.rmtree(workdir)
+        print("✅ Workers share the preloaded state and are supervised.")
+
+if __name__ == '__main__':
+    unittest.main()
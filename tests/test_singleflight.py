@@ -0,0 +1,156 @@
+import unittest
+import sys
+import os
+import multiprocessing
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from singleflight import FileLocks, SingleFlight, case_key
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def test_concurrent_calls_share_one_run(self):
+        """
+        Tests that concurrent calls with the same key run the function once and all get its result.
+        """
+        print("\nRunning test for single-flight coalescing...")
+        flights = SingleFlight()
+        runs = []
+        started = threading.Event()
+
+        def slow_case():
+            runs.append(1)
+            started.set()
+            time.sleep(0.2)
+            return {"case_id": "c1"}
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            leader = executor.submit(flights.do, "key", slow_case)
+            started.wait()
+            followers = [executor.submit(flights.do, "key", slow_case) for _ in range(7)]
+            results = [leader.result()] + [f.result() for f in followers]
+
+        self.assertEqual(len(runs), 1)
+        self.assertEqual(results[0], ({"case_id": "c1"}, False))
+        self.assertTrue(all(result == ({"case_id": "c1"}, True) for result in results[1:]))
+        self.assertEqual(flights.in_flight(), 0)
+
+        # Once finished, nothing is cached: the next call runs again
+        flights.do("key", slow_case)
+        self.assertEqual(len(runs), 2)
+        print("✅ Eight concurrent calls ran the function once.")
+
+    def test_errors_reach_every_caller(self):
+        """
+        Tests that an exception in the shared run is raised to the followers too.
+        """
+        print("\nRunning test for single-flight errors...")
+        flights = SingleFlight()
+        started = threading.Event()
+
+        def failing():
+            started.set()
+            time.sleep(0.1)
+            raise RuntimeError("LLM unavailable")
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            leader = executor.submit(flights.do, "key", failing)
+            started.wait()
+            follower = executor.submit(flights.do, "key", failing)
+            for future in (leader, follower):
+                with self.assertRaises(RuntimeError):
+                    future.result()
+        print("✅ The error reached both callers.")
+
+    def test_case_key_ignores_key_order(self):
+        """
+        Tests that cases differing only in key order get the same key.
+        """
+        print("\nRunning test for case keys...")
+        a = {"project_id": "p", "case_id": "c", "parameters": {"plot_size": 1, "road_width": 2}}
+        b = {"parameters": {"road_width": 2, "plot_size": 1}, "case_id": "c", "project_id": "p"}
+        self.assertEqual(case_key(a), case_key(b))
+        self.assertNotEqual(case_key(a), case_key({**a, "case_id": "d"}))
+        print("✅ Equal cases share a key.")
+
+    def test_file_locks_across_processes(self):
+        """
+        Tests that a second process waits for the key's lock, and learns that it waited.
+        """
+        print("\nRunning test for cross-process case locks...")
+        lock_dir = tempfile.mkdtemp()
+        locks = FileLocks(lock_dir)
+        ctx = multiprocessing.get_context("fork")
+        held, release = ctx.Event(), ctx.Event()
+
+        def holder():
+            with locks.hold("key"):
+                held.set()
+                release.wait(5)
+
+        process = ctx.Process(target=holder)
+        process.start()
+        try:
+            held.wait(5)
+            # Another key on a different lock file is not blocked
+            other = next(k for k in (f"other-{i}" for i in range(100)) if locks.path_for(k) != locks.path_for("key"))
+            with locks.hold(other) as waited_since:
+                self.assertIsNone(waited_since)
+
+            threading.Timer(0.2, release.set).start()
+            started = time.time()
+            with locks.hold("key") as waited_since:
+                self.assertIsNotNone(waited_since)
+                self.assertGreaterEqual(time.time() - started, 0.15)
+        finally:
+            process.join(5)
+            shutil.rmtree(lock_dir)
+        print("✅ The second process waited for the first one's lock.")
+
+    def test_case_run_in_another_worker_is_reused(self):
+        """
+        Tests that a case whose lock is held by another worker reuses the report that worker
+        saves, instead of running the pipeline (and the LLM) again.
+        """
+        print("\nRunning test for coalescing across workers...")
+        import main
+        import storage
+
+        workdir = tempfile.mkdtemp()
+        case = {"project_id": "test_singleflight", "case_id": "c1", "city": "Pune", "mode": "full",
+                "parameters": {"plot_size": 1500, "location": "urban", "road_width": 20}}
+        report = {"project_id": "test_singleflight", "case_id": "c1", "city": "Pune", "inputs": case["parameters"],
+                  "entitlements": {"analysis_summary": "### Report", "analysis_status": "complete"}}
+        ctx = multiprocessing.get_context("fork")
+        held = ctx.Event()
+        previous, main.case_locks = main.case_locks, FileLocks(os.path.join(workdir, "locks"))
+
+        def other_worker():
+            with main.case_locks.hold(case_key(case)):
+                held.set()
+                time.sleep(0.3)
+                storage.save_report(report)
+
+        process = ctx.Process(target=other_worker)
+        process.start()
+        try:
+            held.wait(5)
+            # main.state has no pipeline components: running the case here would fail
+            before = main.COALESCED_CASES.value()
+            self.assertEqual(main.run_case_coalesced(case), report)
+            self.assertEqual(main.COALESCED_CASES.value(), before + 1)
+        finally:
+            process.join(5)
+            main.case_locks = previous
+            shutil.rmtree(workdir)
+            shutil.rmtree(os.path.join(storage.PROJECTS_DIR, "test_singleflight"), ignore_errors=True)
+        print("✅ The report of the other worker's run was reused.")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import unittest
+import sys
+import os
+import json
+import shutil
+import tempfile
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'rl_env')))
+
+import storage
+from storage import BlobStore, RulebookStore
+from complex_env import feedback_to_case
+
+
+def make_report(case_id="c1", action=2):
+    return {"project_id": "proj", "case_id": case_id, "city": "Pune",
+            "inputs": {"plot_size": 900, "location": "rural", "road_width": 15},
+            "entitlements": {"total_fsi": 1.1, "analysis_summary": "x" * 2000},
+            "rl_decision": {"optimal_action": action, "confidence_score": 0.9, "policy_version": 1}}
+
+
+class TestStorage(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def test_reports_round_trip(self):
+        """
+        Tests that reports are written compactly, optionally compressed, and that a case keeps one file.
+        """
+        print("\nRunning test for report storage...")
+        report = make_report()
+        plain = storage.save_report(report, compressed=False, projects_dir=self.workdir)
+        self.assertNotIn(b"\n", open(plain, "rb").read())
+        self.assertEqual(storage.load_report("proj", "c1", projects_dir=self.workdir), report)
+
+        compressed = storage.save_report(report, compressed=True, projects_dir=self.workdir)
+        self.assertTrue(compressed.endswith("_report.json.zst"))
+        self.assertFalse(os.path.exists(plain))
+        self.assertLess(os.path.getsize(compressed), len(storage.dumps(report)) / 4)
+        self.assertEqual(storage.load_report("proj", "c1", projects_dir=self.workdir), report)
+        self.assertIsNone(storage.load_report("proj", "missing", projects_dir=self.workdir))
+        print("✅ Reports round-trip, compressed or not.")
+
+    def test_feedback_stores_reports_by_reference(self):
+        """
+        Tests that feedback lines refer to a shared report blob and still convert to training cases.
+        """
+        print("\nRunning test for compact feedback...")
+        blobs = BlobStore(os.path.join(self.workdir, "blobs"))
+        feedback_path = os.path.join(self.workdir, "feedback.jsonl")
+        report = make_report()
+        feedback = {"project_id": "proj", "case_id": "c1", "user_feedback": "up",
+                    "input_case": {"case_id": "c1", "city": "Pune", "parameters": report["inputs"]},
+                    "output_report": report}
+        first = storage.append_feedback(feedback, path=feedback_path, blobs=blobs)
+        storage.append_feedback({**feedback, "user_feedback": "down"}, path=feedback_path, blobs=blobs)
+
+        with open(feedback_path) as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual(len(lines), 2)
+        self.assertNotIn("output", lines[0])
+        self.assertEqual(lines[0]["output_ref"], lines[1]["output_ref"])
+        self.assertEqual(len(os.listdir(os.path.dirname(blobs.path(first["output_ref"])))), 1)
+        self.assertEqual(storage.feedback_report(lines[0], blobs), report)
+        self.assertEqual(feedback_to_case(lines[1])["action_taken"], 2)
+        print("✅ Two feedback lines share one stored report.")
+
+    def test_compact_feedback_file(self):
+        """
+        Tests that an old feedback file with embedded reports is rewritten by reference, keeping
+        bad and blank lines so line numbers (fine-tuning offsets) do not move.
+        """
+        print("\nRunning test for feedback migration...")
+        blobs = BlobStore(os.path.join(self.workdir, "blobs"))
+        feedback_path = os.path.join(self.workdir, "feedback.jsonl")
+        inputs = {"parameters": {"plot_size": 900, "location": "rural", "road_width": 15}}
+        with open(feedback_path, "w") as f:
+            f.write("\n")
+            f.write(json.dumps({"input": inputs, "user_feedback": "up", "output": make_report(action=3)}) + "\n")
+            f.write(json.dumps({"input": inputs, "user_feedback": "down", "output": {"rl_optimal_action": 4}}) + "\n")
+            f.write("not json\n")
+
+        count, before, after = storage.compact_feedback_file(feedback_path, blobs)
+        self.assertEqual(count, 4)
+        self.assertLess(after, before)
+        with open(feedback_path) as f:
+            lines = f.read().splitlines()
+        self.assertEqual((lines[0], lines[3]), ("", "not json"))
+        self.assertEqual([feedback_to_case(json.loads(line))["action_taken"] for line in lines[1:3]], [3, 4])
+        print("✅ Old feedback lines are migrated.")
+
+    def test_rulebooks_are_deduplicated(self):
+        """
+        Tests that identical rulebooks under different names are stored once and load by their old paths.
+        """
+        print("\nRunning test for rulebook deduplication...")
+        pages = [{"page_number": 1, "point_numbers": ["(1)"], "content": "FSI shall be 1.0 " * 50}]
+        paths = []
+        for name in ("mumbai_rules.json", "temp_rules.json"):
+            paths.append(os.path.join(self.workdir, name))
+            with open(paths[-1], "w") as f:
+                json.dump(pages, f, indent=4)
+
+        store = RulebookStore(self.workdir)
+        imported = store.import_files(paths, remove=True)
+        self.assertEqual(len(set(imported.values())), 1)
+        self.assertFalse(any(os.path.exists(path) for path in paths))
+        self.assertEqual(storage.load_rulebook(paths[1]), pages)
+
+        storage.save_rulebook(os.path.join(self.workdir, "pune_rules.json"), pages[:0])
+        self.assertEqual(len(set(store.manifest().values())), 2)
+        with self.assertRaises(FileNotFoundError):
+            storage.load_rulebook(os.path.join(self.workdir, "nashik_rules.json"))
+        print("✅ Identical rulebooks are stored once.")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+import sys
+import os
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from timing import Histogram, Timer, stage_snapshot, reset_stage_histograms
+
+
+class TestTiming(unittest.TestCase):
+
+    def setUp(self):
+        reset_stage_histograms()
+
+    def test_timer_records_laps_and_spans(self):
+        """
+        Tests that laps time consecutive sections, spans time blocks, and both feed the stage histograms.
+        """
+        print("\nRunning test for Timer laps and spans...")
+        timer = Timer()
+        time.sleep(0.01)
+        timer.lap("first")
+        with timer.span("nested"):
+            time.sleep(0.005)
+        timer.lap("second")
+        timings = timer.finish()
+
+        self.assertGreaterEqual(timings["stages_ms"]["first"], 10)
+        self.assertGreaterEqual(timings["stages_ms"]["nested"], 5)
+        # The second lap covers everything since the first, including the span
+        self.assertGreaterEqual(timings["stages_ms"]["second"], timings["stages_ms"]["nested"])
+        self.assertGreaterEqual(timings["total_ms"], timings["stages_ms"]["first"] + timings["stages_ms"]["second"])
+
+        snapshot = stage_snapshot()
+        self.assertEqual(set(snapshot), {"first", "nested", "second", "total"})
+        self.assertEqual(snapshot["first"]["count"], 1)
+        print(f"✅ Recorded stages: {timings['stages_ms']}")
+
+    def test_histogram_percentiles(self):
+        """
+        Tests the bucketed percentile estimates against a known distribution.
+        """
+        print("\nRunning test for Histogram percentiles...")
+        histogram = Histogram(buckets_ms=[10, 20, 30, 40, 50, 60, 70, 80, 90, 100])
+        for value in range(1, 101):
+            histogram.observe(value)
+
+        snapshot = histogram.snapshot()
+        self.assertEqual(snapshot["count"], 100)
+        self.assertAlmostEqual(snapshot["mean_ms"], 50.5)
+        self.assertAlmostEqual(snapshot["p50_ms"], 50, delta=1)
+        self.assertAlmostEqual(snapshot["p99_ms"], 99, delta=1)
+        self.assertEqual(snapshot["max_ms"], 100)
+        print(f"✅ p50={snapshot['p50_ms']} p95={snapshot['p95_ms']} p99={snapshot['p99_ms']}")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List
+
+# Histogram bucket upper bounds in milliseconds (the last bucket is unbounded)
+DEFAULT_BUCKETS_MS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000]
+
+class Histogram:
+    """
+    A thread-safe, fixed-bucket latency histogram. Memory use is constant no
+    matter how many samples are recorded; percentiles are estimated by linear
+    interpolation inside the bucket that contains them.
+    """
+    def __init__(self, buckets_ms: List[float] = DEFAULT_BUCKETS_MS):
+        self.buckets_ms = list(buckets_ms)
+        self.counts = [0] * (len(self.buckets_ms) + 1)
+        self.count = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value_ms: float):
+        index = next((i for i, bound in enumerate(self.buckets_ms) if value_ms <= bound), len(self.buckets_ms))
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum_ms += value_ms
+            self.max_ms = max(self.max_ms, value_ms)
+
+    def percentile(self, q: float) -> float:
+        with self._lock:
+            counts, total, max_ms = list(self.counts), self.count, self.max_ms
+        if total == 0:
+            return 0.0
+        rank = q / 100 * total
+        seen = 0
+        for i, count in enumerate(counts):
+            if count and seen + count >= rank:
+                lower = self.buckets_ms[i - 1] if i > 0 else 0.0
+                upper = self.buckets_ms[i] if i < len(self.buckets_ms) else max_ms
+                return min(lower + (upper - lower) * (rank - seen) / count, max_ms)
+            seen += count
+        return max_ms
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            count, sum_ms, max_ms = self.count, self.sum_ms, self.max_ms
+            buckets = dict(zip([str(b) for b in self.buckets_ms] + ["+Inf"], self.counts))
+        return {
+            "count": count,
+            "sum_ms": round(sum_ms, 3),
+            "mean_ms": round(sum_ms / count, 3) if count else 0.0,
+            "p50_ms": round(self.percentile(50), 3),
+            "p95_ms": round(self.percentile(95), 3),
+            "p99_ms": round(self.percentile(99), 3),
+            "max_ms": round(max_ms, 3),
+            "buckets": buckets,
+        }
+
+# --- In-process histograms, one per stage name ---
+_stage_histograms: Dict[str, Histogram] = {}
+_registry_lock = threading.Lock()
+
+def stage_histogram(stage: str) -> Histogram:
+    with _registry_lock:
+        if stage not in _stage_histograms:
+            _stage_histograms[stage] = Histogram()
+        return _stage_histograms[stage]
+
+def stage_snapshot() -> Dict[str, dict]:
+    """Summaries of every stage histogram recorded so far in this process."""
+    with _registry_lock:
+        histograms = dict(_stage_histograms)
+    return {stage: histogram.snapshot() for stage, histogram in histograms.items()}
+
+def reset_stage_histograms():
+    with _registry_lock:
+        _stage_histograms.clear()
+
+class Timer:
+    """
+    Collects the stage durations of one request, either as spans or as laps
+    (the time since the previous lap, for code that runs as consecutive sections):
+
+        timer = Timer()
+        with timer.span("rules_query"):
+            ...
+        ...
+        timer.lap("llm")
+        timer.stages  # {"rules_query": 3.2, "llm": 812.5}
+
+    Every stage is also added to the process-wide histogram of its name.
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._last_lap = self.started
+        self.stages: Dict[str, float] = {}
+
+    def _record(self, stage: str, elapsed_ms: float):
+        # A stage recorded more than once in a request accumulates
+        self.stages[stage] = round(self.stages.get(stage, 0.0) + elapsed_ms, 3)
+        stage_histogram(stage).observe(elapsed_ms)
+
+    def lap(self, stage: str):
+        now = time.perf_counter()
+        self._record(stage, (now - self._last_lap) * 1000)
+        self._last_lap = now
+
+    @contextmanager
+    def span(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(stage, (time.perf_counter() - start) * 1000)
+
+    def total_ms(self) -> float:
+        return round((time.perf_counter() - self.started) * 1000, 3)
+
+    def as_dict(self) -> dict:
+        return {"stages_ms": dict(self.stages), "total_ms": self.total_ms()}
+
+    def finish(self) -> dict:
+        """Records the request's total time in the "total" histogram and returns all timings."""
+        timings = self.as_dict()
+        stage_histogram("total").observe(timings["total_ms"])
+        return timings